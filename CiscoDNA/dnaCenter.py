@@ -13,17 +13,85 @@ or implied.
 """
 
 from . import dnaConfig
+from . import healthChart
+from . import timeParser
+from . import softwareCatalog
+from . import inventoryStore
+import processLocal
+import os
 import requests
 import json
 import time
-import matplotlib.pyplot as plt
-import numpy as np
-import csv
 import logging
-import dateparser
 import re
 import base64
-from collections import defaultdict
+import hashlib
+import threading
+import gzip
+import zipfile
+import codecs
+import tempfile
+import contextlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# orjson parses large responses several times faster than the json module.  It is optional: if it is not installed,
+# the json module is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loadJson(data):
+    """
+    Parse a JSON document with the fastest available backend
+
+    :param data:
+        JSON document (bytes or str)
+    :return:
+        The decoded document.  Raises ValueError if it is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def command(phrases, section, usage, modifiers=(), args=False):
+    """
+    Decorator which registers a dnaCenter method as a chat command.  Registered commands are compiled into
+    the command trie used by parseTeamsMessage, and the help message is generated from the same registry.
+
+    The decorated method is called with the modifier (text following the command) and the 'refresh' flag.
+
+    :param phrases:
+        Tuple of phrases (lowercase) which invoke the command
+    :param section:
+        Help message section the command is listed in
+    :param usage:
+        List of (usage, description) tuples for the help message.  Use *...* around placeholders.
+    :param modifiers:
+        Keywords which may follow the command phrase, e.g. 'for' in 'show software images for <platform>'.
+        The text after the keyword is passed to the method as the modifier.
+    :param args:
+        True if any text may follow the command phrase (passed to the method as the modifier)
+    :return:
+        Decorator function
+    """
+    def register(func):
+        func.command = {
+            'phrases': phrases,
+            'section': section,
+            'usage': usage,
+            'modifiers': modifiers,
+            'args': args,
+            'handler': func.__name__
+        }
+        return func
+
+    return register
 
 
 class dnaCenter:
@@ -36,7 +104,69 @@ class dnaCenter:
     # Define global URLs for interacting with Webex Teams API here
     baseurl = "https://{0}:{1}".format(dnaConfig.dna_host, dnaConfig.dna_port)
 
-    def __init__(self, logname=__name__, tmp=dnaConfig.tmpdir):
+    # Sections of the help message in display order, with notes displayed after the section's commands
+    helpSections = [
+        ('ASSURANCE', [
+            "*Examples:*",
+            "*show network health at 06:21* will show health from today at 06:21",
+            "*show network health on Jan 1 at 18:00* will show health from January 1st at 18:00",
+            "All times and dates are local to the timezone where this script is being executed.",
+            "Recent results are cached for a short time.  Add ***refresh*** at the end of a command "
+            "(e.g. *show network health refresh*) to get the latest data."
+        ]),
+        ('INVENTORY', []),
+        ('SOFTWARE IMAGES', [])
+    ]
+
+    # Datasets which may be pre-fetched in the background (see apiScheduler) and served from a snapshot.  Each is
+    # (URL, additional headers) of the API call returning the dataset, or the name of a method yielding its pages.
+    datasets = {
+        'networkhealth': ("/dna/intent/api/v1/network-health", {'__runsync': 'true'}),
+        'pnpstatus': "getPnpPages",
+        'softwareimages': ("/dna/intent/api/v1/image/importation", {}),
+        'softwareccoimages': ("/dna/intent/api/v1/image/importation?isCCORecommended=true", {})
+    }
+
+    # Software image catalog for this process, loaded on first use and refreshed when stale
+    catalogLock = threading.Lock()
+    imageCatalog = softwareCatalog.softwareCatalog(ttl=dnaConfig.dna_image_catalog_ttl)
+
+    # Optional pool of chart rendering processes for this process, started on first use
+    renderLock = threading.Lock()
+    chartRenderer = None
+
+    # Local inventory store for this process, opened on first use, and the thread synchronizing it in the background
+    # (at most one per process; see 'startInventorySync')
+    storeLock = threading.Lock()
+    deviceStore = None
+    syncThread = None
+
+    # Chat command registry, built once per process from the methods decorated with @command.  'commandTrie' is a
+    # word trie of the command phrases; the '' key of a node holds the command ending at that node.
+    commandLock = threading.Lock()
+    commands = None
+    commandTrie = None
+
+    # The auth token is shared by every instance in this worker process and is only refreshed when it is about
+    # to expire (or is rejected by Cisco DNA Center).  The lock collapses concurrent refreshes into a single call.
+    tokenLock = threading.Lock()
+    tokenExpires = 0
+
+    # Keep-alive connection pools, one per controller base URL, shared by every instance in this worker process
+    # (see processLocal, so each forked uWSGI worker opens its own sockets)
+    sessionLock = threading.Lock()
+    sessions = processLocal.processLocal(dict)
+
+    # Identical GET requests in flight in this worker process.  Concurrent callers of the same request wait for the
+    # first one and share its result (see 'urlget').
+    flightLock = threading.Lock()
+    flights = dict()
+    flightCounters = {
+        'upstream': 0,
+        'coalesced': 0
+    }
+
+    def __init__(self, logname=__name__, tmp=dnaConfig.tmpdir, chartcache=None, healthcache=None, snapshots=None):
         """
         Class initialization.
 
@@ -46,6 +176,42 @@ class dnaCenter:
             Name of the calling logger.  If not given, use the package name
         :param tmp:
             Directory for storing temporary files.  If not given, use value from config file.
+        :param chartcache:
+            Optional cache object (with get/set methods) used to reuse the PNG bytes of identical health charts
+        :param healthcache:
+            Optional cache object (with get/set methods) used to reuse network health API responses
+        :param snapshots:
+            Optional snapshot store (with a get method, see apiCache.snapshotStore) holding pre-fetched 'datasets'
+        """
+
+        # If the logger name was passed, append this package's name to it.  Otherwise, create a new logger with
+        # only the package name.  The caller's name is kept for the loggers of the helper objects.
+        self.logname = logname
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        # Now do some init stuff:
+        # - Obtain an auth token from Cisco DNA Center (or reuse the cached one) and add the x-auth-token header
+        # - Set the tmp folder for file attachments
+        if self.getAuthToken() == False:
+            self.logger.error("Error setting the auth token", exc_info=True)
+            raise RuntimeError("There was a problem setting the authentication token.")
+        self.tmpfolder = tmp
+        self.chartCache = chartcache
+        self.healthCache = healthcache
+        self.snapshots = snapshots
+
+    def getAuthToken(self, stale=None):
+        """
+        Make sure a valid auth token is set in the x-auth-token header.  A cached token is reused until it is
+        within 'dna_token_refresh' seconds of its expiry.  If 'stale' is given, the token was rejected by
+        Cisco DNA Center and must be replaced - unless another thread already replaced it.
+
+        :param stale:
+            Token value rejected by Cisco DNA Center, if any
+        :return:
+            True if a valid token is set, False otherwise
         """
 
         def generateAuthString(username, password):
@@ -68,27 +234,49 @@ class dnaCenter:
 
             return strAuth
 
-        # If the logger name was passed, append this package's name to it.  Otherwise, create a new logger with
-        # only the package name
-        if logname != __name__:
-            logname = "{0}.{1}".format(logname, __name__)
-        self.logger = logging.getLogger(logname)
+        retval = False
 
-        # Now do some init stuff:
-        # - Obtain an auth token from Cisco DNA Center and add the x-auth-token header
-        # - Set the tmp folder for file attachments
-        url = "/dna/system/api/v1/auth/token".format(self.baseurl)
+        with self.tokenLock:
+            token = self.globalHeaders.get('x-auth-token')
 
-        strAuth = generateAuthString(dnaConfig.dna_username, dnaConfig.dna_password)
-        authhead = {'Authorization': 'Basic %s' % strAuth}
+            if stale is None and token is not None \
+                    and time.time() < dnaCenter.tokenExpires - dnaConfig.dna_token_refresh:
+                # Cached token is still valid
+                retval = True
+            elif stale is not None and token is not None and token != stale:
+                # Another thread already refreshed the rejected token
+                retval = True
+            else:
+                self.logger.debug("getAuthToken: Requesting a new auth token")
+                url = "/dna/system/api/v1/auth/token"
 
-        r = self.urlpost(url, data=None, addHeaders=authhead)
-        if r != False:
-            self.globalHeaders['x-auth-token'] = r.get("Token")
-        else:
-            self.logger.error("Error setting the auth token", exc_info=True)
-            raise RuntimeError("There was a problem setting the authentication token.")
-        self.tmpfolder = tmp
+                strAuth = generateAuthString(dnaConfig.dna_username, dnaConfig.dna_password)
+                authhead = {'Authorization': 'Basic %s' % strAuth}
+
+                r = self.urlpost(url, data=None, addHeaders=authhead, reauth=False)
+                if r != False and r.get("Token") is not None:
+                    self.globalHeaders['x-auth-token'] = r.get("Token")
+                    dnaCenter.tokenExpires = time.time() + dnaConfig.dna_token_lifetime
+                    retval = True
+                else:
+                    self.globalHeaders.pop('x-auth-token', None)
+                    dnaCenter.tokenExpires = 0
+
+        return retval
+
+    @classmethod
+    def preload(cls):
+        """
+        Import and warm up the heavy dependencies which are otherwise loaded on first use (dateparser and its
+        language data, matplotlib and its fonts).  Intended to run once in the uWSGI master process so that forked
+        workers share the loaded modules copy-on-write.
+
+        :return:
+            None
+        """
+        import dateparser
+        dateparser.parse("1 january 2019 18:00", languages=dnaConfig.dna_date_languages)
+        healthChart.preload()
 
     def __enter__(self):
         """
@@ -106,159 +294,335 @@ class dnaCenter:
     """
     def getHelpMessage(self):
         """
-        Define the help message to display is an invalid command is entered (or 'help')
+        Define the help message to display is an invalid command is entered (or 'help').  The message is
+        generated from the usage registered by each command (see the 'command' decorator) and 'helpSections'.
 
         :return:
             Text and rich-text strings to be sent to the requestor which describes available commands
         """
+        helpMsg = ["Try one of the following commands:", ""]
+        helpMsgRich = ["Try one of the following commands:"]
 
-        helpMsgRich = """
-Try one of the following commands:
+        commands = self.getCommands()
 
-***ASSURANCE:***
+        for section, notes in self.helpSections:
+            helpMsg.append("{}:".format(section))
+            helpMsgRich.append("***{}:***".format(section))
 
-**show network health** Send an image displaying the current network health status
+            for cmd in commands:
+                if cmd['section'] == section:
+                    for usage, description in cmd['usage']:
+                        helpMsg.append("{0} {1}".format(usage, description).replace("*", ""))
+                        helpMsgRich.append("**{0}** {1}".format(usage, description))
 
-**show network health at *date/time*** Shows network health status for given date or time.  Most formats accepted
+            for note in notes:
+                helpMsg.append(note.replace("*", ""))
+                helpMsgRich.append(note)
+            helpMsg.append("")
 
-*Examples:*
+        return self.generateApiResponse('message', "\n".join(helpMsg), richmessage="\n\n".join(helpMsgRich))
 
-*show network health at 06:21* will show health from today at 06:21
+    """
+    END Help context
+    /******************************************************************************************************************
+    """
 
-*show network health on Jan 1 at 18:00* will show health from January 1st at 18:00
+    """
+    /******************************************************************************************************************
+    BEGIN Webex Teams Integration functions
+    """
 
-All times and dates are local to the timezone where this script is being executed.
+    @classmethod
+    def getCommands(cls):
+        """
+        Build the chat command registry and trie on first use.  Commands are collected from the methods
+        decorated with @command, in the order they are defined.
 
-***INVENTORY***
+        :return:
+            List of registered commands
+        """
+        with cls.commandLock:
+            if cls.commands is None:
+                methods = dict()
+                commands = list()
+                trie = dict()
+
+                # Walk the class hierarchy so subclasses may add (or override) commands
+                for klass in reversed(cls.__mro__):
+                    methods.update(vars(klass))
+
+                for attr in methods.values():
+                    cmd = getattr(attr, 'command', None)
+                    if cmd is None:
+                        continue
+                    commands.append(cmd)
+                    for phrase in cmd['phrases']:
+                        node = trie
+                        for word in phrase.split():
+                            node = node.setdefault(word, dict())
+                        node[''] = cmd
+
+                cls.commandTrie = trie
+                cls.commands = commands
+
+        return cls.commands
 
-**get inventory** Attach a CSV file with the network inventory
+    def parseTeamsMessage(self, msgdata):
+        """
+        Given the message from Webex Teams, parse it and determine which command (function) to run
+        If no matching command is found, send back the help message
 
-**show pnp status** to include Show device PnP status
+        The longest registered command phrase at the start of the message is found by walking the command trie
+        one word at a time.  Text following the phrase must start with one of the command's modifier keywords
+        (e.g. 'show software images for <platform>') unless the command accepts any arguments.
 
-***SOFTWARE IMAGES***
+        :param msgdata:
+            Message received by Webex Teams bot
+        :return:
+            API Response (returned by the called function and generated by generateApiResponse())
+        """
+        modifier = ""
+        cmds = msgdata.lower()
 
-**show software images** List available software images
+        # The 'refresh' keyword may be added at the end of any command to bypass cached data.  Only a trailing,
+        # standalone word is the keyword - 'refresh' elsewhere may be part of an argument (e.g. a hostname).
+        words = cmds.split()
+        refresh = words[-1:] == ["refresh"]
+        if refresh:
+            words = words[:-1]
+
+        self.getCommands()
+        node = self.commandTrie
+        cmd = None
+        length = 0
+
+        for num, word in enumerate(words):
+            node = node.get(word)
+            if node is None:
+                break
+            if '' in node:
+                cmd = node['']
+                length = num + 1
+
+        rest = words[length:]
+        if cmd is not None and rest != []:
+            if rest[0] in cmd['modifiers']:
+                modifier = " ".join(rest[1:])
+            elif cmd['args']:
+                modifier = " ".join(rest)
+            else:
+                cmd = None
 
-**show software platforms** Show available platforms for software images
+        if cmd is not None:
+            self.logger.debug("parseTeamsMessage: Command %s, modifier '%s'", cmd['handler'], modifier)
+            retval = getattr(self, cmd['handler'])(modifier, refresh)
+        else:
+            retval = self.getHelpMessage()
 
-**show software images for *platform*** Show images available for *platform*
+        return retval
 
-**show software recommended image for *platform*:** Show recommended CCO images for *platform*
+    @command(("show network health",), "ASSURANCE",
+             usage=[("show network health", "Send an image displaying the current network health status"),
+                    ("show network health at *date/time*",
+                     "Shows network health status for given date or time.  Most formats accepted")],
+             modifiers=("at", "on", "from"))
+    def commandNetworkHealth(self, modifier, refresh):
+        """
+        Chat command: show the network health image, for the current time or the time given as the modifier
 
-**show software cco image for *platform*:** Shorter command to show recommended CCO images for *platform*
+        :param modifier:
+            Date / time of the health data.  May be empty.
+        :param refresh:
+            Bypass cached data
+        :return:
+            Dictionary API Response
         """
+        if modifier != "":
+            # Get health image for a specific date / time.  The timeParser helps convert various
+            # time format strings to a datetime object which can be used to convert to epoch time
+            # If an invalid date is entered, healthtime will be None.
+            healthtime = timeParser.parseTime(modifier)
+            self.logger.debug("The parsed time for the message is: %s", healthtime)
+            # Ensure we have a valid time.  Convert to msecs from epoch if it's valid
+            if healthtime != None:
+                healthtime = int(round(time.mktime(healthtime.timetuple()))) * 1000
+                retval = self.getNetworkHealthImage(timestamp=healthtime, refresh=refresh)
+            else:
+                errmsg = "Error getting network health: invalid time entered!"
+                errmsgrich = "Error getting network health: ***invalid time entered!***"
+                self.logger.error(errmsg, exc_info=True)
+                retval = self.generateApiResponse('error', errmsg, richmessage=errmsgrich)
+        else:
+            # No modifier - just get the current health status image
+            retval = self.getNetworkHealthImage(refresh=refresh)
 
-        helpMsg = """
-Try one of the following commands:
+        return retval
 
-ASSURANCE:
+    @command(("get inventory",), "INVENTORY",
+             usage=[("get inventory", "Attach a CSV file with the network inventory"),
+                    ("get inventory fields *field1,field2* gzip",
+                     "Only include the given fields in the inventory.  Add *gzip* or *zip* to compress the file")],
+             args=True)
+    def commandNetworkInventory(self, modifier, refresh):
+        """
+        Chat command: generate a CSV file containing the network inventory.  Optional arguments are a list of fields
+        (with or without the 'fields' keyword) and the compression to use (gzip, zip or csv for none)
 
-show network health Send an image displaying the current network health status
-show network health at *date/time Shows network health status for given date or time.  Most formats accepted
+        :param modifier:
+            Optional arguments
+        :param refresh:
+            Bypass cached data
+        :return:
+            Dictionary API Response
+        """
+        fields = list()
+        compression = dnaConfig.dna_inventory_compression
+        for arg in modifier.replace(",", " ").split():
+            if arg in ("gzip", "zip", "csv"):
+                compression = arg
+            elif arg != "fields":
+                fields.append(arg)
+
+        return self.getNetworkInventory(fields=fields, compression=compression)
+
+    @command(("show pnp status",), "INVENTORY",
+             usage=[("show pnp status", "Show device PnP status"),
+                    ("show pnp status *state*",
+                     "Only show devices in *state* (unclaimed, planned, onboarding, provisioned or error)")],
+             args=True)
+    def commandPnpStatus(self, modifier, refresh):
+        """
+        Chat command: show device PnP status, optionally only for the state given as the modifier
 
-Examples:
-show network health at 06:21 will show health from today at 06:21
-show network health on Jan 1 at 18:00 will show health from January 1st at 18:00
+        :param modifier:
+            PnP state.  May be empty.
+        :param refresh:
+            Bypass cached data
+        :return:
+            Dictionary API Response
+        """
+        return self.getPnpStatus(state=modifier, refresh=refresh)
 
-All times and dates are local to the timezone where this script is being executed.
+    @command(("show device ip", "show device address"), "INVENTORY",
+             usage=[("show device ip *address*", "Show the device with management IP address *address*")],
+             modifiers=("address",), args=True)
+    def commandDeviceByIp(self, modifier, refresh):
+        """
+        Chat command: look up a device by management IP address in the local inventory store
 
+        :param modifier:
+            IP address
+        :param refresh:
+            Synchronize the inventory store before the lookup
+        :return:
+            Dictionary API Response
+        """
+        return self.getDevice('managementIpAddress', modifier, refresh=refresh)
 
-INVENTORY
-get inventory Attach a CSV file with the network inventory
-"show pnp status Show device PnP status"
-SOFTWARE IMAGES
-show software images List available software images
-show software platforms Show available platforms for software images
-show software images for platform Show images available for platform
-show software recommended image for platform: Show recommended CCO images for platform
-show software cco image for platform: Shorter command to show recommended CCO images for platform
+    @command(("show device mac",), "INVENTORY",
+             usage=[("show device mac *address*", "Show the device with MAC address *address*")],
+             modifiers=("address",), args=True)
+    def commandDeviceByMac(self, modifier, refresh):
         """
+        Chat command: look up a device by MAC address in the local inventory store
 
-        return self.generateApiResponse('message', helpMsg, richmessage=helpMsgRich)
+        :param modifier:
+            MAC address in any common format (aa:bb:cc:dd:ee:ff, aa-bb-cc-dd-ee-ff, aabb.ccdd.eeff)
+        :param refresh:
+            Synchronize the inventory store before the lookup
+        :return:
+            Dictionary API Response
+        """
+        mac = re.sub(r'[^0-9a-f]', '', modifier.lower())
+        if len(mac) == 12:
+            modifier = ":".join(mac[num:num + 2] for num in range(0, 12, 2))
 
-    """
-    END Help context
-    /******************************************************************************************************************
-    """
+        return self.getDevice('macAddress', modifier, refresh=refresh)
 
-    """
-    /******************************************************************************************************************
-    BEGIN Webex Teams Integration functions
-    """
+    @command(("show device hostname", "show device name"), "INVENTORY",
+             usage=[("show device hostname *name*", "Show the device with hostname *name*")],
+             args=True)
+    def commandDeviceByHostname(self, modifier, refresh):
+        """
+        Chat command: look up a device by hostname in the local inventory store
 
-    def parseTeamsMessage(self, msgdata):
+        :param modifier:
+            Hostname
+        :param refresh:
+            Synchronize the inventory store before the lookup
+        :return:
+            Dictionary API Response
         """
-        Given the message from Webex Teams, parse it and determine which command (function) to run
-        If no matching command is found, send back the help message
+        return self.getDevice('hostname', modifier, refresh=refresh)
 
-        :param msgdata:
-            Message received by Webex Teams bot
+    @command(("show device serial",), "INVENTORY",
+             usage=[("show device serial *number*", "Show the device with serial number *number*")],
+             modifiers=("number",), args=True)
+    def commandDeviceBySerial(self, modifier, refresh):
+        """
+        Chat command: look up a device by serial number in the local inventory store
+
+        :param modifier:
+            Serial number
+        :param refresh:
+            Synchronize the inventory store before the lookup
         :return:
-            API Response (returned by the called function and generated by generateApiResponse())
+            Dictionary API Response
         """
-        modifier = ""
-        cmds = msgdata.lower()
+        return self.getDevice('serialNumber', modifier, refresh=refresh)
 
-        # Un-pretty method of getting a command and any modifiers.  If the message (command) includes any
-        # of the keywords in the 'specifier' set, split the message into command and modifiers (NOTE: Only the
-        # first occurrence will be split)
-        # This can then be used to specify different options to functions - for example, showing a network health
-        # image for a specific date / time instead of the current time.
-        #
-        # After the split, remove trailing whitespace from the cmd and leading whitespace from the modifier
-        # There's surely a more elegant approach to this...
-        specifier = ("for", "on", "at", "from", "mac", "ip", "address")
-
-        reg = re.compile(r'(?i)\b(?:%s)\b' % '|'.join(specifier))
-        if reg.search(cmds):
-            cmds, modifier = re.split(reg, cmds, 1)
-            cmds = str(cmds).rstrip()
-            modifier = str(modifier).lstrip()
-
-        # Now start figuring out which function to call based on 'cmds'.  Some functions may accept
-        # modifiers - if so, parse accordingly
-        if cmds == "show network health":
-            if modifier != "":
-                # Get health image for a specific date / time.  The dateparser helps convert various
-                # time format strings to a datetime object which can be used to convert to epoch time
-                # If an invalid date is entered, healthtime will be None.
-                healthtime = dateparser.parse(modifier)
-                self.logger.debug("The parsed time for the message is: %s", healthtime)
-                # Ensure we have a valid time.  Convert to msecs from epoch if it's valid
-                if healthtime != None:
-                    healthtime = int(round(time.mktime(healthtime.timetuple()))) * 1000
-                    retval = self.getNetworkHealthImage(timestamp=healthtime)
-                else:
-                    errmsg = "Error getting network health: invalid time entered!"
-                    errmsgrich = "Error getting network health: ***invalid time entered!***"
-                    self.logger.error(errmsg, exc_info=True)
-                    retval = self.generateApiResponse('error', errmsg, richmessage=errmsgrich)
-            else:
-                # No modifier - just get the current health status image
-                retval = self.getNetworkHealthImage()
-        elif cmds == "get inventory":
-            # Generates a CSV file containing the network inventory
-            retval = self.getNetworkInventory()
-        elif cmds == "show pnp status":
-            retval = self.getPnpStatus()
-        elif cmds == "show software platforms" or cmds == "show software platform":
-            retval = self.getSoftwareImagePlatforms()
-        elif cmds == "show software recommended image" or cmds == "show software cco image":
-            if modifier != "":
-                retval = self.getSoftwareImages(family=modifier, cco=True)
-            else:
-                retval = self.getSoftwareImages(cco=True)
-        elif cmds == "show software image" or cmds == "show software images":
-            if modifier != "":
-                retval = self.getSoftwareImages(family=modifier)
-            else:
-                retval = self.getSoftwareImages()
-        else:
-            retval = self.getHelpMessage()
+    @command(("show software images", "show software image"), "SOFTWARE IMAGES",
+             usage=[("show software images", "List available software images"),
+                    ("show software images for *platform*", "Show images available for *platform*")],
+             modifiers=("for",))
+    def commandSoftwareImages(self, modifier, refresh):
+        """
+        Chat command: list available software images, optionally for the platform given as the modifier
 
-        return retval
+        :param modifier:
+            Platform (image family).  May be empty.
+        :param refresh:
+            Bypass cached data
+        :return:
+            Dictionary API Response
+        """
+        return self.getSoftwareImages(family=modifier, refresh=refresh)
 
-    def generateApiResponse(self, type, message, richmessage="", file=""):
+    @command(("show software platforms", "show software platform"), "SOFTWARE IMAGES",
+             usage=[("show software platforms", "Show available platforms for software images")])
+    def commandSoftwarePlatforms(self, modifier, refresh):
+        """
+        Chat command: show available platforms for software images
+
+        :param modifier:
+            Not used
+        :param refresh:
+            Bypass cached data
+        :return:
+            Dictionary API Response
+        """
+        return self.getSoftwareImagePlatforms(refresh=refresh)
+
+    @command(("show software recommended image", "show software recommended images",
+              "show software cco image", "show software cco images"), "SOFTWARE IMAGES",
+             usage=[("show software recommended image for *platform*", "Show recommended CCO images for *platform*"),
+                    ("show software cco image for *platform*",
+                     "Shorter command to show recommended CCO images for *platform*")],
+             modifiers=("for",))
+    def commandSoftwareRecommended(self, modifier, refresh):
+        """
+        Chat command: list recommended CCO images, optionally for the platform given as the modifier
+
+        :param modifier:
+            Platform (image family).  May be empty.
+        :param refresh:
+            Bypass cached data
+        :return:
+            Dictionary API Response
+        """
+        return self.getSoftwareImages(family=modifier, cco=True, refresh=refresh)
+
+    def generateApiResponse(self, type, message, richmessage="", file="", content=None, filename="", mimetype=""):
         """
         Generate a structured response to return to the apiHandler for a correct bot response
         Accepts rich text messages as well as non-formatted messages to support different clients.
@@ -282,23 +646,57 @@ show software cco image for platform: Shorter command to show recommended CCO im
         }
 
 
-        For file attachments, we need to tell the bot where the file is... so this will work - note
-        we will include the full path to the file
+        Replies too long for a single message may be split into several messages, sent in order:
+        {
+            'responseType': 'messages',
+            'data': {
+                'messages': [
+                    {'message': message, 'richmessage': richmessage},
+                    ...
+                ]
+            }
+        }
+
+        For file attachments, the file contents are returned in memory with their MIME type and the filename
+        shown in Webex Teams.  'content' is either bytes or a seekable binary file object (e.g. a
+        SpooledTemporaryFile for large exports), which the apiHandler closes once it is sent:
+        {
+            'responseType': 'file',
+            'data': {
+                'message': message,
+                'richmessage': richmessage,
+                'content': content,
+                'filename': filename,
+                'mimetype': mimetype
+            }
+        }
+
+        A file stored on disk may still be attached by giving its full path instead; the apiHandler removes it
+        once it is sent.  The MIME type is optional; if empty, the webexTeams class identifies it:
         {
             'responseType': 'file',
             'data': {
                 'message': message,
                 'richmessage': richmessage
-                'file': file
+                'file': file,
+                'mimetype': mimetype
             }
         }
 
         :param type:
             Type of response e.g. message/file
         :param message:
-            The message to be sent from the bot
+            The message to be sent from the bot.  For type 'messages', a list of messages.
+        :param richmessage:
+            Rich text (markdown) version of the message.  For type 'messages', an optional list of the same length.
         :param file:
-            For type 'file', the full path to a file attachment
+            For type 'file', the full path to a file attachment (if 'content' is not given)
+        :param content:
+            For type 'file', the contents of the attachment (bytes or binary file object)
+        :param filename:
+            For type 'file' with 'content', the name of the attachment
+        :param mimetype:
+            For type 'file', the MIME type of the attachment
         :return:
             Dictionary in format described above
         """
@@ -311,16 +709,30 @@ show software cco image for platform: Shorter command to show recommended CCO im
             responsedata = {'message': message,
                             'richmessage': richmessage
                             }
+        elif type == 'messages':
+            richmessages = richmessage if richmessage else [""] * len(message)
+            responsedata = {'messages': [{'message': msg, 'richmessage': rich}
+                                         for msg, rich in zip(message, richmessages)]
+                            }
+        elif type == 'file' and content is not None:
+            responsedata = {'message': message,
+                            'richmessage': richmessage,
+                            'content': content,
+                            'filename': filename,
+                            'mimetype': mimetype
+                            }
         elif type == 'file':
             responsedata = {'message': message,
                             'richmessage': richmessage,
-                            'file': file
+                            'file': file,
+                            'mimetype': mimetype
                             }
 
         apiResponse = {'responseType': type,
                        'data': responsedata
                        }
-        self.logger.debug("API Response from DNA Center:\n{}".format(apiResponse))
+        # Only the type and attachment name are logged: the data may hold a whole chart or export
+        self.logger.debug("API Response from DNA Center: type %s, file %s", type, filename or file or "(none)")
         return apiResponse
 
     """
@@ -333,6 +745,76 @@ show software cco image for platform: Shorter command to show recommended CCO im
     BEGIN HTTP Helper functions
     """
 
+    @classmethod
+    def getSession(cls, baseurl):
+        """
+        Return the worker-lifetime HTTP session for a Cisco DNA Center controller.  Connections are kept alive in
+        the session's pool and reused by subsequent requests (including each page of a paginated call).
+
+        :param baseurl:
+            Base URL of the controller
+        :return:
+            requests.Session object for this controller and process
+        """
+        sessions = cls.sessions.get()
+
+        with cls.sessionLock:
+            if baseurl not in sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=dnaConfig.dna_pool_size)
+                session.mount("https://", adapter)
+                sessions[baseurl] = session
+
+            return sessions[baseurl]
+
+    @classmethod
+    def getPoolStats(cls):
+        """
+        Report connection pool usage for each controller in this process
+
+        :return:
+            Dictionary keyed by host containing the number of connections opened, requests sent and idle
+            connections in the pool
+        """
+        stats = dict()
+
+        with cls.sessionLock:
+            sessions = dict(cls.sessions.peek() or dict())
+
+        for session in sessions.values():
+            adapter = session.get_adapter("https://")
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                stats["{0}:{1}".format(pool.host, pool.port)] = {
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle': pool.pool.qsize() if pool.pool is not None else 0,
+                    'maxsize': dnaConfig.dna_pool_size
+                }
+
+        return stats
+
+    def getTimeout(self, url, headers):
+        """
+        Select the (connect, read) timeout for a request based on its endpoint class.  Synchronous (__runsync)
+        calls such as network health are much slower than the other intent API calls.
+
+        :param url:
+            URL of the request
+        :param headers:
+            Headers of the request
+        :return:
+            (connect, read) timeout tuple from the config file
+        """
+        if headers.get('__runsync') == 'true':
+            timeout = dnaConfig.dna_timeouts['runsync']
+        elif url.startswith("/dna/system/api/v1/auth/"):
+            timeout = dnaConfig.dna_timeouts['auth']
+        else:
+            timeout = dnaConfig.dna_timeouts['intent']
+
+        return timeout
+
     def cleanHeaders(self, headers, addHeaders):
         """
         Take the default headers and compare to items in the additional headers
@@ -352,14 +834,77 @@ show software cco image for platform: Shorter command to show recommended CCO im
 
         return headers
 
-    def urlget(self, url, addHeaders={}):
+    def urlget(self, url, addHeaders={}, reauth=True, timeout=None):
+        """
+        Generic 'GET' method for HTTP requests.  Concurrent identical requests (same controller, URL and additional
+        headers) are coalesced: the first one is sent to Cisco DNA Center and the others wait for it and get the
+        same result.  Results may therefore be shared between callers and must not be modified.
+
+        :param url:
+            URL to perform HTTP GET
+        :param addHeaders:
+            Dictionary containing additional headers (if needed)
+        :param reauth:
+            Re-authenticate and retry once if Cisco DNA Center responds with HTTP 401
+        :param timeout:
+            (connect, read) timeout in seconds.  If not given, use the value for the endpoint class from the config
+        :return:
+            The server's response if successful, otherwise False
+        """
+        key = (self.baseurl, url, tuple(sorted(addHeaders.items())))
+
+        with self.flightLock:
+            flight = dnaCenter.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'done': threading.Event(), 'result': False}
+                dnaCenter.flights[key] = flight
+                dnaCenter.flightCounters['upstream'] += 1
+            else:
+                dnaCenter.flightCounters['coalesced'] += 1
+
+        if not leader:
+            self.logger.debug("urlget: Waiting for the identical request in flight to %s", url)
+            flight['done'].wait()
+            return flight['result']
+
+        try:
+            flight['result'] = self.fetchUrl(url, addHeaders, reauth=reauth, timeout=timeout)
+        finally:
+            with self.flightLock:
+                del dnaCenter.flights[key]
+            flight['done'].set()
+
+        return flight['result']
+
+    @classmethod
+    def getFlightStats(cls):
+        """
+        Report how many GET requests were sent to Cisco DNA Center and how many were coalesced with an identical
+        request in flight, in this process
+
+        :return:
+            Dictionary of counters
         """
-        Generic 'GET' method for HTTP requests.  Will attempt a GET request and catch exceptions.
+        with cls.flightLock:
+            stats = dict(cls.flightCounters)
+            stats['inflight'] = len(cls.flights)
+
+        return stats
+
+    def fetchUrl(self, url, addHeaders={}, reauth=True, timeout=None):
+        """
+        Send a GET request to Cisco DNA Center (see 'urlget').  Will attempt a GET request and catch exceptions.
+        If the auth token is rejected, obtain a new one and replay the request once.
 
         :param url:
             URL to perform HTTP GET
         :param addHeaders:
             Dictionary containing additional headers (if needed)
+        :param reauth:
+            Re-authenticate and retry once if Cisco DNA Center responds with HTTP 401
+        :param timeout:
+            (connect, read) timeout in seconds.  If not given, use the value for the endpoint class from the config
         :return:
             The server's response if successful, otherwise False
         """
@@ -372,35 +917,45 @@ show software cco image for platform: Shorter command to show recommended CCO im
         headers.update(addHeaders)
         headers = self.cleanHeaders(headers, addHeaders)
 
+        if timeout is None:
+            timeout = self.getTimeout(url, headers)
+        session = self.getSession(self.baseurl)
+
         url = self.baseurl + url
+        r = None
 
         try:
-            r = requests.get(url, headers=headers, verify=dnaConfig.sslverify)
-            self.logger.debug("urlget: HTTP GET sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
+            r = session.get(url, headers=headers, verify=dnaConfig.sslverify, timeout=timeout)
+            if r.status_code == 401 and reauth and self.getAuthToken(stale=headers.get('x-auth-token')):
+                self.logger.info("fetchUrl: Auth token rejected, retrying with a new token")
+                headers['x-auth-token'] = self.globalHeaders['x-auth-token']
+                r = session.get(url, headers=headers, verify=dnaConfig.sslverify, timeout=timeout)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("fetchUrl: HTTP GET sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
             r.raise_for_status()
-            retval = r.json()
         except requests.exceptions.HTTPError as errh:
-            self.logger.error("urlget: Http Error: %s", errh, exc_info=True)
+            self.logger.error("fetchUrl: Http Error: %s", errh, exc_info=True)
         except requests.exceptions.ConnectionError as errc:
-            self.logger.error("urlget: Error Connecting: %s", errc, exc_info=True)
+            self.logger.error("fetchUrl: Error Connecting: %s", errc, exc_info=True)
         except requests.exceptions.Timeout as errt:
-            self.logger.error("urlget: Timeout Error: %s", errt, exc_info=True)
+            self.logger.error("fetchUrl: Timeout Error: %s", errt, exc_info=True)
         except requests.exceptions.RequestException as err:
-            self.logger.error("urlget: Generic Request Exception: %s", err, exc_info=True)
+            self.logger.error("fetchUrl: Generic Request Exception: %s", err, exc_info=True)
 
-        try:
-            r = json.loads(r.text)
-            self.logger.debug("DNA JSON Result of GET to %s is:\n%s", url, r)
-        except json.decoder.JSONDecodeError as e:
-            self.logger.error("JSON Decode error caught: %s", e, exc_info=True)
-        else:
-            retval = r
+        # Parse the body once.  Error responses may contain a JSON error description, which is returned as well.
+        if r is not None:
+            try:
+                retval = loadJson(r.content)
+                self.logger.debug("DNA JSON Result of GET to %s is:\n%s", url, retval)
+            except ValueError as e:
+                self.logger.error("JSON Decode error caught: %s", e, exc_info=True)
 
         return retval
 
-    def urlpost(self, url, data, addHeaders={}):
+    def urlpost(self, url, data, addHeaders={}, reauth=True, timeout=None):
         """
         Generic HTTP POST wrapper which catches exceptions.
+        If the auth token is rejected, obtain a new one and replay the request once.
 
         :param url:
             URL for the HTTP POST
@@ -408,6 +963,10 @@ show software cco image for platform: Shorter command to show recommended CCO im
             What to POST
         :param addHeaders:
             Dictionary containing additional headers if needed
+        :param reauth:
+            Re-authenticate and retry once if Cisco DNA Center responds with HTTP 401
+        :param timeout:
+            (connect, read) timeout in seconds.  If not given, use the value for the endpoint class from the config
         :return:
             The server's response if successful, otherwise False
         """
@@ -420,12 +979,22 @@ show software cco image for platform: Shorter command to show recommended CCO im
         headers.update(addHeaders)
         headers = self.cleanHeaders(headers, addHeaders)
 
+        if timeout is None:
+            timeout = self.getTimeout(url, headers)
+        session = self.getSession(self.baseurl)
+
         url = self.baseurl + url
+        r = None
 
         try:
             self.logger.debug("Sending HTTP POST to %s", url)
-            r = requests.post(url, data, headers=headers, verify=dnaConfig.sslverify)
-            self.logger.debug("urlpost: HTTP POST sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
+            r = session.post(url, data, headers=headers, verify=dnaConfig.sslverify, timeout=timeout)
+            if r.status_code == 401 and reauth and self.getAuthToken(stale=headers.get('x-auth-token')):
+                self.logger.info("urlpost: Auth token rejected, retrying with a new token")
+                headers['x-auth-token'] = self.globalHeaders['x-auth-token']
+                r = session.post(url, data, headers=headers, verify=dnaConfig.sslverify, timeout=timeout)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("urlpost: HTTP POST sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
             r.raise_for_status()
             retval = r
         except requests.exceptions.HTTPError as errh:
@@ -437,13 +1006,13 @@ show software cco image for platform: Shorter command to show recommended CCO im
         except requests.exceptions.RequestException as err:
             self.logger.error("urlpost: Generic Request Exception: %s", err, exc_info=True)
 
-        try:
-            r = json.loads(r.text)
-            self.logger.debug("DNA JSON Result of GET to %s is:\n%s", url, r)
-        except json.decoder.JSONDecodeError as e:
-            self.logger.error("JSON Decode error caught: %s", e, exc_info=True)
-        else:
-            retval = r
+        # Parse the body once.  Error responses may contain a JSON error description, which is returned as well.
+        if r is not None:
+            try:
+                retval = loadJson(r.content)
+                self.logger.debug("DNA JSON Result of POST to %s is:\n%s", url, retval)
+            except ValueError as e:
+                self.logger.error("JSON Decode error caught: %s", e, exc_info=True)
 
         return retval
 
@@ -452,6 +1021,72 @@ show software cco image for platform: Shorter command to show recommended CCO im
     /******************************************************************************************************************
     """
 
+    """
+    /******************************************************************************************************************
+    BEGIN Dataset functions
+    """
+
+    def getDataset(self, name):
+        """
+        Fetch one of the 'datasets' from Cisco DNA Center.  Used by the commands when no snapshot is available and
+        by the apiScheduler to refresh the snapshots.
+
+        :param name:
+            Name of the dataset
+        :return:
+            The API response (or list of items for paginated datasets), or False if the call failed or did not
+            return usable data
+        """
+        if isinstance(self.datasets[name], str):
+            try:
+                return [item for page in getattr(self, self.datasets[name])() for item in page]
+            except RuntimeError as e:
+                self.logger.warning("getDataset: Unable to get %s: %s", name, e)
+                return False
+
+        url, headers = self.datasets[name]
+        r = self.urlget(url, headers)
+
+        if r == False:
+            self.logger.warning("getDataset: Unable to get %s", name)
+        elif isinstance(r, dict) and ('executionId' in r or 'errorResponse' in r or 'response' not in r):
+            self.logger.warning("getDataset: Unexpected response for %s:\n%s", name, r)
+            r = False
+
+        return r
+
+    def getSnapshot(self, name, refresh=False):
+        """
+        Get the current snapshot of one of the 'datasets', if a snapshot store was given
+
+        :param name:
+            Name of the dataset
+        :param refresh:
+            The requestor asked for the latest data - ignore the snapshot
+        :return:
+            Tuple of (snapshot time in epoch seconds, data), or None if no snapshot should be used
+        """
+        if self.snapshots is None or refresh:
+            return None
+
+        return self.snapshots.get(name)
+
+    def getDataAge(self, timestamp):
+        """
+        Format the 'data as of' line added to replies, so the requestor knows how current the data is
+
+        :param timestamp:
+            Time the data was obtained in epoch seconds
+        :return:
+            String
+        """
+        return "Data as of {}".format(time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(timestamp)))
+
+    """
+    END Dataset functions
+    /******************************************************************************************************************
+    """
+
     """
     /******************************************************************************************************************
     BEGIN Assurance Functions
@@ -460,25 +1095,55 @@ show software cco image for platform: Shorter command to show recommended CCO im
     def assignHealthColor(self, healthScore):
         """
         Based on a given health score, assign a color for use in graphic representations of health
-        Ranges adjusted here for consistency across visuals
+        Ranges are defined in healthChart for consistency across visuals
 
         :param healthScore:
             Score representing a healthy percentage
         :return:
             Color name as a string value
         """
-        if healthScore > 60:
-            color = 'green'
-        elif healthScore > 30:
-            color = 'goldenrod'
-        else:
-            color = 'red'
+        return healthChart.assignHealthColor(healthScore)
+
+    def getRenderPool(self):
+        """
+        Get the chart rendering process pool of this process, creating it on first use
+
+        :return:
+            healthChart.renderPool object, or None if charts are rendered in-process ('dna_render_processes' is 0)
+        """
+        if dnaConfig.dna_render_processes <= 0:
+            return None
+
+        with self.renderLock:
+            if dnaCenter.chartRenderer is None:
+                dnaCenter.chartRenderer = healthChart.renderPool(processes=dnaConfig.dna_render_processes,
+                                                                 queuesize=dnaConfig.dna_render_queuesize,
+                                                                 timeout=dnaConfig.dna_render_timeout,
+                                                                 executable=dnaConfig.dna_render_executable,
+                                                                 logname=self.logname)
+
+        return dnaCenter.chartRenderer
 
-        return color
+    @classmethod
+    def getRenderStats(cls):
+        """
+        Report the chart rendering pool counters for this process
 
-    def drawHealthChart(self, data, timestamp, filename):
+        :return:
+            Dictionary of counters (see healthChart.renderPool.getStats), or None if the pool is not used
         """
-        Uses matplotlib to draw a bar chart and save the PNG to the temporary directory
+        with cls.renderLock:
+            renderer = cls.chartRenderer
+
+        return renderer.getStats() if renderer is not None else None
+
+    def drawHealthChart(self, data, timestamp):
+        """
+        Draw a bar chart (see healthChart.renderHealthChart) as a PNG in memory, in the rendering process pool if
+        one is configured
+
+        If a chart cache was given, charts are cached by a hash of the health data and title.  A chart identical
+        to a cached one is returned from the cached PNG bytes without calling matplotlib.
 
         Expects a dictionary structure and can generate any number of bars based on the given dict keys
 
@@ -501,110 +1166,104 @@ show software cco image for platform: Shorter command to show recommended CCO im
 
         :param timestamp:
             The timestamp when the health data was obtained.  Used in the title of the bar chart
-        :param filename:
-            Where to save the generated chart
         :return:
-            True is the chart is successfully saved
+            PNG bytes if the chart is successfully drawn
             False otherwise
         """
 
         retval = False
-        labels = list(data['health'].keys())
-        colorchart = list()
-        bartitles = list()
-
-        numdevices = 0
-        numhealthy = 0
-
-        for types in dict.keys(data['health']):
-            colorchart.append(self.assignHealthColor(data['health'][types]['score']))
-            bartitles.append("{0}/{1} Healthy\n{2} Poor/Fair/No Data".format(data['health'][types]['healthy'],
-                                                                             data['health'][types]['total'],
-                                                                             data['health'][types]['total'] -
-                                                                             data['health'][types]['healthy']
-                                                                             )
-                             )
-            numdevices += data['health'][types]['total']
-            numhealthy += data['health'][types]['healthy']
-
-        # Begin creating the graph
-        # plt is the imported matplotlib.pyplot
-        # fig,ax creates figures and axes for subplots with figure size of 10 inches wide by 6 inches tall
-        plt.rcdefaults()
-        fig, ax = plt.subplots(figsize=(10, 6))
-
-        # Evenly distribute the number of bars based on the length of the 'labels' list
-        ind = np.arange(len(labels))
-
-        # Set the number of ticks on the X axis to the value obtained by Numpy above
-        # Also set the labels on the X axis for each bar
-        ax.set_xticks(ind)
-        ax.set_xticklabels(labels)
-
-        # Set the Y axis height to 200.  Each bar will be of height '100' to show
-        # equal heights.  This being done to represent health data in a similar fashion
-        # as that obtained in the Cisco DNA Assurance health status
-        ax.set_ylim([0, 200])
-
-        # Set the title and assign to the graph
+
+        # Set the title for the graph
         title = "Network Device Health as of {0}\n{1}% Healthy".format(time.strftime("%Y-%m-%d %H:%M:%S %Z",
                                                                                      time.localtime(timestamp / 1000)
                                                                                      ),
                                                                        data['overallScore']
                                                                        )
-        plt.title(title)
-
-        # Get rid of all the borders around the graph.  Leave the labels in place on the X axis
-        for spine in plt.gca().spines.values():
-            spine.set_visible(False)
-        plt.tick_params(top=False, bottom=False, left=False, right=False, labelleft=False, labelbottom=True)
-
-        # Define (ind) number of bars.
-        # All of height 100 and bar width is half of the total width available per section
-        # (the number of sections being defined the 'ind') - represented by the .5 in the 3rd argument.
-        # Start the bottom of each bar at y=1 so the border appears correctly (since we disabled all borders above).
-        # Per-bar color will be assigned based on the values in the 'colorChart' list, and each bar
-        # will have a black border.
-        ax.bar(ind, 100, .5, bottom=1, color=colorchart, edgecolor='black')
-
-        # Get rectangles (patches) - we will use this collection to add top labels to each bar
-        rects = ax.patches
-
-        # Add a top header to each bar which displays some health data
-        # The label will be centered and added (height+5) above each bar
-        for rect, label in zip(rects, bartitles):
-            height = rect.get_height()
-            ax.text(rect.get_x() + rect.get_width() / 2, height + 5, label,
-                    ha='center', va='bottom')
-
-        # Save the health image to (filename)
+
+        chartkey = hashlib.sha256(json.dumps({'data': data, 'title': title}, sort_keys=True).encode("utf-8"))
+        chartkey = "chart:{}".format(chartkey.hexdigest())
+        png = self.chartCache.get(chartkey) if self.chartCache is not None else None
+
+        # Draw the health image (unless it is cached)
         try:
-            plt.savefig(filename)
-            self.logger.debug("Health chart successfully saved")
-            retval = True
+            if png is None:
+                renderer = self.getRenderPool()
+                if renderer is not None:
+                    png = renderer.render(data, title)
+                else:
+                    png = healthChart.renderPng(data, title)
+                if self.chartCache is not None:
+                    self.chartCache.set(chartkey, png)
+            else:
+                self.logger.debug("Using cached health chart %s", chartkey)
+
+            self.logger.debug("Health chart successfully drawn")
+            retval = png
         except Exception as e:
-            self.logger.error("drawHealthChart: There was a problem saving the generated image: %s", e, exc_info=True)
+            self.logger.error("drawHealthChart: There was a problem drawing the image: %s", e, exc_info=True)
 
         return retval
 
-    def getNetworkHealthImage(self, timestamp=int(round(time.time() * 1000))):
+    def getNetworkHealthImage(self, timestamp=None, refresh=False):
         """
         Retrieve network health data for timestamp (or current time if not specified).  If health data retrieval
         succeeds, send it to 'drawHealthChart' to create an image.  Once all is successful, generate an API response
         containing the filename to be posted to Webex Teams.
 
+        The timestamp is rounded down to a 'dna_health_bucket' window so requests made within the same window
+        share one API response.  If a health cache was given, responses are cached - for a short time if the
+        window is recent, or for 'dna_health_history_ttl' seconds if it is older than 'dna_health_history_age'
+        (historical health data does not change).
+
+        If no timestamp is given and a current snapshot of the network health exists, the snapshot is used and
+        the chart shows the time of the snapshot.
+
         :param timestamp:
             Epoch time in milliseconds for the health image generation.  If not specified, use the current time.
+        :param refresh:
+            Bypass the cache (and snapshot) and get the health data from Cisco DNA Center
         :return:
             Dictionary API Response
         """
         retval = False
+        r = None
+
+        now = int(round(time.time() * 1000))
+        if timestamp is None:
+            snapshot = self.getSnapshot('networkhealth', refresh=refresh)
+            if snapshot is not None:
+                timestamp = int(round(snapshot[0] * 1000))
+                r = snapshot[1]
+                self.logger.debug("Using network health snapshot from %s", timestamp)
+            else:
+                timestamp = now
+
+        window = dnaConfig.dna_health_bucket * 1000
+        if window > 0 and r is None:
+            timestamp -= timestamp % window
+
         url = "/dna/intent/api/v1/network-health?timestamp={0}".format(timestamp)
         headers = {
             '__runsync': 'true'
         }
+        cachekey = "health:{}".format(timestamp)
 
-        r = self.urlget(url, headers)
+        if self.healthCache is not None and not refresh and r is None:
+            r = self.healthCache.get(cachekey)
+            if r is not None:
+                self.logger.debug("Using cached network health for timestamp %s", timestamp)
+
+        if r is None:
+            r = self.urlget(url, headers)
+
+            # Only cache actual health data
+            if self.healthCache is not None and r != False and 'response' in r \
+                    and 'executionId' not in r and 'errorResponse' not in r:
+                if timestamp + window < now - dnaConfig.dna_health_history_age * 1000:
+                    ttl = dnaConfig.dna_health_history_ttl
+                else:
+                    ttl = dnaConfig.dna_health_bucket
+                self.healthCache.set(cachekey, r, ttl=ttl)
 
         if r == False:
             # There was a problem getting a response from the server.
@@ -644,12 +1303,12 @@ show software cco image for platform: Shorter command to show recommended CCO im
 
             self.logger.debug("Healthdata:\n%s\n", healthData)
 
-            filename = "{0}/NetworkHealth_{1}.png".format(self.tmpfolder, timestamp)
-
-            if self.drawHealthChart(data=healthData, timestamp=timestamp, filename=filename):
+            png = self.drawHealthChart(data=healthData, timestamp=timestamp)
+            if png != False:
                 self.logger.debug("Health chart generated")
                 apimsg = "NetworkHealth_{}".format(timestamp)
-                retval = self.generateApiResponse('file', apimsg, file=filename)
+                retval = self.generateApiResponse('file', apimsg, content=png, filename="{}.png".format(apimsg),
+                                                  mimetype="image/png")
             else:
                 self.logger.warning("Problem generating health chart")
                 logmsg = "There was a problem generating the health chart.  Check the logs for details"
@@ -678,51 +1337,90 @@ show software cco image for platform: Shorter command to show recommended CCO im
     BEGIN Software Image Management Functions
     """
 
-    def getSoftwareImagePlatforms(self):
+    def getSoftwareCatalog(self, refresh=False):
+        """
+        Get the software image catalog for this process, loading it from Cisco DNA Center if it is stale (older
+        than 'dna_image_catalog_ttl') or a refresh is requested.  If loading fails, the previous contents are
+        kept and used.
+
+        If current snapshots of the image importation lists exist, the catalog is loaded from them instead.
+
+        :param refresh:
+            Reload the catalog from Cisco DNA Center even if it is current
+        :return:
+            softwareCatalog object, or False if the catalog could not be loaded
+        """
+        catalog = self.imageCatalog
+
+        with self.catalogLock:
+            images = self.getSnapshot('softwareimages', refresh=refresh)
+            ccoimages = self.getSnapshot('softwareccoimages', refresh=refresh)
+
+            if images is not None and ccoimages is not None and min(images[0], ccoimages[0]) > catalog.loaded:
+                # Newer snapshots are available
+                catalog.load(images[1]['response'], ccoimages[1]['response'], loaded=min(images[0], ccoimages[0]))
+                self.logger.debug("getSoftwareCatalog: Loaded %s images from snapshot", len(images[1]['response']))
+            elif refresh or catalog.isStale():
+                images = self.getDataset('softwareimages')
+                ccoimages = self.getDataset('softwareccoimages') if images != False else False
+
+                if images != False and ccoimages != False:
+                    catalog.load(images['response'], ccoimages['response'])
+                    self.logger.debug("getSoftwareCatalog: Loaded %s images", len(images['response']))
+                elif catalog.loaded == 0:
+                    self.logger.error("getSoftwareCatalog: Unable to load the software image catalog")
+                    catalog = False
+                else:
+                    self.logger.warning("getSoftwareCatalog: Unable to refresh the software image catalog, "
+                                        "using the previous contents")
+
+        return catalog
+
+    def getSoftwareImagePlatforms(self, refresh=False):
         """
         Generate a list of the available software platforms based on images present in Cisco DNA Center
 
+        :param refresh:
+            Reload the software image catalog before answering
         :return:
             Dictionary API response for Webex Teams reply
         """
-        url = "/dna/intent/api/v1/image/importation"
-        r = self.urlget(url)
-        r = r['response']
+        catalog = self.getSoftwareCatalog(refresh=refresh)
+        if catalog == False:
+            msg = "There was a problem getting the software images.  Check the logs for details"
+            return self.generateApiResponse('error', msg, richmessage=msg)
 
         message = "Software images are available for the following platforms:\n"
         messagerich = "Software images are available for the following platforms:\n\n"
 
-        platforms = set()
-
-        for image in r:
-            platforms.add(image['family'])
-
-        for family in platforms:
+        for family in catalog.getFamilies():
             message += "{}\n".format(family)
             messagerich += "**{}**\n\n".format(family)
 
+        message += "\n{}\n".format(self.getDataAge(catalog.loaded))
+        messagerich += "*{}*\n\n".format(self.getDataAge(catalog.loaded))
+
         return self.generateApiResponse('message', message, richmessage=messagerich)
 
-    def getSoftwareImages(self, family="", cco=False):
+    def getSoftwareImages(self, family="", cco=False, refresh=False):
         """
         Generate a list of the available software images
 
+        :param family:
+            Only list images for this family (platform)
+        :param cco:
+            Only list CCO-recommended images
+        :param refresh:
+            Reload the software image catalog before answering
         :return:
             Dictionary API response for Webex Teams reply
         """
-        url = "/dna/intent/api/v1/image/importation"
+        catalog = self.getSoftwareCatalog(refresh=refresh)
+        if catalog == False:
+            msg = "There was a problem getting the software images.  Check the logs for details"
+            return self.generateApiResponse('error', msg, richmessage=msg)
 
-        if family != "" or cco == True:
-            url += "?"
-            if family != "":
-                url += "family={}".format(family)
-                if cco == True:
-                    url += "&isCCORecommended=true"
-            elif cco != False:
-                url += "isCCORecommended=true"
-
-        r = self.urlget(url)
-        r = r['response']
+        r = catalog.getImages(family=family, cco=cco)
 
         if r == []:
             msg = "No images are available which meet the specified criteria."
@@ -743,6 +1441,7 @@ show software cco image for platform: Shorter command to show recommended CCO im
 
             self.logger.debug("getSoftwareImages:\n%s", msg)
 
+        msg += "{}\n".format(self.getDataAge(catalog.loaded))
         return self.generateApiResponse('message', msg, richmessage="")
 
     """
@@ -755,60 +1454,297 @@ show software cco image for platform: Shorter command to show recommended CCO im
     BEGIN Inventory Functions
     """
 
-    def getNetworkInventory(self):
+    def getDeviceCount(self):
         """
-        Generate a CSV which contains the entire network inventory.  This is performed using a paginated GET
-        request to the network-device API call to avoid timeout or processing too much data.
+        Get the number of network devices known to Cisco DNA Center
 
-        Each iteration will retrieve (step) number of devices and process accordingly - the step may be adjusted up
-        to the maximum supported by the API call (check Cisco DNA API documentation for details)
+        :return:
+            Number of devices, or False if the count could not be retrieved
+        """
+        retval = False
+        r = self.urlget("/dna/intent/api/v1/network-device/count")
+
+        if r != False and isinstance(r.get('response'), int):
+            retval = r['response']
+        else:
+            self.logger.warning("getDeviceCount: Unable to get the network device count")
+
+        return retval
 
-        The fields for the CSV are defined in the 'csvheader' variable - any JSON key returned from the URL
-        may be included in this list and will be included in the generated inventory file.
+    def getInventoryPage(self, start, pagesize):
+        """
+        Get one page of the network device inventory
 
+        :param start:
+            Index (starting at 1) of the first device on the page
+        :param pagesize:
+            Maximum number of devices on the page
         :return:
-            Dictionary API response
+            List of devices (empty past the end of the inventory)
         """
-        step = 100
-        start = 1
-        end = step
+        url = "/dna/intent/api/v1/network-device/{0}/{1}".format(start, pagesize)
+        r = self.urlget(url)
 
-        devices = list()
+        if r == False or 'response' not in r:
+            raise RuntimeError("There was a problem retrieving inventory devices {0} to {1}".format(
+                start, start + pagesize - 1))
 
-        csvheader = ['hostname', 'family', 'serialNumber', 'platformId', 'softwareVersion', 'macAddress',
-                     'managementIpAddress']
+        return r['response']
 
-        timestamp = int(round(time.time() * 1000))
-        timestr = time.strftime("%Y-%m-%d_%H:%M:%S_%Z", time.localtime(timestamp / 1000))
-        filename = "{0}/inventory_{1}.csv".format(self.tmpfolder, timestamp)
+    def getInventoryPages(self, pagesize=dnaConfig.dna_inventory_page_size,
+                          workers=dnaConfig.dna_inventory_workers):
+        """
+        Generator which yields the network device inventory one page at a time, in order.
 
-        # Begin iterating over the inventory returned from Cisco DNA Center.  Extend the fields list with retrieved
-        # fields in the JSON response, then append the generated 'fields' list to the 'devices' list
-        while True:
-            url = "/dna/intent/api/v1/network-device/{0}/{1}".format(start, end)
-            r = self.urlget(url)
-            r = r['response']
+        If more than one worker is allowed and the device count is available, the pages are fetched concurrently
+        (at most 'workers' pages in flight).  Otherwise the pages are fetched one at a time.  Either way, the
+        inventory is then read until an empty page is returned in case devices were added in the meantime.
 
-            if r != []:
-                for device in r:
-                    fields = list()
-                    for head in csvheader:
-                        fields.extend([device[head]])
-                    devices.append(fields)
-                start += step
-                end += step
-            else:
+        :param pagesize:
+            Number of devices per page.  Check Cisco DNA API documentation for the maximum supported.
+        :param workers:
+            Maximum number of pages fetched concurrently
+        :return:
+            Generator of device lists
+        """
+        start = 1
+        total = self.getDeviceCount() if workers > 1 else False
+
+        if total != False:
+            self.logger.debug("getInventoryPages: Fetching %s devices, %s per page, %s pages at a time",
+                              total, pagesize, workers)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for start in range(1, total + 1, pagesize):
+                    pending.append(pool.submit(self.getInventoryPage, start, pagesize))
+                    if len(pending) >= workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            start = ((total + pagesize - 1) // pagesize) * pagesize + 1
+
+        while True:
+            page = self.getInventoryPage(start, pagesize)
+            if page == []:
                 break
+            yield page
+            start += pagesize
+
+    def openExport(self, stack, name, compression):
+        """
+        Open an export (CSV text), optionally compressed, written to memory.  Exports larger than
+        'dna_export_memory_size' bytes are moved to an anonymous file in the temporary directory, which is deleted
+        as soon as it is closed.  The compressed stream (and archive) are registered with 'stack' and completed when
+        it exits; the buffer is left open for the caller.
+
+        :param stack:
+            contextlib.ExitStack which will complete the export
+        :param name:
+            Name of the uncompressed file.  '.gz' or '.zip' is appended if compressed.
+        :param compression:
+            'gzip', 'zip' or anything else for an uncompressed file
+        :return:
+            Tuple of (text stream to write to, binary buffer holding the export, filename, MIME type)
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=dnaConfig.dna_export_memory_size, dir=self.tmpfolder)
+
+        if compression == "gzip":
+            filename = name + ".gz"
+            mimetype = "application/gzip"
+            stream = stack.enter_context(gzip.GzipFile(filename=name, mode='wb', fileobj=buffer))
+        elif compression == "zip":
+            filename = name + ".zip"
+            mimetype = "application/zip"
+            archive = stack.enter_context(zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED))
+            stream = stack.enter_context(archive.open(name, 'w'))
+        else:
+            filename = name
+            mimetype = "text/csv"
+            stream = buffer
+
+        return codecs.getwriter('utf-8')(stream), buffer, filename, mimetype
+
+    def getInventoryStore(self):
+        """
+        Get the local inventory store for this process, opening (and if needed creating) the SQLite database
+        'dna_inventory_store' in the temporary directory on first use.
+
+        :return:
+            inventoryStore object
+        """
+        with self.storeLock:
+            if dnaCenter.deviceStore is None:
+                filename = "{0}/{1}".format(self.tmpfolder, dnaConfig.dna_inventory_store)
+                dnaCenter.deviceStore = inventoryStore.inventoryStore(filename)
+
+        return dnaCenter.deviceStore
+
+    def syncInventoryStore(self, force=False, wait=False):
+        """
+        Synchronize the local inventory store with Cisco DNA Center if it is older than
+        'dna_inventory_sync_interval' (or 'force' is set).  Only one process or thread synchronizes the store at a
+        time - if a synchronization is already running, return immediately unless 'wait' is set.
+
+        :param force:
+            Synchronize even if the store is current
+        :param wait:
+            Wait for a running synchronization to finish.  If it succeeded, the store is not synchronized again.
+        :return:
+            True if the store was synchronized (by this call or the one waited for), False otherwise
+        """
+        retval = False
+        store = self.getInventoryStore()
+        started = time.time()
+
+        lock = store.acquireSyncLock(wait=wait)
+        if lock is None:
+            self.logger.debug("syncInventoryStore: Synchronization already running")
+            return retval
+
+        try:
+            if wait and store.getLastSync() >= started:
+                self.logger.debug("syncInventoryStore: Store synchronized while waiting")
+                retval = True
+            elif force or time.time() - store.getLastSync() > dnaConfig.dna_inventory_sync_interval:
+                written, removed = store.sync(self.getInventoryPages())
+                self.logger.info("syncInventoryStore: %s devices updated, %s removed", written, removed)
+                retval = True
+        except RuntimeError as e:
+            self.logger.error("syncInventoryStore: %s", e, exc_info=True)
+        finally:
+            store.releaseSyncLock(lock)
+
+        return retval
+
+    def startInventorySync(self):
+        """
+        Synchronize the inventory store in a background thread, unless this process already has one running.
+        Other processes are kept out by the store's lock file (see 'syncInventoryStore').
+
+        :return:
+            True if a thread was started, False otherwise
+        """
+        with self.storeLock:
+            if dnaCenter.syncThread is not None and dnaCenter.syncThread.is_alive():
+                return False
+
+            dnaCenter.syncThread = threading.Thread(target=self.syncInventoryStore, name="inventorySync", daemon=True)
+            dnaCenter.syncThread.start()
+
+        return True
+
+    def getDevice(self, field, value, refresh=False):
+        """
+        Look up devices in the local inventory store.  If the store was never synchronized (or a refresh is
+        requested) it is synchronized first; if it is stale, it is synchronized in the background and the current
+        contents are used.
+
+        :param field:
+            Field to search: hostname, serialNumber, macAddress or managementIpAddress
+        :param value:
+            Value to find
+        :param refresh:
+            Synchronize the store before the lookup
+        :return:
+            Dictionary API Response
+        """
+        if value == "":
+            msg = "Please specify the device to look up."
+            return self.generateApiResponse('error', msg, richmessage=msg)
+
+        store = self.getInventoryStore()
+        lastsync = store.getLastSync()
+
+        if lastsync == 0 or refresh:
+            self.syncInventoryStore(force=True, wait=True)
+        elif time.time() - lastsync > dnaConfig.dna_inventory_sync_interval:
+            self.startInventorySync()
+
+        # Never answer "not found" from a store which was never loaded
+        lastsync = store.getLastSync()
+        if lastsync == 0:
+            msg = "The device inventory could not be loaded from Cisco DNA Center.  Please try again later."
+            return self.generateApiResponse('error', msg, richmessage=msg)
+
+        devices = store.find(field, value)
+        asof = time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(lastsync))
+
+        if devices == []:
+            msg = "No device found with {0} {1} (inventory as of {2})".format(field, value, asof)
+            msgrich = msg
+        else:
+            msg = ""
+            msgrich = ""
+            for device in devices:
+                for key in dnaConfig.dna_device_fields:
+                    msg += "{0}: {1}\n".format(key, device.get(key))
+                    msgrich += "**{0}:** {1}\n\n".format(key, device.get(key))
+                msg += "\n"
+            msg += "Inventory as of {}".format(asof)
+            msgrich += "*Inventory as of {}*".format(asof)
 
-        # Generate the CSV file with header row
-        with open(filename, 'w') as invfile:
-            wr = csv.writer(invfile)
-            wr.writerow(csvheader)
-            for row in devices:
-                wr.writerow(row)
+        return self.generateApiResponse('message', msg, richmessage=msgrich)
 
+    def getNetworkInventory(self, fields=None, compression=""):
+        """
+        Generate a CSV which contains the entire network inventory.  This is performed using paginated GET
+        requests to the network-device API call to avoid timeout or processing too much data.  See
+        'getInventoryPages' for details of the page size and concurrency.
+
+        Rows are written to the CSV as each page arrives.  The CSV is kept in memory unless it is very large (see
+        'openExport').
+
+        The fields for the CSV are defined in the 'csvheader' variable (from the config file unless 'fields' is
+        given) - any JSON key returned from the URL may be included in this list and will be included in the
+        generated inventory file.  Field names are not case-sensitive.
+
+        :param fields:
+            Optional list of fields to include in the CSV
+        :param compression:
+            'gzip' or 'zip' to compress the CSV, anything else for an uncompressed CSV
+        :return:
+            Dictionary API response
+        """
+        import csv
+
+        csvheader = fields if fields else list(dnaConfig.dna_inventory_fields)
+        keys = None
+
+        timestr = time.strftime("%Y-%m-%d_%H:%M:%S_%Z", time.localtime())
         apimsg = "NetworkInventory_{}".format(timestr)
-        return self.generateApiResponse('file', apimsg, file=filename)
+
+        # Begin iterating over the inventory returned from Cisco DNA Center and write a row for each device as its
+        # page arrives.  The JSON keys for the requested fields are looked up on the first device and used as the
+        # header row.  'buffer' stays None if the export could not be opened.
+        buffer = None
+        try:
+            with contextlib.ExitStack() as stack:
+                invfile, buffer, filename, mimetype = self.openExport(stack, "{}.csv".format(apimsg), compression)
+                wr = csv.writer(invfile)
+
+                for page in self.getInventoryPages():
+                    for device in page:
+                        if keys is None:
+                            devicekeys = {key.lower(): key for key in device.keys()}
+                            unknown = [head for head in csvheader if head.lower() not in devicekeys]
+                            if unknown:
+                                raise ValueError("Unknown inventory field(s): {}".format(", ".join(unknown)))
+                            keys = [devicekeys[head.lower()] for head in csvheader]
+                            wr.writerow(keys)
+                        wr.writerow([device.get(key) for key in keys])
+
+                # Empty inventory - write the header row only
+                if keys is None:
+                    wr.writerow(csvheader)
+        except (RuntimeError, ValueError, OSError) as e:
+            self.logger.error("getNetworkInventory: %s", e, exc_info=True)
+            if buffer is not None:
+                buffer.close()
+            errmsg = "There was a problem generating the network inventory: {}".format(e)
+            return self.generateApiResponse('error', errmsg, richmessage=errmsg)
+
+        buffer.seek(0)
+        return self.generateApiResponse('file', apimsg, content=buffer, filename=filename, mimetype=mimetype)
 
     """
     END Inventory Functions
@@ -820,44 +1756,182 @@ show software cco image for platform: Shorter command to show recommended CCO im
     BEGIN PnP Functions
     """
 
-    def getPnpStatus(self):
+    def getPnpState(self, state):
         """
-        Returns a list of devices configured for PnP as well as the current status
+        Look up a PnP device state typed in a chat command.  Only the known states are ever put in a URL.
 
+        :param state:
+            State name (not case-sensitive)
         :return:
-            Dictionary API Response
+            The state as Cisco DNA Center spells it (one of 'dna_pnp_states'), or None if it is not known
         """
-        url = "/dna/intent/api/v1/onboarding/pnp-device"
+        states = {known.lower(): known for known in dnaConfig.dna_pnp_states}
+        return states.get(state.strip().lower())
 
-        r = self.urlget(url)
+    def getPnpPages(self, state="", pagesize=dnaConfig.dna_pnp_page_size):
+        """
+        Generator which fetches the PnP devices one page at a time using 'limit' / 'offset' pagination
 
-        if r == []:
+        :param state:
+            Only return devices in this state (one of 'dna_pnp_states', not case-sensitive).  Filtered by Cisco DNA
+            Center.  If empty, devices in any state are returned.
+        :param pagesize:
+            Number of devices requested per call
+        :return:
+            Yields lists of PnP devices.  Raises RuntimeError if a page can't be retrieved, ValueError if the state
+            is not known.
+        """
+        offset = 0
+        if state != "":
+            state = self.getPnpState(state)
+            if state is None:
+                raise ValueError("Unknown PnP state")
+
+        while True:
+            url = "/dna/intent/api/v1/onboarding/pnp-device?limit={0}&offset={1}".format(pagesize, offset)
+            if state != "":
+                url += "&state={}".format(state)
+
+            r = self.urlget(url)
+            if r == False or not isinstance(r, list):
+                raise RuntimeError("There was a problem retrieving PnP devices {0} to {1}".format(
+                    offset + 1, offset + pagesize))
+
+            if r != []:
+                yield r
+            if len(r) < pagesize:
+                break
+            offset += pagesize
+
+    def getPnpDevices(self, state="", refresh=False):
+        """
+        Get the PnP devices, from the current snapshot if one exists (see 'datasets') or from Cisco DNA Center
+
+        :param state:
+            Only return devices in this state.  If empty, devices in any state are returned.
+        :param refresh:
+            Bypass the snapshot and get the PnP devices from Cisco DNA Center
+        :return:
+            Tuple of (time the data was obtained in epoch seconds, iterable of device lists)
+        """
+        snapshot = self.getSnapshot('pnpstatus', refresh=refresh)
+
+        if snapshot is None:
+            return time.time(), self.getPnpPages(state=state)
+
+        snaptime, devices = snapshot
+        if state != "":
+            devices = [device for device in devices if device['deviceInfo']['state'].lower() == state.lower()]
+
+        return snaptime, [devices]
+
+    def getPnpStatus(self, state="", refresh=False):
+        """
+        Returns a list of devices configured for PnP as well as the current status.  If a current snapshot of the
+        PnP devices exists, it is used instead of calling Cisco DNA Center.
+
+        The table is split into messages of up to 'dna_message_size' bytes, each starting with the header row.
+        If more than 'dna_pnp_max_messages' messages would be needed, a CSV file is attached instead.
+
+        :param state:
+            Only list devices in this state.  If empty, devices in any state are listed.
+        :param refresh:
+            Bypass the snapshot and get the PnP devices from Cisco DNA Center
+        :return:
+            Dictionary API Response
+        """
+        # The state comes from the chat message: only known states are accepted
+        if state != "":
+            known = self.getPnpState(state)
+            if known is None:
+                msg = "Unknown PnP state {0}.  Valid states are: {1}".format(state, ", ".join(dnaConfig.dna_pnp_states))
+                return self.generateApiResponse('error', msg, richmessage=msg)
+            state = known
+
+        rowformat = "{0: <25}{1: <20}{2: <25}{3: <20}"
+        header = rowformat.format("Serial Number", "Platform", "PnP Workflow", "Status")
+        rows = list()
+
+        snaptime, pages = self.getPnpDevices(state=state, refresh=refresh)
+        try:
+            for page in pages:
+                for status in page:
+                    rows.append((status['deviceInfo']['serialNumber'],
+                                 status['deviceInfo']['pid'],
+                                 status['deviceInfo']['name'],
+                                 status['deviceInfo']['state']))
+        except RuntimeError as e:
+            self.logger.error("getPnpStatus: %s", e, exc_info=True)
+            msg = "There was a problem getting the PnP status.  Check the logs for details"
+            return self.generateApiResponse('error', msg, richmessage=msg)
+
+        footer = self.getDataAge(snaptime)
+
+        if rows == []:
             msg = "No PnP Status to report."
-        else:
-            pnpstat = list()
+            if state != "":
+                msg = "No PnP devices are in state {}.".format(state)
+            return self.generateApiResponse('message', "{0}\n\n{1}\n".format(msg, footer), richmessage="")
+
+        # Split the table into messages which fit the size limit, repeating the header in each one
+        messages = list()
+        lines = [header]
+        size = len(header) + len(footer) + 3
+
+        for row in rows:
+            line = rowformat.format(*row)
+            linesize = len(line.encode("utf-8")) + 1
+            if size + linesize > dnaConfig.dna_message_size and len(lines) > 1:
+                messages.append(lines)
+                lines = [header]
+                size = len(header) + len(footer) + 3
+            lines.append(line)
+            size += linesize
+        messages.append(lines)
+
+        self.logger.debug("getPnpStatus: %s devices in %s message(s)", len(rows), len(messages))
+
+        if len(messages) > dnaConfig.dna_pnp_max_messages:
+            return self.getPnpStatusFile(rows, footer)
+
+        messages = ["{0}\n\n{1}\n".format("\n".join(lines), footer) for lines in messages]
+        if len(messages) == 1:
+            return self.generateApiResponse('message', messages[0], richmessage="")
+
+        return self.generateApiResponse('messages', messages)
+
+    def getPnpStatusFile(self, rows, footer):
+        """
+        Write the PnP status to a CSV attachment, for results too large to be sent as messages
 
-            for status in r:
-                details = {'serial': status['deviceInfo']['serialNumber'],
-                            'platform': status['deviceInfo']['pid'],
-                            'workflow': status['deviceInfo']['name'],
-                            'state': status['deviceInfo']['state'],
-                            }
-                pnpstat.append(details)
-
-            msg = "{0: <25}{1: <20}{2: <25}{3: <20}\n".format("Serial Number",
-                                                                  "Platform",
-                                                                  "PnP Workflow",
-                                                                  "Status"
-                                                                  )
-            for detail in pnpstat:
-                msg += "{0: <25}{1: <20}{2: <25}{3: <20}\n".format(detail['serial'],
-                                                                       detail['platform'],
-                                                                       detail['workflow'],
-                                                                       detail['state']
-                                                                       )
+        :param rows:
+            List of (serial number, platform, workflow, state) tuples
+        :param footer:
+            'Data as of' line sent with the file
+        :return:
+            Dictionary API Response
+        """
+        import csv
 
-            self.logger.debug("getPnpStatus:\n%s", msg)
-        return self.generateApiResponse('message', msg, richmessage="")
+        timestr = time.strftime("%Y-%m-%d_%H:%M:%S_%Z", time.localtime())
+        buffer = None
+
+        try:
+            with contextlib.ExitStack() as stack:
+                pnpfile, buffer, filename, mimetype = self.openExport(stack, "PnPStatus_{}.csv".format(timestr), "")
+                wr = csv.writer(pnpfile)
+                wr.writerow(["Serial Number", "Platform", "PnP Workflow", "Status"])
+                wr.writerows(rows)
+        except OSError as e:
+            self.logger.error("getPnpStatusFile: %s", e, exc_info=True)
+            if buffer is not None:
+                buffer.close()
+            errmsg = "There was a problem generating the PnP status file: {}".format(e)
+            return self.generateApiResponse('error', errmsg, richmessage=errmsg)
+
+        buffer.seek(0)
+        apimsg = "PnP status for {0} devices.  {1}".format(len(rows), footer)
+        return self.generateApiResponse('file', apimsg, content=buffer, filename=filename, mimetype=mimetype)
 
     """
     END PnP Functions
@@ -28,4 +28,82 @@ sslverify = True
 dna_host = "ciscodnac.example.com"
 dna_port = 443
 dna_username = "ciscodnacusername"
-dna_password = "ciscodnacpassword"
\ No newline at end of file
+dna_password = "ciscodnacpassword"
+
+# Lifetime of the Cisco DNA Center auth token in seconds (60 minutes by default on Cisco DNA Center).  The token is
+# cached and reused until 'dna_token_refresh' seconds before it expires, then a new one is requested.
+dna_token_lifetime = 3600
+dna_token_refresh = 120
+
+# HTTP connection pool size per Cisco DNA Center controller.  Connections are kept alive and reused for the
+# lifetime of each uWSGI worker.
+dna_pool_size = 10
+
+# (connect, read) timeouts in seconds for each class of Cisco DNA Center API call.  Synchronous '__runsync' calls
+# (e.g. network health) can take much longer than the other intent API calls.
+dna_timeouts = {
+    'auth': (5, 15),
+    'intent': (5, 30),
+    'runsync': (5, 120)
+}
+
+# Network inventory pagination: number of devices requested per page (the network-device API accepts up to 500) and
+# the number of pages fetched concurrently.  Set the number of workers to 1 to fetch one page at a time.
+dna_inventory_page_size = 500
+dna_inventory_workers = 4
+
+# Default fields included in the inventory CSV (any key returned by the network-device API may be used), and the
+# default compression for the file: "gzip", "zip" or "" for an uncompressed CSV.  Both may be given per request,
+# e.g. 'get inventory fields hostname,serialNumber gzip'
+dna_inventory_fields = ['hostname', 'family', 'serialNumber', 'platformId', 'softwareVersion', 'macAddress',
+                        'managementIpAddress']
+dna_inventory_compression = ""
+
+# Network health caching.  Requested timestamps are rounded down to a window of 'dna_health_bucket' seconds so that
+# requests made within the same window share a single API response (set to 0 to disable).  Health data older than
+# 'dna_health_history_age' seconds does not change and is cached for 'dna_health_history_ttl' seconds.
+dna_health_bucket = 60
+dna_health_history_age = 3600
+dna_health_history_ttl = 86400
+
+# Date / time parsing for commands such as 'show network health at <time>'.  Common formats are parsed directly;
+# other phrasings are passed to dateparser, which only tries the languages listed here.  Parsed results are cached
+# per phrase and minute (up to 'dna_date_cache_size' phrases).
+dna_date_languages = ['en']
+dna_date_cache_size = 256
+
+# Number of seconds the software image catalog (image importation list) is kept in memory before it is loaded
+# again.  Add 'refresh' to a software command to reload it immediately.
+dna_image_catalog_ttl = 600
+
+# Local inventory store used by the 'show device ...' commands.  The SQLite database is created in the temporary
+# directory and synchronized with Cisco DNA Center once it is older than 'dna_inventory_sync_interval' seconds.
+# 'dna_device_fields' are the fields shown for each device found.
+dna_inventory_store = "inventory.db"
+dna_inventory_sync_interval = 900
+dna_device_fields = ['hostname', 'managementIpAddress', 'macAddress', 'serialNumber', 'platformId', 'softwareVersion',
+                     'reachabilityStatus', 'upTime']
+
+# PnP status: number of devices requested per call (limit / offset pagination).  Replies longer than
+# 'dna_message_size' bytes (the Webex Teams limit is 7439) are split into several messages, each with the header row;
+# if more than 'dna_pnp_max_messages' messages would be needed, a CSV file is attached instead.
+# 'dna_pnp_states' are the device states 'show pnp status *state*' accepts (not case-sensitive).
+dna_pnp_page_size = 100
+dna_pnp_states = ['Unclaimed', 'Planned', 'Onboarding', 'Provisioned', 'Error']
+dna_message_size = 7000
+dna_pnp_max_messages = 3
+
+# Exports (inventory and PnP status CSV files) are built in memory and uploaded from there.  Exports larger than
+# 'dna_export_memory_size' bytes are moved to an anonymous temporary file, deleted once the upload is done.
+dna_export_memory_size = 8 * 1024 * 1024
+
+# Optional chart rendering processes.  Health charts are CPU-bound and hold the GIL while they are drawn; with
+# 'dna_render_processes' above 0, each uWSGI worker renders them in that many long-lived processes instead (which
+# import matplotlib and style a figure when they start).  Up to 'dna_render_queuesize' charts may be rendering or
+# waiting, and a chart not ready after 'dna_render_timeout' seconds fails and the processes are replaced.  Under
+# uWSGI, set 'dna_render_executable' to the Python interpreter (e.g. "/path/to/venv/bin/python3") since the processes
+# can't be started with the uwsgi executable.
+dna_render_processes = 0
+dna_render_queuesize = 8
+dna_render_timeout = 20
+dna_render_executable = ""
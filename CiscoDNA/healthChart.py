@@ -0,0 +1,330 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Health chart rendering.  Uses the object-oriented matplotlib API with the Agg backend so no figures are registered
+with pyplot (and kept alive by it).  Each thread keeps one styled figure which is reused for every chart: only the
+bars, colors and labels are drawn per request and removed again once the PNG is saved.
+
+matplotlib is imported when the first chart is drawn (or by 'preload') to keep worker start-up fast.
+
+Rendering is CPU-bound and holds the GIL.  'renderPool' optionally moves it to a few long-lived processes which
+have matplotlib imported and a figure styled before the first chart is requested.
+
+"""
+import io
+import time
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+import processLocal
+from concurrent.futures.process import BrokenProcessPool
+
+# Per-thread figure and axes, styled once
+templates = threading.local()
+
+
+def assignHealthColor(healthScore):
+    """
+    Based on a given health score, assign a color for use in graphic representations of health
+    Ranges adjusted here for consistency across visuals
+
+    :param healthScore:
+        Score representing a healthy percentage
+    :return:
+        Color name as a string value
+    """
+    if healthScore > 60:
+        color = 'green'
+    elif healthScore > 30:
+        color = 'goldenrod'
+    else:
+        color = 'red'
+
+    return color
+
+
+def getTemplate():
+    """
+    Get the figure and axes for this thread, creating and styling them on first use.
+
+    The figure is 10 inches wide by 6 inches tall.  The Y axis height is set to 200 and each bar will be of height
+    '100' to show equal heights - this represents health data in a similar fashion as that obtained in the
+    Cisco DNA Assurance health status.  All borders around the graph are removed, leaving only the labels on the
+    X axis.
+
+    :return:
+        Tuple of (figure, axes)
+    """
+    template = getattr(templates, 'chart', None)
+
+    if template is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1, 1, 1)
+        ax.set_ylim([0, 200])
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        ax.tick_params(top=False, bottom=False, left=False, right=False, labelleft=False, labelbottom=True)
+
+        template = (fig, ax)
+        templates.chart = template
+
+    return template
+
+
+def renderHealthChart(data, title, output):
+    """
+    Draw the health bar chart and save it as a PNG
+
+    :param data:
+        Structured health data.  See dnaCenter.drawHealthChart for the dictionary structure.
+    :param title:
+        Title of the chart
+    :param output:
+        Filename or binary file-like object where the PNG is written
+    :return:
+        None.  Exceptions raised while saving are passed to the caller.
+    """
+    fig, ax = getTemplate()
+
+    labels = list(data['health'].keys())
+    colorchart = list()
+    bartitles = list()
+
+    for types in labels:
+        colorchart.append(assignHealthColor(data['health'][types]['score']))
+        bartitles.append("{0}/{1} Healthy\n{2} Poor/Fair/No Data".format(data['health'][types]['healthy'],
+                                                                         data['health'][types]['total'],
+                                                                         data['health'][types]['total'] -
+                                                                         data['health'][types]['healthy']
+                                                                         )
+                         )
+
+    # Evenly distribute the bars and set the labels on the X axis for each bar
+    ind = list(range(len(labels)))
+    ax.set_xticks(ind)
+    ax.set_xticklabels(labels)
+    ax.set_title(title)
+
+    # Define (ind) number of bars.
+    # All of height 100 and bar width is half of the total width available per section
+    # (the number of sections being defined the 'ind') - represented by the .5 in the 3rd argument.
+    # Start the bottom of each bar at y=1 so the border appears correctly (since we disabled all borders).
+    # Per-bar color will be assigned based on the values in the 'colorChart' list, and each bar
+    # will have a black border.
+    bars = ax.bar(ind, 100, .5, bottom=1, color=colorchart, edgecolor='black')
+    texts = list()
+
+    # Removing the previous chart's bars doesn't shrink the data limits of the reused axes: recompute them from
+    # this chart's bars so the X range fits the number of bars
+    ax.relim()
+    ax.autoscale_view()
+
+    try:
+        # Add a top header to each bar which displays some health data
+        # The label will be centered and added (height+5) above each bar
+        for rect, label in zip(bars, bartitles):
+            height = rect.get_height()
+            texts.append(ax.text(rect.get_x() + rect.get_width() / 2, height + 5, label,
+                                 ha='center', va='bottom'))
+
+        fig.savefig(output, format='png')
+    finally:
+        # Remove the per-request artists so the template is ready for the next chart
+        for text in texts:
+            text.remove()
+        bars.remove()
+
+
+def renderPng(data, title):
+    """
+    Draw the health bar chart and return it.  Runs in the renderPool processes.
+
+    :param data:
+        Structured health data.  See dnaCenter.drawHealthChart for the dictionary structure.
+    :param title:
+        Title of the chart
+    :return:
+        PNG bytes
+    """
+    chart = io.BytesIO()
+    renderHealthChart(data, title, chart)
+    return chart.getvalue()
+
+
+def preload():
+    """
+    Import matplotlib and draw a throwaway chart so the fonts and renderer are loaded.  Used to warm up the uWSGI
+    master process before the workers are forked.
+
+    :return:
+        None
+    """
+    data = {'overallScore': 100, 'health': {'Preload': {'total': 1, 'healthy': 1, 'score': 100}}}
+    renderHealthChart(data, "Preload", io.BytesIO())
+
+
+class renderPool:
+
+    def __init__(self, processes=2, queuesize=8, timeout=20, executable="", logname=__name__):
+        """
+        Class initialization.  The processes are started on the first render so that a pool created in the uWSGI
+        master process still works in each forked worker.
+
+        :param processes:
+            Number of rendering processes
+        :param queuesize:
+            Maximum number of charts being rendered or waiting.  Once reached, new renders are refused.
+        :param timeout:
+            Number of seconds to wait for a chart.  On timeout the processes are replaced, since a process stuck
+            on a chart can't be interrupted.
+        :param executable:
+            Python interpreter used to start the processes.  Required under uWSGI, where the running executable is
+            uwsgi itself.  If empty, use the current executable.
+        :param logname:
+            Name of the calling logger.  If not given, use the package name
+        """
+        # If the logger name was passed, append this module's name to it.  Otherwise, create a new logger with
+        # only the module name
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        self.processes = processes
+        self.queuesize = queuesize
+        self.timeout = timeout
+        self.executable = executable
+        self.executor = processLocal.processLocal(self.startExecutor)
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(queuesize)
+        self.counters = {
+            'rendered': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'crashes': 0,
+            'restarts': 0,
+            'rendertotal': 0.0,
+            'rendermax': 0.0
+        }
+
+    def getExecutor(self):
+        """
+        Get the process pool of this uWSGI worker, starting it if needed (see processLocal)
+
+        :return:
+            concurrent.futures.ProcessPoolExecutor
+        """
+        return self.executor.get()
+
+    def startExecutor(self):
+        """
+        Start a process pool.  Processes are spawned (not forked) so they don't inherit the worker's threads and
+        locks; each one runs 'preload' before its first chart.  Called by 'getExecutor' once per worker, and again
+        after 'restart'.
+
+        :return:
+            concurrent.futures.ProcessPoolExecutor
+        """
+        context = multiprocessing.get_context("spawn")
+        if self.executable != "":
+            context.set_executable(self.executable)
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                                          initializer=preload)
+        self.logger.debug("renderPool: Started %s rendering processes", self.processes)
+        return executor
+
+    def restart(self, executor):
+        """
+        Stop the processes of a pool which timed out or crashed.  A new pool is started by the next render.
+
+        :param executor:
+            The failed pool.  If it was already replaced by another thread, nothing is done.
+        :return:
+            None
+        """
+        if not self.executor.discard(executor):
+            return
+        with self.lock:
+            self.counters['restarts'] += 1
+
+        # ProcessPoolExecutor can't cancel a running call; terminate its processes so a stuck render is stopped
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+
+    def render(self, data, title):
+        """
+        Render a health chart in one of the pool processes
+
+        :param data:
+            Structured health data.  See dnaCenter.drawHealthChart for the dictionary structure.
+        :param title:
+            Title of the chart
+        :return:
+            PNG bytes.  Raises RuntimeError if the chart can't be rendered (queue full, timeout or crash).
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.counters['rejected'] += 1
+            raise RuntimeError("Too many charts waiting to be rendered")
+
+        started = time.monotonic()
+        executor = self.getExecutor()
+
+        try:
+            png = executor.submit(renderPng, data, title).result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            with self.lock:
+                self.counters['timeouts'] += 1
+            self.restart(executor)
+            raise RuntimeError("Chart not rendered within {} seconds".format(self.timeout))
+        except BrokenProcessPool as e:
+            with self.lock:
+                self.counters['crashes'] += 1
+            self.restart(executor)
+            raise RuntimeError("Rendering process failed: {}".format(e))
+        finally:
+            self.slots.release()
+
+        elapsed = time.monotonic() - started
+        with self.lock:
+            self.counters['rendered'] += 1
+            self.counters['rendertotal'] += elapsed
+            self.counters['rendermax'] = max(self.counters['rendermax'], elapsed)
+
+        return png
+
+    def getStats(self):
+        """
+        Report the pool counters for this process
+
+        :return:
+            Dictionary containing render counts, failures, restarts and render latency (seconds)
+        """
+        with self.lock:
+            stats = dict(self.counters)
+
+        stats['processes'] = self.processes
+        stats['queuesize'] = self.queuesize
+        stats['renderavg'] = stats['rendertotal'] / stats['rendered'] if stats['rendered'] else 0.0
+
+        return stats
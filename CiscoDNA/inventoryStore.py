@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Local copy of the network device inventory, stored in an SQLite database so device lookups (by hostname, serial
+number, MAC address or management IP address) can be answered without calling Cisco DNA Center.  The database
+file is shared by all uWSGI workers; a lock file makes sure only one of them synchronizes it at a time.
+
+"""
+import json
+import time
+import fcntl
+import sqlite3
+
+
+class inventoryStore:
+
+    # Device fields which can be looked up.  Values are stored lowercase in indexed columns.
+    lookupFields = ('hostname', 'serialNumber', 'macAddress', 'managementIpAddress')
+
+    def __init__(self, filename):
+        """
+        Class initialization.  The database and its tables are created if they don't exist.
+
+        :param filename:
+            Full path of the SQLite database file
+        """
+        self.filename = filename
+        self.lockfile = "{}.lock".format(filename)
+
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS devices (id TEXT PRIMARY KEY, hostname TEXT, "
+                         "serialnumber TEXT, macaddress TEXT, managementipaddress TEXT, lastupdate INTEGER, "
+                         "data TEXT)")
+            for field in self.lookupFields:
+                conn.execute("CREATE INDEX IF NOT EXISTS devices_{0} ON devices ({0})".format(field.lower()))
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.close()
+
+    def connect(self):
+        """
+        Open a new connection to the database.  Connections are short-lived so they may be used from any thread.
+
+        :return:
+            sqlite3 connection
+        """
+        return sqlite3.connect(self.filename, timeout=30)
+
+    def getLastSync(self):
+        """
+        Get the time of the last completed synchronization
+
+        :return:
+            Epoch time in seconds, or 0 if the store was never synchronized
+        """
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'lastsync'").fetchone()
+        finally:
+            conn.close()
+
+        return float(row[0]) if row is not None else 0
+
+    def acquireSyncLock(self, wait=False):
+        """
+        Try to become the (only) process / thread synchronizing the store.
+
+        :param wait:
+            Wait for a running synchronization to finish instead of returning immediately
+        :return:
+            Open lock file to pass to 'releaseSyncLock', or None if a synchronization is already running
+        """
+        lock = open(self.lockfile, 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            lock = None
+
+        return lock
+
+    def releaseSyncLock(self, lock):
+        """
+        Release the lock obtained by 'acquireSyncLock'
+
+        :param lock:
+            Open lock file
+        :return:
+            None
+        """
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+    def sync(self, pages):
+        """
+        Synchronize the store with the device inventory.  Only devices which are new or whose 'lastUpdateTime'
+        (or 'lastUpdated') changed are written; devices no longer in the inventory are removed.
+
+        :param pages:
+            Iterable of device lists, as returned by dnaCenter.getInventoryPages
+        :return:
+            Tuple of (devices written, devices removed)
+        """
+        written = 0
+        conn = self.connect()
+
+        try:
+            with conn:
+                known = dict(conn.execute("SELECT id, lastupdate FROM devices").fetchall())
+                seen = set()
+
+                for page in pages:
+                    for device in page:
+                        deviceid = device['id']
+                        lastupdate = device.get('lastUpdateTime') or device.get('lastUpdated')
+                        seen.add(deviceid)
+
+                        if deviceid in known and known[deviceid] == lastupdate:
+                            continue
+
+                        values = [str(device.get(field) or "").lower() for field in self.lookupFields]
+                        conn.execute("INSERT OR REPLACE INTO devices (id, hostname, serialnumber, macaddress, "
+                                     "managementipaddress, lastupdate, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     [deviceid] + values + [lastupdate, json.dumps(device)])
+                        written += 1
+
+                removed = [(deviceid,) for deviceid in known if deviceid not in seen]
+                conn.executemany("DELETE FROM devices WHERE id = ?", removed)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('lastsync', ?)", (str(time.time()),))
+        finally:
+            conn.close()
+
+        return written, len(removed)
+
+    def find(self, field, value):
+        """
+        Find devices by one of the lookup fields
+
+        :param field:
+            One of 'lookupFields'
+        :param value:
+            Value to find (not case-sensitive)
+        :return:
+            List of devices (dictionaries as returned by the network-device API)
+        """
+        if field not in self.lookupFields:
+            raise ValueError("Devices can't be looked up by {}".format(field))
+
+        conn = self.connect()
+        try:
+            rows = conn.execute("SELECT data FROM devices WHERE {} = ?".format(field.lower()),
+                                (value.lower(),)).fetchall()
+        finally:
+            conn.close()
+
+        return [json.loads(row[0]) for row in rows]
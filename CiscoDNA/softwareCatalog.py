@@ -0,0 +1,135 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+In-memory catalog of the software images imported into Cisco DNA Center.  The dnaCenter class loads the image
+importation list into the catalog, which keeps indexes by family (platform), CCO-recommended flag and version so
+the software image commands can be answered without calling Cisco DNA Center.
+
+"""
+import time
+import threading
+from collections import defaultdict
+
+
+class softwareCatalog:
+
+    def __init__(self, ttl=600):
+        """
+        Class initialization.  The catalog is empty (and stale) until 'load' is called.
+
+        :param ttl:
+            Number of seconds the loaded images are considered current
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.loaded = 0
+        self.images = list()
+        self.families = list()
+        self.byFamily = dict()
+        self.byVersion = dict()
+        self.ccoImages = list()
+        self.ccoByFamily = dict()
+
+    def isStale(self):
+        """
+        Check whether the catalog must be (re)loaded
+
+        :return:
+            True if the catalog was never loaded or is older than the TTL, False otherwise
+        """
+        return time.time() - self.loaded > self.ttl
+
+    def load(self, images, ccoimages, loaded=None):
+        """
+        Replace the catalog contents and rebuild the indexes.  Family lookups are not case-sensitive.
+
+        :param images:
+            List of images returned by the image importation API
+        :param ccoimages:
+            List of CCO-recommended images returned by the image importation API (isCCORecommended=true)
+        :param loaded:
+            Time (epoch seconds) the images were obtained from Cisco DNA Center.  If not given, use the current time.
+        :return:
+            None
+        """
+        families = dict()
+        byFamily = defaultdict(list)
+        byVersion = defaultdict(list)
+        ccokeys = set(image.get('imageUuid', image['name']) for image in ccoimages)
+        cco = list()
+        ccoByFamily = defaultdict(list)
+
+        for image in images:
+            family = image['family']
+            families[family.lower()] = family
+            byFamily[family.lower()].append(image)
+            byVersion[image.get('version')].append(image)
+            if image.get('imageUuid', image['name']) in ccokeys:
+                cco.append(image)
+                ccoByFamily[family.lower()].append(image)
+
+        with self.lock:
+            self.images = images
+            self.families = sorted(families.values())
+            self.byFamily = dict(byFamily)
+            self.byVersion = dict(byVersion)
+            self.ccoImages = cco
+            self.ccoByFamily = dict(ccoByFamily)
+            self.loaded = loaded if loaded is not None else time.time()
+
+    def getFamilies(self):
+        """
+        Get the image families (platforms) in the catalog
+
+        :return:
+            Sorted list of family names
+        """
+        with self.lock:
+            return list(self.families)
+
+    def getImages(self, family="", cco=False):
+        """
+        Get the images in the catalog, optionally for one family and / or CCO-recommended only
+
+        :param family:
+            Image family (platform).  If empty, images for all families are returned.
+        :param cco:
+            Only return CCO-recommended images
+        :return:
+            List of images
+        """
+        with self.lock:
+            if family != "" and cco:
+                images = self.ccoByFamily.get(family.lower(), [])
+            elif family != "":
+                images = self.byFamily.get(family.lower(), [])
+            elif cco:
+                images = self.ccoImages
+            else:
+                images = self.images
+
+        return list(images)
+
+    def getImagesByVersion(self, version):
+        """
+        Get the images in the catalog for a software version
+
+        :param version:
+            Software version
+        :return:
+            List of images
+        """
+        with self.lock:
+            return list(self.byVersion.get(version, []))
@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+               https://developer.cisco.com/docs/licenses
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Date / time parsing for command modifiers such as 'show network health at <time>'.
+
+The common phrasings (ISO 8601, HH:MM, 9am, today / yesterday, 'N minutes ago') are handled by precompiled regular
+expressions.  Anything else is passed to dateparser, restricted to the languages set in the config file, which is
+much slower since it tries many formats.  Results are memoized per phrase and minute.
+
+All returned times are naive datetimes in the local timezone, like those returned by dateparser.
+
+"""
+from . import dnaConfig
+import re
+import time
+import datetime
+from functools import lru_cache
+
+# Time of day: 06:21, 18:00:30, 9am, 9:30 pm
+timeOfDay = r'(?P<hour>\d{1,2})(?::(?P<minute>\d{2})(?::(?P<second>\d{2}))?)?\s*(?P<ampm>am|pm)?'
+
+isoPattern = re.compile(r'^\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$')
+dayPattern = re.compile(r'^(?:(?P<day>today|yesterday)\s*(?:at\s+)?)?(?:%s)?$' % timeOfDay)
+dayAfterPattern = re.compile(r'^%s\s+(?P<day>today|yesterday)$' % timeOfDay)
+agoPattern = re.compile(r'^(?P<count>\d+)\s*(?P<unit>sec|second|min|minute|hr|hour|day|week)s?\s+ago$')
+
+agoUnits = {
+    'sec': 'seconds',
+    'second': 'seconds',
+    'min': 'minutes',
+    'minute': 'minutes',
+    'hr': 'hours',
+    'hour': 'hours',
+    'day': 'days',
+    'week': 'weeks'
+}
+
+
+def parseDayTime(match, now):
+    """
+    Convert a match of 'dayPattern' or 'dayAfterPattern' into a datetime
+
+    :param match:
+        Regular expression match object
+    :param now:
+        Current local time
+    :return:
+        datetime object, or None if the match is empty (or a bare number).  Raises ValueError if the match is not
+        a valid time of day, e.g. '13pm' or '25:00'.
+    """
+    retval = None
+    day = match.group('day')
+    hour = match.group('hour')
+
+    if day is None and hour is None:
+        return retval
+
+    # A bare number is only a time if it has minutes or am/pm, otherwise leave it to dateparser
+    if day is None and match.group('minute') is None and match.group('ampm') is None:
+        return retval
+
+    date = now
+    if day == "yesterday":
+        date = now - datetime.timedelta(days=1)
+
+    if hour is None:
+        # 'today' or 'yesterday' without a time of day
+        retval = date
+    else:
+        hour = int(hour)
+        if match.group('ampm') is not None and not 1 <= hour <= 12:
+            raise ValueError("Hour {0} is not valid with {1}".format(hour, match.group('ampm')))
+        if match.group('ampm') == "pm" and hour < 12:
+            hour += 12
+        elif match.group('ampm') == "am" and hour == 12:
+            hour = 0
+
+        retval = date.replace(hour=hour, minute=int(match.group('minute') or 0),
+                              second=int(match.group('second') or 0), microsecond=0)
+
+    return retval
+
+
+@lru_cache(maxsize=dnaConfig.dna_date_cache_size)
+def parseCached(text, minute):
+    """
+    Parse a date / time string.  Memoized per (text, minute) - 'minute' is only part of the cache key so that
+    relative phrases ('yesterday', '5 minutes ago') are parsed again once the minute changes.
+
+    :param text:
+        Lowercase, stripped date / time string
+    :param minute:
+        Current time in minutes since the epoch
+    :return:
+        datetime object, or None if the string is not a valid date / time
+    """
+    now = datetime.datetime.now()
+
+    if isoPattern.match(text):
+        try:
+            return datetime.datetime.fromisoformat(text.replace("t", " "))
+        except ValueError:
+            pass
+
+    match = dayPattern.match(text) or dayAfterPattern.match(text)
+    if match:
+        try:
+            retval = parseDayTime(match, now)
+        except ValueError:
+            # A time of day which doesn't exist - don't let dateparser guess
+            return None
+        if retval is not None:
+            return retval
+
+    match = agoPattern.match(text)
+    if match:
+        delta = datetime.timedelta(**{agoUnits[match.group('unit')]: int(match.group('count'))})
+        return now - delta
+
+    # No fast path matched - fall back to dateparser
+    import dateparser
+    return dateparser.parse(text, languages=dnaConfig.dna_date_languages)
+
+
+def parseTime(text):
+    """
+    Parse a date / time string as entered in a chat command
+
+    :param text:
+        Date / time string, e.g. '06:21', 'yesterday at 9am', '2019-06-01 18:00', '2 hours ago', 'Jan 1 at 18:00'
+    :return:
+        datetime object in local time, or None if the string is not a valid date / time
+    """
+    return parseCached(text.strip().lower(), int(time.time() // 60))
@@ -25,6 +25,14 @@ tmpdir = "{}/../tmp".format(dirpath)
 api_host = "api.ciscospark.com"
 api_port = 443
 
+# HTTP connection pool for the Webex Teams API.  Connections are kept alive and reused for the lifetime of each
+# uWSGI worker, so only the first request pays for the TCP and TLS handshakes.
+api_pool_size = 10
+
+# (connect, read) timeouts in seconds for Webex Teams API calls.  File uploads get a longer read timeout.
+api_timeout = (5, 30)
+api_upload_timeout = (5, 120)
+
 
 # TLS certificate verification boolean
 # Should always be True unless using with development systems which don't use valid certificates
@@ -63,4 +71,33 @@ botinfo = {
             'username@example.com'
         ]
     }
-}
\ No newline at end of file
+}
+
+# Outbound message sender.  Messages and file uploads of each bot are limited to 'send_rate' calls per second (with
+# bursts of up to 'send_burst') in each uWSGI worker - divide the rate Webex Teams allows by the number of workers.
+# Up to 'send_queuesize' sends may wait; messages to the same room are always sent in order.  Failed calls
+# (connection errors, HTTP 5xx) are retried 'send_retries' times after 'send_backoff' seconds, doubled on each
+# attempt.  On HTTP 429 every send of the bot waits for the Retry-After delay (at most 'send_max_retry_after').
+send_rate = 3
+send_burst = 10
+send_queuesize = 200
+send_workers = 4
+send_retries = 3
+send_backoff = 1.0
+send_max_retry_after = 60
+
+# MIME type of attachments whose type was not declared by the package which produced them, by file extension.  Other
+# files are identified by libmagic (python-magic); the last 'mime_cache_size' results are kept in each worker.
+mime_types = {
+    '.png': "image/png",
+    '.jpg': "image/jpeg",
+    '.jpeg': "image/jpeg",
+    '.gif': "image/gif",
+    '.csv': "text/csv",
+    '.txt': "text/plain",
+    '.json': "application/json",
+    '.pdf': "application/pdf",
+    '.gz': "application/gzip",
+    '.zip': "application/zip"
+}
+mime_cache_size = 256
@@ -0,0 +1,320 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Rate-limited outbound message pipeline for the Webex Teams API.  Each bot has one sender per process, with:
+- A token bucket limiting the rate of API calls
+- A bounded queue of sends, kept in order per room (messages to one room are never sent concurrently or reordered)
+- Retries with jittered exponential backoff on connection errors and server errors
+- HTTP 429 handling: the Retry-After delay pauses every send of the bot, then the call is retried
+
+"""
+import time
+import random
+import logging
+import threading
+import requests
+import processLocal
+from collections import deque
+
+
+class tokenBucket:
+
+    def __init__(self, rate, burst):
+        """
+        Class initialization.  The bucket starts full.
+
+        :param rate:
+            Number of tokens added per second
+        :param burst:
+            Maximum number of tokens in the bucket
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.pausedUntil = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available and any pause is over
+
+        :return:
+            Number of seconds spent waiting
+        """
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now < self.pausedUntil:
+                    delay = self.pausedUntil - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for a number of seconds, e.g. after the API returned a Retry-After header
+
+        :param seconds:
+            Length of the pause
+        :return:
+            None
+        """
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class webexSender:
+
+    def __init__(self, rate=3, burst=10, queuesize=200, workers=4, retries=3, backoff=1.0, maxretryafter=60,
+                 logname=__name__):
+        """
+        Class initialization.  No threads are started here - they are started on the first send so that a sender
+        created in the uWSGI master process still works in each forked worker.
+
+        :param rate:
+            Maximum sustained number of API calls per second
+        :param burst:
+            Maximum number of API calls sent back to back before the rate applies
+        :param queuesize:
+            Maximum number of sends waiting to be processed.  Once reached, new sends fail immediately.
+        :param workers:
+            Number of threads sending (to different rooms) concurrently
+        :param retries:
+            Number of times a failed call is retried
+        :param backoff:
+            Base delay in seconds before a retry, doubled on each attempt and randomized by +/- 50%
+        :param maxretryafter:
+            Upper limit on the Retry-After delay honored after HTTP 429
+        :param logname:
+            Name of the calling logger.  If not given, use the package name
+        """
+        # If the logger name was passed, append this module's name to it.  Otherwise, create a new logger with
+        # only the module name
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        self.bucket = tokenBucket(rate, burst)
+        self.queuesize = queuesize
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.maxretryafter = maxretryafter
+        self.threads = processLocal.processLocal(self.startThreads)
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+
+        # Pending sends per room, and the rooms with pending sends which no thread is working on
+        self.rooms = dict()
+        self.readyRooms = deque()
+        self.pending = 0
+
+        # Latencies are in seconds from submission to completion of the send (including retries)
+        self.counters = {
+            'sent': 0,
+            'failed': 0,
+            'rejected': 0,
+            'retries': 0,
+            'throttled': 0,
+            'latencytotal': 0.0,
+            'latencymax': 0.0
+        }
+
+    def start(self):
+        """
+        Start the sender threads if they are not running in this process (see processLocal)
+
+        :return:
+            None
+        """
+        self.threads.get()
+
+    def startThreads(self):
+        """
+        Start the sender threads with no pending sends.  Sends queued in the parent process before a fork are
+        dropped, since no thread of this process would make them.  Called once per process by 'start'.
+
+        :return:
+            List of the sender threads
+        """
+        with self.lock:
+            self.rooms = dict()
+            self.readyRooms = deque()
+            self.pending = 0
+
+        threads = list()
+        for num in range(self.workers):
+            t = threading.Thread(target=self.worker, name="webexSender-{}".format(num), daemon=True)
+            t.start()
+            threads.append(t)
+        self.logger.debug("webexSender: Started %s sender threads", self.workers)
+        return threads
+
+    def submit(self, roomid, call, wait=True):
+        """
+        Queue an API call for a room.  Calls for the same room are made one at a time, in submission order.
+
+        :param roomid:
+            Room ID the call posts to
+        :param call:
+            Function making one attempt of the API call.  Returns the requests.Response (without raising for the
+            HTTP status) and may raise requests.exceptions.RequestException.  Called again for each retry.
+        :param wait:
+            Wait for the call to complete and return its result.  Otherwise return as soon as it is queued.
+        :return:
+            The successful requests.Response (or True if not waiting), False if the call failed or the queue is full
+        """
+        self.start()
+        job = {'call': call, 'queued': time.monotonic(), 'done': threading.Event(), 'result': False}
+
+        with self.ready:
+            if self.pending >= self.queuesize:
+                self.counters['rejected'] += 1
+                self.logger.warning("webexSender: Queue is full (%s sends), refusing send to room %s",
+                                    self.queuesize, roomid)
+                return False
+
+            self.pending += 1
+            if roomid in self.rooms:
+                # A thread is working on this room (or it is already waiting) - keep the order
+                self.rooms[roomid].append(job)
+            else:
+                self.rooms[roomid] = deque([job])
+                self.readyRooms.append(roomid)
+                self.ready.notify()
+
+        if not wait:
+            return True
+
+        job['done'].wait()
+        return job['result']
+
+    def worker(self):
+        """
+        Sender thread loop.  Takes the next room with pending sends, makes its oldest call and puts the room back
+        in line if more calls are pending for it.
+
+        :return:
+            None
+        """
+        while True:
+            with self.ready:
+                while not self.readyRooms:
+                    self.ready.wait()
+                roomid = self.readyRooms.popleft()
+                job = self.rooms[roomid][0]
+
+            try:
+                job['result'] = self.send(job['call'])
+            except Exception as e:
+                self.logger.error("webexSender: Send to room %s raised an exception: %s", roomid, e, exc_info=True)
+
+            latency = time.monotonic() - job['queued']
+
+            with self.ready:
+                self.rooms[roomid].popleft()
+                self.pending -= 1
+                if self.rooms[roomid]:
+                    self.readyRooms.append(roomid)
+                    self.ready.notify()
+                else:
+                    del self.rooms[roomid]
+
+                self.counters['sent' if job['result'] is not False else 'failed'] += 1
+                self.counters['latencytotal'] += latency
+                self.counters['latencymax'] = max(self.counters['latencymax'], latency)
+
+            job['done'].set()
+
+    def send(self, call):
+        """
+        Make an API call, honoring the rate limit and retrying on throttling, connection errors and server errors
+
+        :param call:
+            Function making one attempt of the API call (see 'submit')
+        :return:
+            The successful requests.Response, or False if the call failed
+        """
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.lock:
+                    self.counters['retries'] += 1
+
+            self.bucket.acquire()
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+            try:
+                r = call()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.logger.warning("webexSender: Attempt %s failed: %s", attempt + 1, e)
+                time.sleep(delay)
+                continue
+            except requests.exceptions.RequestException as e:
+                self.logger.error("webexSender: Request Exception: %s", e, exc_info=True)
+                return False
+
+            if r.status_code == 429:
+                try:
+                    delay = min(float(r.headers.get('Retry-After', delay)), self.maxretryafter)
+                except ValueError:
+                    pass
+                with self.lock:
+                    self.counters['throttled'] += 1
+                self.logger.warning("webexSender: Throttled by the API, pausing sends for %.1f seconds", delay)
+                self.bucket.pause(delay)
+            elif r.status_code >= 500:
+                self.logger.warning("webexSender: Attempt %s failed: HTTP %s", attempt + 1, r.status_code)
+                time.sleep(delay)
+            elif r.status_code >= 400:
+                self.logger.error("webexSender: Http Error: %s %s", r.status_code, r.text)
+                return False
+            else:
+                return r
+
+        self.logger.error("webexSender: Giving up after %s attempts", self.retries + 1)
+        return False
+
+    def getStats(self):
+        """
+        Report the sender counters for this process
+
+        :return:
+            Dictionary containing queue depth, send counts, retries, throttle (HTTP 429) count and send latency
+            (seconds)
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['queuedepth'] = self.pending
+
+        finished = stats['sent'] + stats['failed']
+        stats['queuesize'] = self.queuesize
+        stats['latencyavg'] = stats['latencytotal'] / finished if finished else 0.0
+
+        return stats
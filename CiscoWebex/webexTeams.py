@@ -16,14 +16,75 @@ or implied.
 """
 
 from . import webexConfig
+from . import webexSender
+import processLocal
+import os
+import io
+import contextlib
+import collections
 import requests
+import threading
 import hmac
 import hashlib
-import magic
 import logging
 import json
+from requests.adapters import HTTPAdapter
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
+# orjson parses JSON several times faster than the json module.  It is optional: if it is not installed, the json
+# module is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loadJson(data):
+    """
+    Parse a JSON document with the fastest available backend
+
+    :param data:
+        JSON document (bytes or str)
+    :return:
+        The decoded document.  Raises ValueError if it is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def createSession(logger):
+    """
+    Create the HTTP session (keep-alive connection pool) used for the Webex Teams API
+
+    :param logger:
+        Logger of the calling instance
+    :return:
+        requests.Session object
+    """
+    logger.debug("createSession: Creating HTTP connection pool (size %s)", webexConfig.api_pool_size)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=webexConfig.api_pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def loadMagic(logger):
+    """
+    Load the libmagic database used to identify the MIME type of attachments.  python-magic is only imported here,
+    so it is not needed unless an attachment has an unknown extension.
+
+    :param logger:
+        Logger of the calling instance
+    :return:
+        magic.Magic object
+    """
+    import magic
+    logger.debug("loadMagic: Loading the magic database")
+    return magic.Magic(mime=True)
+
+
 class webexTeams:
 
     # Define global HTTP headers for requests.  Authorization via bearer token will be initialized during __init__
@@ -37,7 +98,21 @@ class webexTeams:
     urlMessage = "{}/v1/messages".format(urlBase)
     urlPeople = "{}/v1/people".format(urlBase)
 
-    def __init__( self, botname, logname=__name__, tmp=webexConfig.tmpdir):
+    # Keep-alive connection pool shared by every instance in this worker process (see processLocal, so each forked
+    # uWSGI worker opens its own sockets)
+    session = processLocal.processLocal(createSession)
+
+    # Outbound message senders (rate limit, retries and per-room ordering), one per bot in this worker process
+    senderLock = threading.Lock()
+    senders = dict()
+
+    # libmagic handle shared by every instance in this worker process (loading the magic database is slow), and
+    # the MIME types it identified, keyed by file path, size and modification time
+    magicLock = threading.Lock()
+    magic = processLocal.processLocal(loadMagic)
+    mimeCache = collections.OrderedDict()
+
+    def __init__( self, botname, logname=__name__, tmp=webexConfig.tmpdir, personcache=None):
         """
         Class initialization.
 
@@ -47,10 +122,13 @@ class webexTeams:
             Name of the calling logger.  If not given, use the package name
         :param tmp:
             Directory for storing temporary files.  If not given, use value from config file.
+        :param personcache:
+            Optional cache object (with get/set methods) used to remember requestor validation results
         """
 
         # If the logger name was passed, append this package's name to it.  Otherwise, create a new logger with
-        # only the package name
+        # only the package name.  The caller's name is kept for the loggers of the helper objects.
+        self.logname = logname
         if logname != __name__:
             logname = "{0}.{1}".format(logname, __name__)
         self.logger = logging.getLogger(logname)
@@ -59,10 +137,23 @@ class webexTeams:
         # - Pull in the config for this bot (specified by 'botname')
         # - Set the tmp folder for file attachments
         # - Set the global Authorization bearer token value in the global headers
+        self.botname = botname
         self.botConfig = webexConfig.botinfo[botname]
         self.tmpfolder = tmp
+        self.personCache = personcache
         self.globalHeaders['Authorization'] = "Bearer {}".format(self.botConfig['bearer'])
 
+    @classmethod
+    def preload(cls):
+        """
+        Import the dependencies which are otherwise loaded on first use (python-magic).  Intended to run once in the
+        uWSGI master process so that forked workers share the loaded modules copy-on-write.
+
+        :return:
+            None
+        """
+        import magic
+
     def __enter__(self):
         """
         Enter method - allows us to use 'with' when instantiating this class and do any cleanup at the end via the
@@ -73,6 +164,51 @@ class webexTeams:
         """
         return self
 
+    def getSession(self):
+        """
+        Return the worker-lifetime HTTP session.  Connections (and their TLS sessions) to the Webex Teams API are
+        kept alive in the session's pool and reused by subsequent requests.
+
+        :return:
+            requests.Session object for this process
+        """
+        return webexTeams.session.get(self.logger)
+
+    def getSender(self):
+        """
+        Return the outbound message sender of this bot, creating it on first use.  See webexSender for details.
+
+        :return:
+            webexSender object for this bot and process
+        """
+        with self.senderLock:
+            if self.botname not in webexTeams.senders:
+                sender = webexSender.webexSender(rate=webexConfig.send_rate,
+                                                 burst=webexConfig.send_burst,
+                                                 queuesize=webexConfig.send_queuesize,
+                                                 workers=webexConfig.send_workers,
+                                                 retries=webexConfig.send_retries,
+                                                 backoff=webexConfig.send_backoff,
+                                                 maxretryafter=webexConfig.send_max_retry_after,
+                                                 logname=self.logname
+                                                 )
+                webexTeams.senders[self.botname] = sender
+
+        return webexTeams.senders[self.botname]
+
+    @classmethod
+    def getSenderStats(cls):
+        """
+        Report the outbound message sender counters of each bot in this process
+
+        :return:
+            Dictionary keyed by bot name (see webexSender.getStats)
+        """
+        with cls.senderLock:
+            senders = dict(cls.senders)
+
+        return {botname: sender.getStats() for botname, sender in senders.items()}
+
     def cleanHeaders(self, headers, addHeaders):
         """
         Take the default headers and compare to items in the additional headers
@@ -92,7 +228,7 @@ class webexTeams:
 
         return (headers)
 
-    def urlget(self, url, addHeaders={}):
+    def urlget(self, url, addHeaders={}, timeout=None):
         """
         Generic 'GET' method for HTTP requests.  Will attempt a GET request and catch exceptions.
 
@@ -100,6 +236,8 @@ class webexTeams:
             URL to perform HTTP GET
         :param addHeaders:
             Dictionary containing additional headers (if needed)
+        :param timeout:
+            (connect, read) timeout in seconds.  If not given, use value from config file.
         :return:
             The server's response if successful, otherwise False
         """
@@ -112,11 +250,15 @@ class webexTeams:
         headers.update(addHeaders)
         headers = self.cleanHeaders(headers, addHeaders)
 
+        if timeout is None:
+            timeout = webexConfig.api_timeout
+
         try:
-            r = requests.get(url, headers=headers, verify=webexConfig.sslverify)
-            self.logger.debug("urlget: HTTP GET sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
+            r = self.getSession().get(url, headers=headers, verify=webexConfig.sslverify, timeout=timeout)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("urlget: HTTP GET sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
             r.raise_for_status()
-            retval = r.json()
+            retval = loadJson(r.content)
         except requests.exceptions.HTTPError as errh:
             self.logger.error("urlget: Http Error: %s", errh, exc_info=True)
         except requests.exceptions.ConnectionError as errc:
@@ -125,10 +267,12 @@ class webexTeams:
             self.logger.error("urlget: Timeout Error: %s", errt, exc_info=True)
         except requests.exceptions.RequestException as err:
             self.logger.error("urlget: Generic Request Exception: %s", err, exc_info=True)
+        except ValueError as e:
+            self.logger.error("urlget: JSON Decode error caught: %s", e, exc_info=True)
 
         return retval
 
-    def urlpost(self, url, data, addHeaders={}):
+    def urlpost(self, url, data, addHeaders={}, timeout=None):
         """
         Generic HTTP POST wrapper which catches exceptions.
 
@@ -138,6 +282,8 @@ class webexTeams:
             What to POST
         :param addHeaders:
             Dictionary containing additional headers if needed
+        :param timeout:
+            (connect, read) timeout in seconds.  If not given, use value from config file.
         :return:
             The server's response if successful, otherwise False
         """
@@ -153,11 +299,15 @@ class webexTeams:
         if headers['Content-Type'] == "application/json":
             data = json.dumps(data)
 
+        if timeout is None:
+            timeout = webexConfig.api_timeout
+
 
         try:
             self.logger.debug("Sending HTTP POST to %s", url)
-            r = requests.post(url, data, headers=headers, verify=webexConfig.sslverify)
-            self.logger.debug("urlpost: HTTP POST sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
+            r = self.getSession().post(url, data, headers=headers, verify=webexConfig.sslverify, timeout=timeout)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("urlpost: HTTP POST sent:\n\tURL: %s\n\tResponse: %s", url, r.text)
             r.raise_for_status()
             retval = r
         except requests.exceptions.HTTPError as errh:
@@ -171,7 +321,41 @@ class webexTeams:
 
         return retval
 
-    def sendMessage( self, roomid, message, richmessage=""):
+    def postAttempt(self, url, data, addHeaders={}, timeout=None):
+        """
+        Make a single HTTP POST attempt for the outbound message sender.  Unlike 'urlpost', HTTP errors are not
+        caught so the sender can act on the status code (e.g. 429) and retry.
+
+        :param url:
+            URL for the HTTP POST
+        :param data:
+            What to POST
+        :param addHeaders:
+            Dictionary containing additional headers if needed
+        :param timeout:
+            (connect, read) timeout in seconds.  If not given, use value from config file.
+        :return:
+            requests.Response object.  Raises requests.exceptions.RequestException if the request can't be sent.
+        """
+        headers = self.globalHeaders.copy()
+        headers.update(addHeaders)
+        headers = self.cleanHeaders(headers, addHeaders)
+
+        if headers['Content-Type'] == "application/json":
+            data = json.dumps(data)
+
+        if timeout is None:
+            timeout = webexConfig.api_timeout
+
+        self.logger.debug("Sending HTTP POST to %s", url)
+        r = self.getSession().post(url, data, headers=headers, verify=webexConfig.sslverify, timeout=timeout)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("postAttempt: HTTP POST sent:\n\tURL: %s\n\tResponse: %s %s", url, r.status_code,
+                              r.text)
+
+        return r
+
+    def sendMessage( self, roomid, message, richmessage="", wait=True):
         """
         Send a message to the specified roomid.  The message is expected; if a rich-formatted message is given then
         also include that for client which support rich text (e.g. Webex Teams client)
@@ -182,8 +366,11 @@ class webexTeams:
             Non-rich text message to send
         :param richmessage:
             Optional - rich formatted text to send
+        :param wait:
+            Wait until the message is sent.  Otherwise return once it is queued (messages to the same room are still
+            sent in order).
         :return:
-            The server's response if successful, otherwise False
+            True if the message was sent (or queued, if not waiting), False otherwise
         """
         retval = False
         webexmsg = {
@@ -198,59 +385,119 @@ class webexTeams:
         self.logger.debug("sendMessage: Sending message:\n\tRoom ID: %s\n\tMessage:%s", roomid, message)
         # url = self.urlMessage
 
-        if self.urlpost(self.urlMessage, webexmsg) != False:
+        if self.getSender().submit(roomid, lambda: self.postAttempt(self.urlMessage, webexmsg), wait=wait) != False:
             retval = True
 
         return retval
 
-    def getMimeType(self, file):
+    def getMimeType(self, file, content=None, filename=""):
         """
-        Given a file, use the 'magic' module (from python-magic) to try to identify the file's MIME type.  Used when
-        attaching a file to a Webex Teams message.
+        Identify the MIME type of a file attachment whose type was not declared.  Known file extensions are looked
+        up in the config; other files are identified by the 'magic' module (from python-magic), and the result is
+        cached.
 
         :param file:
-            Full path of the file needing a MIME type
+            Full path of the file needing a MIME type.  Ignored if 'content' is given.
+        :param content:
+            Optional contents of the attachment: bytes or a seekable binary file object
+        :param filename:
+            Name of the attachment, used for the extension lookup instead of the path if given
         :return:
             MIME type of the specified file
         """
-        mime = magic.Magic(mime=True)
-        self.logger.debug("getMimeType: File %s has MIME type of: %s", file, mime)
-        return(mime.from_file(file))
+        extension = os.path.splitext(filename if filename != "" else file)[1].lower()
+        mimetype = webexConfig.mime_types.get(extension)
+        if mimetype is not None:
+            self.logger.debug("getMimeType: Extension %s has MIME type of: %s", extension, mimetype)
+            return mimetype
+
+        if content is None:
+            stat = os.stat(file)
+            cachekey = (file, stat.st_size, stat.st_mtime)
+            with self.magicLock:
+                mimetype = webexTeams.mimeCache.get(cachekey)
+                if mimetype is not None:
+                    webexTeams.mimeCache.move_to_end(cachekey)
+                    return mimetype
+        elif isinstance(content, (bytes, bytearray)):
+            sample = bytes(content[:2048])
+        else:
+            content.seek(0)
+            sample = content.read(2048)
+
+        # A libmagic handle may not be used by two threads at once
+        with self.magicLock:
+            if content is None:
+                mimetype = webexTeams.magic.get(self.logger).from_file(file)
+                webexTeams.mimeCache[cachekey] = mimetype
+                while len(webexTeams.mimeCache) > webexConfig.mime_cache_size:
+                    webexTeams.mimeCache.popitem(last=False)
+            else:
+                mimetype = webexTeams.magic.get(self.logger).from_buffer(sample)
 
+        self.logger.debug("getMimeType: File %s has MIME type of: %s", filename if filename != "" else file, mimetype)
+        return mimetype
 
-    def attachFile(self, roomid, file, message):
+
+    def attachFile(self, roomid, file, message, content=None, filename="", mimetype=""):
         """
-        Send a file attachment to the specified Webex Teams room.  Get the MIME type of the file, update
-        The Content-Type header, and attach the file with a caption
+        Send a file attachment to the specified Webex Teams room.  The attachment is either a file on disk or
+        contents held in memory, which are streamed into the upload without touching the disk.  Get the MIME type
+        of the file (unless declared), update the Content-Type header, and attach the file with a caption
 
         :param roomid:
             Room ID where the file will be posted
         :param file:
-            Path and filename of the file attachment
+            Path and filename of the file attachment.  Ignored if 'content' is given.
         :param message:
             Caption sent with the file attachment
+        :param content:
+            Optional contents of the attachment: bytes or a seekable binary file object (read from the start)
+        :param filename:
+            Name of the attachment shown in Webex Teams.  If not given, the caption is used.
+        :param mimetype:
+            MIME type of the attachment.  If not given, it is identified from the extension or contents.
         :return:
             True on success, False otherwise
         """
         retval = False
-        media = MultipartEncoder(
-                                    {
-                                        'roomId': roomid,
-                                        'text': message,
-                                        'files': (
-                                            message,
-                                            open(file, 'rb'),
-                                            self.getMimeType(file)
-                                        )
-                                    }
-                                 )
-
-        # Set the Content-Type header to send to the POST wrapper
-        headers = {'Content-Type': media.content_type}
-        # url = self.urlMessage
-        self.logger.debug("attachFile: Sending file:\n\tFilename: %s\n\tRoom ID: %s\n\tMessage:%s", file, roomid, message)
-
-        if self.urlpost(self.urlMessage, media, headers) != False:
+        if mimetype == "":
+            mimetype = self.getMimeType(file, content=content, filename=filename)
+        if filename == "":
+            filename = message
+
+        def upload():
+            # The multipart body is a stream, so it is built again (and the attachment read again from the start)
+            # for each attempt
+            with contextlib.ExitStack() as stack:
+                if content is None:
+                    attachment = stack.enter_context(open(file, 'rb'))
+                elif isinstance(content, (bytes, bytearray)):
+                    attachment = io.BytesIO(content)
+                else:
+                    attachment = content
+                    attachment.seek(0)
+
+                media = MultipartEncoder(
+                                            {
+                                                'roomId': roomid,
+                                                'text': message,
+                                                'files': (
+                                                    filename,
+                                                    attachment,
+                                                    mimetype
+                                                )
+                                            }
+                                         )
+
+                # Set the Content-Type header to send to the POST wrapper
+                headers = {'Content-Type': media.content_type}
+                return self.postAttempt(self.urlMessage, media, headers, timeout=webexConfig.api_upload_timeout)
+
+        self.logger.debug("attachFile: Sending file:\n\tFilename: %s\n\tRoom ID: %s\n\tMessage:%s",
+                          file if content is None else filename, roomid, message)
+
+        if self.getSender().submit(roomid, upload) != False:
             retval = True
 
         return retval
@@ -306,46 +553,118 @@ class webexTeams:
         return retval
 
 
-    def validateMessage(self, msg, headers): #, botconfig):
+    def validateSignature(self, msg, headers):
         """
-        Validate incoming messages.  Check the X-Spark-Signature against our secret key for the webhook,
-        Verify the person is allowed to send messages to the bot, and verify that the requestor is not the bot itself
-        If all steps pass, the message is valid and may be acted upon.
+        Validate the X-Spark-Signature of an incoming message against our secret key for the webhook.  This does
+        not require any API calls and may be performed before the webhook is acknowledged.
 
         :param msg:
-            RAW incoming message received by the webhook
+            RAW incoming message received by the webhook (bytes, exactly as received, or str)
         :param headers:
             The request headers received by the webhook
         :return:
-            True if message is valid, False otherwise.
+            True if the signature is valid, False otherwise.
         """
         retval = False
 
-        hashedsig = hmac.new(bytes(self.botConfig['bot_secret'].encode("utf-8")),
-                             bytes(msg.encode("utf-8")), hashlib.sha1
-                             )
-        validatedsig = hashedsig.hexdigest()
-        if validatedsig == headers.get( 'X-Spark-Signature'):
-            self.logger.debug("validateMessage: Header validation succeeded.  Continue validation...")
-            msg = json.loads(msg)
-            requestor = msg['data']['personEmail']
-            if requestor != self.botConfig['bot_email']:
-                self.logger.debug("validateMessage: Requestor is not the same as the bot.  Continue validation...")
+        if isinstance(msg, str):
+            msg = msg.encode("utf-8")
+
+        hashedsig = hmac.new(self.botConfig['bot_secret'].encode("utf-8"), msg, hashlib.sha1)
+        validatedsig = hashedsig.hexdigest().encode("ascii")
+        # Constant-time comparison, so the response time doesn't reveal how much of a forged signature is correct
+        if hmac.compare_digest(validatedsig, headers.get('X-Spark-Signature', "").encode("utf-8")):
+            self.logger.debug("validateSignature: Header validation succeeded.")
+            retval = True
+        else:
+            self.logger.debug("validateSignature: Header validation failed.  Message not valid.")
+        return retval
+
+    def decodeWebhook(self, msg, headers):
+        """
+        Validate the signature of an incoming message, then decode it.  The body is parsed only once, and only
+        if the signature is valid, so forged or replayed-with-garbage requests cost no JSON work.
+
+        :param msg:
+            RAW incoming message received by the webhook (bytes, exactly as received)
+        :param headers:
+            The request headers received by the webhook
+        :return:
+            The decoded message if the signature is valid and the message is a JSON object, None otherwise.
+        """
+        retval = None
+
+        if self.validateSignature(msg, headers):
+            try:
+                retval = loadJson(msg)
+            except ValueError as e:
+                self.logger.warning("decodeWebhook: Signed message is not valid JSON: %s", e)
+            else:
+                if not isinstance(retval, dict):
+                    self.logger.warning("decodeWebhook: Signed message is not a JSON object")
+                    retval = None
+        return retval
+
+    def validateRequestor(self, msg):
+        """
+        Verify the person is allowed to send messages to the bot, and verify that the requestor is not the bot itself
+        If a person cache was given, only the validation result is cached (keyed by bot and person ID) so repeat
+        requestors don't need a person lookup.
+
+        :param msg:
+            Incoming message received by the webhook, already decoded from JSON
+        :return:
+            True if the requestor is valid, False otherwise.
+        """
+        retval = False
+
+        requestor = msg['data']['personEmail']
+        if requestor != self.botConfig['bot_email']:
+            self.logger.debug("validateRequestor: Requestor is not the same as the bot.  Continue validation...")
+            cachekey = "{0}:{1}:{2}".format(self.botname, msg['data']['personId'], requestor)
+            verdict = self.personCache.get(cachekey) if self.personCache is not None else None
+
+            if verdict is not None:
+                self.logger.debug("validateRequestor: Using cached validation result: %s", verdict)
+                retval = verdict
+            else:
                 person = self.getPerson(msg['data']['personId'])
-                self.logger.debug("validateMessage: Person org ID:\n%s", person['orgId'])
                 if person != False:
+                    self.logger.debug("validateRequestor: Person org ID:\n%s", person['orgId'])
                     if person['orgId'] == self.botConfig['bot_org_id']\
                             or requestor in self.botConfig['auth_users']:
-                        self.logger.debug("validateMessage: Requestor has been validated.  Validation complete.")
+                        self.logger.debug("validateRequestor: Requestor has been validated.  Validation complete.")
                         retval = True
                     else:
-                        self.logger.info("validateMessage: Validation of the requestor failed.  Message not valid.")
+                        self.logger.info("validateRequestor: Validation of the requestor failed.  Message not valid.")
+
+                    # Only cache a result obtained from the API - lookup failures are retried on the next message
+                    if self.personCache is not None:
+                        self.personCache.set(cachekey, retval)
                 else:
-                    self.logger.warning("validateMessage: Problem getting person from message - check logfile for details.")
-            else:
-                self.logger.debug("validateMessage: Requestor is the same as the bot.  Message not valid.")
+                    self.logger.warning("validateRequestor: Problem getting person from message - check logfile for details.")
         else:
-            self.logger.debug("validateMessage: Header validation failed.  Message not valid.")
+            self.logger.debug("validateRequestor: Requestor is the same as the bot.  Message not valid.")
+        return retval
+
+    def validateMessage(self, msg, headers): #, botconfig):
+        """
+        Validate incoming messages.  Check the X-Spark-Signature against our secret key for the webhook,
+        Verify the person is allowed to send messages to the bot, and verify that the requestor is not the bot itself
+        If all steps pass, the message is valid and may be acted upon.
+
+        :param msg:
+            RAW incoming message received by the webhook
+        :param headers:
+            The request headers received by the webhook
+        :return:
+            True if message is valid, False otherwise.
+        """
+        retval = False
+
+        postdata = self.decodeWebhook(msg, headers)
+        if postdata is not None:
+            retval = self.validateRequestor(postdata)
         return retval
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -354,6 +673,6 @@ class webexTeams:
         Any object cleanup tasks go here.
 
         :return:
-            True (for now)
+            False, so exceptions raised inside the 'with' block reach the caller
         """
-        return True
+        return False
@@ -0,0 +1,386 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+This file contains a bounded, expiring (TTL / LRU) cache used by the apiHandler and passed to the packages which
+need one.  When running under uWSGI, a cache may be shared by all workers by defining a uWSGI cache with the same
+name in uwsgi.ini, e.g.:
+
+    cache2 = name=persons,items=1000,blocksize=128,purge_lru=1
+
+Outside of uWSGI (or if the uWSGI cache is not defined) each process keeps its own copy.
+
+It also contains the file-based store for dataset snapshots written by the apiScheduler.
+
+"""
+import os
+import json
+import time
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+
+# The uwsgi module only exists when running inside the uWSGI application server
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+class ttlCache:
+
+    def __init__(self, name, maxsize=1000, ttl=300, shared=False, maxbytes=None, logname=__name__):
+        """
+        Class initialization.
+
+        :param name:
+            Name of the cache.  If 'shared' is True, also the name of the uWSGI cache to use.
+        :param maxsize:
+            Maximum number of entries kept in the process-local cache.  The least recently used entry is evicted
+            first.  The uWSGI cache size is set in uwsgi.ini.
+        :param ttl:
+            Default number of seconds an entry is valid
+        :param shared:
+            Use the uWSGI cache 'name' (if available) so the entries are shared by all workers
+        :param maxbytes:
+            Optional limit on the total size of bytes/string values in the process-local cache.  The least
+            recently used entries are evicted until the cache fits.
+        :param logname:
+            Name of the calling logger.  If not given, use the package name
+        """
+        # If the logger name was passed, append this module's name to it.  Otherwise, create a new logger with
+        # only the module name
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.ttl = ttl
+        self.shared = shared and uwsgi is not None and hasattr(uwsgi, 'cache_update')
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+        if shared and not self.shared:
+            self.logger.debug("ttlCache: uWSGI cache not available, %s cache is local to this process", name)
+
+    def count(self, counter):
+        """
+        Increment one of the cache counters
+
+        :param counter:
+            Name of the counter
+        :return:
+            None
+        """
+        with self.lock:
+            self.counters[counter] += 1
+
+    def get(self, key):
+        """
+        Get an entry from the cache
+
+        :param key:
+            String key of the entry
+        :return:
+            The cached value, or None if the key is not cached or has expired
+        """
+        retval = None
+        now = time.time()
+
+        if self.shared:
+            try:
+                entry = uwsgi.cache_get(key, self.name)
+                if entry is not None:
+                    expires, value = pickle.loads(entry)
+                    if expires > now:
+                        retval = value
+            except Exception as e:
+                self.logger.warning("ttlCache: Problem reading %s from uWSGI cache %s: %s", key, self.name, e)
+        else:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    expires, value, size = entry
+                    if expires > now:
+                        self.entries.move_to_end(key)
+                        retval = value
+                    else:
+                        del self.entries[key]
+                        self.bytes -= size
+
+        self.count('misses' if retval is None else 'hits')
+        return retval
+
+    def set(self, key, value, ttl=None):
+        """
+        Add or replace an entry in the cache
+
+        :param key:
+            String key of the entry
+        :param value:
+            Value to cache.  Must be picklable if the cache is shared.
+        :param ttl:
+            Number of seconds the entry is valid.  If not given, use the default for this cache.
+        :return:
+            True if the entry was cached, False otherwise
+        """
+        retval = False
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.time() + ttl
+
+        if self.shared:
+            try:
+                retval = bool(uwsgi.cache_update(key, pickle.dumps((expires, value)), int(ttl) + 1, self.name))
+            except Exception as e:
+                self.logger.warning("ttlCache: Problem writing %s to uWSGI cache %s: %s", key, self.name, e)
+        else:
+            size = len(value) if isinstance(value, (bytes, bytearray, str)) else 0
+            with self.lock:
+                if key in self.entries:
+                    self.bytes -= self.entries.pop(key)[2]
+                self.entries[key] = (expires, value, size)
+                self.bytes += size
+                while len(self.entries) > self.maxsize \
+                        or (self.maxbytes is not None and self.bytes > self.maxbytes and len(self.entries) > 1):
+                    evicted = self.entries.popitem(last=False)[1]
+                    self.bytes -= evicted[2]
+                    self.counters['evictions'] += 1
+            retval = True
+
+        return retval
+
+    def add(self, key, value, ttl=None):
+        """
+        Add an entry only if the key is not already cached (or has expired).  Atomic, also across uWSGI workers
+        when the cache is shared, so it may be used to claim a key.
+
+        :param key:
+            String key of the entry
+        :param value:
+            Value to cache.  Must be picklable if the cache is shared.
+        :param ttl:
+            Number of seconds the entry is valid.  If not given, use the default for this cache.
+        :return:
+            True if the entry was added, False if the key is already cached
+        """
+        retval = False
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+
+        if self.shared:
+            try:
+                # cache_set never replaces an existing key.  Entries are removed by uWSGI shortly after they
+                # expire; replace one which has expired but was not removed yet.
+                entry = pickle.dumps((now + ttl, value))
+                retval = bool(uwsgi.cache_set(key, entry, int(ttl) + 1, self.name))
+                if not retval:
+                    current = uwsgi.cache_get(key, self.name)
+                    if current is None or pickle.loads(current)[0] <= now:
+                        retval = bool(uwsgi.cache_update(key, entry, int(ttl) + 1, self.name))
+            except Exception as e:
+                self.logger.warning("ttlCache: Problem adding %s to uWSGI cache %s: %s", key, self.name, e)
+        else:
+            # The lock is reentrant, so the check and 'set' are one atomic step
+            with self.lock:
+                entry = self.entries.get(key)
+                retval = entry is None or entry[0] <= now
+                if retval:
+                    self.set(key, value, ttl=ttl)
+
+        return retval
+
+    def delete(self, key):
+        """
+        Remove an entry from the cache
+
+        :param key:
+            String key of the entry
+        :return:
+            None
+        """
+        if self.shared:
+            try:
+                uwsgi.cache_del(key, self.name)
+            except Exception as e:
+                self.logger.warning("ttlCache: Problem removing %s from uWSGI cache %s: %s", key, self.name, e)
+        else:
+            with self.lock:
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.bytes -= entry[2]
+
+    def getStats(self):
+        """
+        Report the cache counters for this process
+
+        :return:
+            Dictionary containing hits, misses, evictions and size (entries and bytes) of the cache
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self.entries)
+            stats['bytes'] = self.bytes
+
+        stats['maxsize'] = self.maxsize
+        stats['shared'] = self.shared
+        return stats
+
+
+class snapshotStore:
+
+    def __init__(self, directory, maxage=None, logname=__name__):
+        """
+        Class initialization.  Snapshots are the latest copy of a dataset pre-fetched by the apiScheduler.  They
+        are stored as JSON files so they are shared by all uWSGI workers, whichever one fetched them.
+
+        :param directory:
+            Directory for the snapshot files.  Created if it doesn't exist.
+        :param maxage:
+            Optional dictionary of the default maximum age (seconds) of each dataset's snapshot, used for snapshots
+            saved without their own maximum age.  Older snapshots are ignored.
+        :param logname:
+            Name of the calling logger.  If not given, use the package name
+        """
+        # If the logger name was passed, append this module's name to it.  Otherwise, create a new logger with
+        # only the module name
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        self.directory = directory
+        self.maxage = maxage if maxage is not None else dict()
+        self.loaded = dict()
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, name, snapshot):
+        """
+        Write a snapshot file.  The file is replaced atomically so readers never see a partial snapshot.
+
+        :param name:
+            Name of the dataset
+        :param snapshot:
+            Dictionary containing the snapshot time, data and maximum age
+        :return:
+            True if the snapshot was saved, False otherwise
+        """
+        retval = False
+        filename = os.path.join(self.directory, "{}.json".format(name))
+        tmpname = "{0}.{1}".format(filename, os.getpid())
+
+        try:
+            with open(tmpname, 'w') as snapfile:
+                json.dump(snapshot, snapfile)
+            os.replace(tmpname, filename)
+            retval = True
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.error("snapshotStore: Problem saving snapshot %s: %s", name, e, exc_info=True)
+
+        return retval
+
+    def set(self, name, data, maxage=None):
+        """
+        Save the snapshot of a dataset
+
+        :param name:
+            Name of the dataset
+        :param data:
+            Dataset contents (must be JSON serializable)
+        :param maxage:
+            Maximum age (seconds) of this snapshot.  If not given, the default for the dataset applies.
+        :return:
+            True if the snapshot was saved, False otherwise
+        """
+        return self.write(name, {'time': time.time(), 'data': data, 'maxage': maxage})
+
+    def extend(self, name, maxage):
+        """
+        Change the maximum age of the current snapshot of a dataset, e.g. to keep it in use while refreshes of the
+        dataset are backing off
+
+        :param name:
+            Name of the dataset
+        :param maxage:
+            New maximum age (seconds) of the snapshot
+        :return:
+            True if the snapshot was updated, False if there is no snapshot or it could not be saved
+        """
+        loaded = self.load(name)
+        if loaded is None:
+            return False
+
+        return self.write(name, {'time': loaded[0], 'data': loaded[1], 'maxage': maxage})
+
+    def load(self, name):
+        """
+        Read the snapshot of a dataset, whatever its age.  Parsed snapshots are kept in memory until the file
+        changes.
+
+        :param name:
+            Name of the dataset
+        :return:
+            Tuple of (snapshot time in epoch seconds, data, maximum age or None), or None if there is no snapshot
+        """
+        filename = os.path.join(self.directory, "{}.json".format(name))
+
+        try:
+            mtime = os.stat(filename).st_mtime
+            with self.lock:
+                loaded = self.loaded.get(name)
+            if loaded is None or loaded[0] != mtime:
+                with open(filename) as snapfile:
+                    snapshot = json.load(snapfile)
+                loaded = (mtime, snapshot['time'], snapshot['data'], snapshot.get('maxage'))
+                with self.lock:
+                    self.loaded[name] = loaded
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return loaded[1:]
+
+    def get(self, name):
+        """
+        Get the current snapshot of a dataset
+
+        :param name:
+            Name of the dataset
+        :return:
+            Tuple of (snapshot time in epoch seconds, data), or None if there is no current snapshot
+        """
+        retval = None
+        loaded = self.load(name)
+
+        if loaded is not None:
+            snaptime, data, maxage = loaded
+            if maxage is None:
+                maxage = self.maxage.get(name)
+            if maxage is None or time.time() - snaptime <= maxage:
+                retval = (snaptime, data)
+
+        return retval
@@ -15,7 +15,6 @@ IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
 import os
-import time
 
 """
 Location for temporary files
@@ -24,11 +23,118 @@ dirpath = os.getcwd()
 tmpdir = "{}/tmp".format(dirpath)
 
 """
-Logfile name and location
+Logfile name, location and logging levels
 
-The 'logname' variable will be used by the apiHandler to define a logging instance with the same name
+The 'logname' variable will be used by the apiHandler to define a logging instance with the same name.
+
+Log records are written to the console and to 'logfile' by a background thread.  The log file is rotated once it
+reaches 'log_max_size' bytes (0 disables it) and / or every 'log_rotate_interval' 'log_rotate_when' units ("S", "M",
+"H", "D", or "MIDNIGHT" for daily at midnight; empty disables it), keeping 'log_backups' old files.  Messages longer
+than 'log_max_message' characters (e.g. API responses logged at DEBUG) are truncated; 0 disables truncation.
+
+Levels are CRITICAL, ERROR, WARNING, INFO or DEBUG, and may be set without editing this file through the
+environment variables APIHANDLER_LOGLEVEL (console) and APIHANDLER_LOGLEVEL_FILE (log file).  'log_levels' sets
+the level of individual packages, e.g. {'CiscoDNA.dnaCenter': "WARNING"}; the console and file levels still apply.
 """
 logname = "apihandler"
-timestamp = time.strftime("%Y-%m-%d_%H%M%S", time.localtime())
-logfile = "{0}_{1}.log".format(logname, timestamp)
+logfile = "{0}/{1}.log".format(dirpath, logname)
+loglevel = os.environ.get("APIHANDLER_LOGLEVEL", "INFO")
+loglevelfile = os.environ.get("APIHANDLER_LOGLEVEL_FILE", "INFO")
+log_levels = {}
+log_max_size = 10 * 1024 * 1024
+log_backups = 5
+log_rotate_when = ""
+log_rotate_interval = 1
+log_max_message = 4096
+
+
+"""
+Background job executor
+
+Webhooks are acknowledged as soon as the message signature is validated.  The remaining work (requestor validation,
+message retrieval and the call into the integration package) is queued and processed by a pool of worker threads
+in each uWSGI worker process.  Once 'executor_queuesize' jobs are waiting, new webhooks are refused.
+"""
+executor_workers = 4
+executor_queuesize = 100
+
+"""
+Requestor validation cache
+
+The result of validating a requestor (organization or authorized user check) is cached for 'person_cache_ttl'
+seconds so messages from the same people don't each need a person lookup.  If 'person_cache_shared' is True and
+the app is running under uWSGI, the 'persons' cache defined in uwsgi.ini is shared by all workers.
+"""
+person_cache_size = 1000
+person_cache_ttl = 300
+person_cache_shared = True
+
+"""
+Health chart cache
+
+Rendered health charts are cached by a hash of the health data and chart title, so identical requests reuse the
+PNG instead of drawing it again.  The cache is bounded by number of charts and total size in bytes.
+"""
+chart_cache_size = 100
+chart_cache_bytes = 16 * 1024 * 1024
+chart_cache_ttl = 3600
 
+"""
+Network health response cache
+
+Network health API responses are cached per time window (see dnaConfig.py for the window and retention).  If
+'health_cache_shared' is True and the app is running under uWSGI, the 'health' cache defined in uwsgi.ini is
+shared by all workers.
+"""
+health_cache_size = 500
+health_cache_shared = True
+
+"""
+Module preloading
+
+Heavy dependencies (matplotlib, dateparser, python-magic) are imported on first use so workers start quickly.  If
+'preload_modules' is True they are instead imported and warmed up when the app is loaded.  Under uWSGI (without
+'lazy-apps') the app is loaded once in the master process, so the forked workers share these pages copy-on-write
+and respawned workers start with everything already loaded.
+"""
+preload_modules = False
+
+"""
+Background refresh scheduler
+
+Datasets listed in 'scheduler_datasets' are pre-fetched from Cisco DNA Center every N seconds and saved as snapshots
+in 'snapshot_dir'.  Chat commands (show network health, show pnp status, show software ...) are answered from the
+latest snapshot and say how old the data is; add 'refresh' to a command to bypass the snapshot.  Remove a dataset
+(or set 'scheduler_datasets' to an empty dictionary) to always call Cisco DNA Center.
+
+Only one uWSGI worker runs the scheduler at a time (the one holding 'scheduler_lockfile').  Each refresh is
+delayed or advanced randomly by up to 'scheduler_jitter' of its interval.  If a fetch fails or takes longer than
+'scheduler_slowtime' seconds, the interval of that dataset is doubled, up to 'scheduler_maxbackoff' times the
+configured value.  Snapshots older than 'snapshot_maxage' intervals are ignored; while a dataset is backing off,
+the backed-off interval is used, so its last snapshot stays in use (with its "data as of" time).
+"""
+scheduler_datasets = {
+    'networkhealth': 60,
+    'pnpstatus': 300,
+    'softwareimages': 600,
+    'softwareccoimages': 600
+}
+scheduler_jitter = 0.1
+scheduler_slowtime = 10
+scheduler_maxbackoff = 8
+scheduler_lockfile = "{}/scheduler.lock".format(tmpdir)
+snapshot_dir = "{}/snapshots".format(tmpdir)
+snapshot_maxage = 3
+
+"""
+Webhook deduplication
+
+Webex Teams re-delivers a webhook when the app is slow to acknowledge it.  The ID of every message accepted for
+processing is remembered for 'message_dedupe_ttl' seconds, and deliveries of a message which is already being
+processed (or was processed) are dropped.  If 'message_dedupe_shared' is True and the app is running under uWSGI,
+the 'messages' cache defined in uwsgi.ini is shared by all workers, so a re-delivery is dropped whichever worker
+receives it.
+"""
+message_dedupe_size = 5000
+message_dedupe_ttl = 900
+message_dedupe_shared = True
@@ -21,53 +21,42 @@ This file contains code to process the incoming messages from Webex Teams and ca
 """
 import os
 import apiConfig
-import logging
+import threading
 from flask import Flask, request
 import CiscoDNA.dnaCenter
 import CiscoWebex.webexTeams
+import jobExecutor
+import apiCache
+import apiScheduler
+import apiLogging
 import json
 
 
 """
 /**********************************************************************************************************************
 BEGIN Configure logging:
-Define the default level (also used for console logging) as well as the level for the logfile
+The levels for console logging and for the logfile are set in apiConfig.py (or the environment).
 Valid levels from highest to lowest severity are:
-    logging.CRITICAL
-    logging.ERROR
-    logging.WARNING
-    logging.INFO
-    logging.DEBUG
+    CRITICAL
+    ERROR
+    WARNING
+    INFO
+    DEBUG
     
 Remember that the defined logging level will also display events for all higher severity levels.
 """
-# Logging level for the console logger
-loglevel = logging.getLevelName(logging.DEBUG)
-
-# Logging level for logfile
-loglevelfile = logging.getLevelName(logging.INFO)
-
-# Initialize a new logging instance for our app
-logger = logging.getLogger(apiConfig.logname)
-logger.setLevel(loglevel)
-#logger.addHandler(default_handler)
-
-# Define the format for console and file log messages
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Configure console logging
-ch = logging.StreamHandler()
-ch.setLevel(loglevel)
-# add formatter to the console handler
-ch.setFormatter(formatter)
-# add console handler to the root logger
-logger.addHandler(ch)
-
-# Configure file logging
-fh = logging.FileHandler(apiConfig.logfile)
-fh.setLevel(loglevelfile)
-fh.setFormatter(formatter)
-logger.addHandler(fh)
+# Initialize a new logging instance for our app.  The console and file handlers run in a background thread.
+logger = apiLogging.setupLogging(apiConfig.logname,
+                                 consolelevel=apiConfig.loglevel,
+                                 filelevel=apiConfig.loglevelfile,
+                                 logfile=apiConfig.logfile,
+                                 maxsize=apiConfig.log_max_size,
+                                 backups=apiConfig.log_backups,
+                                 rotatewhen=apiConfig.log_rotate_when,
+                                 rotateinterval=apiConfig.log_rotate_interval,
+                                 maxbytes=apiConfig.log_max_message,
+                                 levels=apiConfig.log_levels
+                                 )
 
 """
 END Configure Logging
@@ -102,6 +91,94 @@ The name of this flask app will be referenced in the UWSGI application server co
 
 app = Flask(__name__)
 
+# Optionally import and warm up heavy dependencies now (in the uWSGI master) instead of on first use in each worker
+if apiConfig.preload_modules:
+    logger.info("Preloading modules...")
+    CiscoDNA.dnaCenter.dnaCenter.preload()
+    CiscoWebex.webexTeams.webexTeams.preload()
+
+# Background executor for webhook processing.  Worker threads are started on the first job in each uWSGI worker.
+executor = jobExecutor.jobExecutor(workers=apiConfig.executor_workers,
+                                   queuesize=apiConfig.executor_queuesize,
+                                   logname=apiConfig.logname
+                                   )
+
+# Cache of requestor validation results, shared by all uWSGI workers when possible
+personCache = apiCache.ttlCache("persons",
+                                maxsize=apiConfig.person_cache_size,
+                                ttl=apiConfig.person_cache_ttl,
+                                shared=apiConfig.person_cache_shared,
+                                logname=apiConfig.logname
+                                )
+
+# Cache of rendered health charts, local to each uWSGI worker
+chartCache = apiCache.ttlCache("charts",
+                               maxsize=apiConfig.chart_cache_size,
+                               ttl=apiConfig.chart_cache_ttl,
+                               maxbytes=apiConfig.chart_cache_bytes,
+                               logname=apiConfig.logname
+                               )
+
+# Cache of network health API responses, shared by all uWSGI workers when possible.  Entry lifetimes are set by
+# the dnaCenter class depending on the age of the requested health data.
+healthCache = apiCache.ttlCache("health",
+                                maxsize=apiConfig.health_cache_size,
+                                shared=apiConfig.health_cache_shared,
+                                logname=apiConfig.logname
+                                )
+
+# IDs of the messages accepted for processing, shared by all uWSGI workers when possible.  Used to drop webhooks
+# re-delivered by Webex Teams.
+messageCache = apiCache.ttlCache("messages",
+                                 maxsize=apiConfig.message_dedupe_size,
+                                 ttl=apiConfig.message_dedupe_ttl,
+                                 shared=apiConfig.message_dedupe_shared,
+                                 logname=apiConfig.logname
+                                 )
+duplicateLock = threading.Lock()
+duplicateCount = 0
+
+# Snapshots of the datasets pre-fetched by the scheduler, shared by all uWSGI workers.  Snapshots which missed
+# 'snapshot_maxage' refreshes (at the backed-off interval) are ignored and the commands call Cisco DNA Center
+# instead.
+snapshots = apiCache.snapshotStore(apiConfig.snapshot_dir,
+                                   maxage={name: interval * apiConfig.snapshot_maxage
+                                           for name, interval in apiConfig.scheduler_datasets.items()},
+                                   logname=apiConfig.logname
+                                   )
+
+
+def fetchDataset(name):
+    """
+    Fetch one of the scheduled datasets from Cisco DNA Center
+    :param name: Name of the dataset (see CiscoDNA.dnaCenter.dnaCenter.datasets)
+    :return: The dataset, or False if it could not be fetched
+    """
+    with CiscoDNA.dnaCenter.dnaCenter(logname=apiConfig.logname, tmp=apiConfig.tmpdir) as dna:
+        return dna.getDataset(name)
+
+
+# Background refresh of the snapshots.  The scheduler thread is started on the first request in each uWSGI worker,
+# but only one worker at a time fetches the datasets.
+scheduler = apiScheduler.apiScheduler(apiConfig.scheduler_datasets, fetchDataset, snapshots,
+                                      lockfile=apiConfig.scheduler_lockfile,
+                                      jitter=apiConfig.scheduler_jitter,
+                                      slowtime=apiConfig.scheduler_slowtime,
+                                      maxbackoff=apiConfig.scheduler_maxbackoff,
+                                      maxage=apiConfig.snapshot_maxage,
+                                      logname=apiConfig.logname
+                                      )
+
+
+@app.before_request
+def startScheduler():
+    """
+    Make sure the scheduler thread runs in this worker process
+    :return: None
+    """
+    scheduler.start()
+
+
 """
 END Flask app initialization
 /**********************************************************************************************************************
@@ -165,26 +242,52 @@ def parseResponse(teamobj, roomid, response):
                 retval = True
             else:
                 logger.warning("There was a problem sending a message.  Check logfile for details")
+        elif response['responseType'] == 'messages':
+            # The package split a long reply into several messages.  Send them in order and stop at the first
+            # failure so the requestor never receives the end of a reply without its beginning.
+            for part in response['data']['messages']:
+                logger.debug("Sending message.\n\tRoom: %s\n\tMessage:%s", roomid, part['message'])
+                if not teamobj.sendMessage(roomid, part['message'], richmessage=part['richmessage']):
+                    logger.warning("There was a problem sending a message.  Check logfile for details")
+                    break
+            else:
+                retval = True
         elif response['responseType'] == 'file':
-            # The package returned a locally-stored file attachment to be sent to the user.  Try to send it and
-            # then remove the temporary file if successfully attached.
-            uploadresult = teamobj.attachFile(roomid, response['data']['file'], response['data']['message'])
+            # The package returned a file attachment to be sent to the user: either contents held in memory or a
+            # locally-stored temporary file.  Try to send it, then release the contents or remove the file whether
+            # or not the upload succeeded.
+            data = response['data']
+            if 'content' in data:
+                attachment = data['filename']
+                try:
+                    uploadresult = teamobj.attachFile(roomid, "", data['message'], content=data['content'],
+                                                      filename=data['filename'], mimetype=data['mimetype'])
+                finally:
+                    if hasattr(data['content'], 'close'):
+                        data['content'].close()
+            else:
+                attachment = data['file']
+                try:
+                    uploadresult = teamobj.attachFile(roomid, data['file'], data['message'],
+                                                      mimetype=data.get('mimetype', ""))
+                finally:
+                    removeFile(data['file'])
+
             if uploadresult == False:
                 logger.warning("Failed to send file attachment.\n\tRoom: %s\n\tFile: %s\n\tMessage: %s",
                                roomid,
-                               response['data']['file'],
-                               response['data']['message']
+                               attachment,
+                               data['message']
                                )
                 errormsg = "{}\nThere was a problem posting the file.".format('\U0001F92E')
                 errormsg += "The error message is:\n{}".format(uploadresult)
 
                 errmsgrich = "{}\n\nThere was a problem posting the file.".format('\U0001F92E')
-                errmsgrich += "The error message is:\n\n{}".format(response['data']['richmessage'])
+                errmsgrich += "The error message is:\n\n{}".format(data['richmessage'])
 
                 teamobj.sendMessage(roomid, errormsg, richmessage=errmsgrich)
             else:
-                logger.debug("File uploaded successfully.\n\tRoom ID: %s\n\tFilename: %s", roomid, response['data']['file'])
-                removeFile(response['data']['file'])
+                logger.debug("File uploaded successfully.\n\tRoom ID: %s\n\tFilename: %s", roomid, attachment)
                 retval = True
     else:
         logger.warning("Invalid response received in parseResponse.  Check log for details")
@@ -195,6 +298,39 @@ def parseResponse(teamobj, roomid, response):
     return retval
 
 
+def claimMessage(botname, messageid):
+    """
+    Record that a message is being processed.  Webex Teams re-delivers webhooks it considers unacknowledged, so
+    the same message may arrive several times (at any uWSGI worker).
+    :param botname: Name of the bot which received the message
+    :param messageid: ID of the message
+    :return: True if the message is new, False if it is a duplicate (which is counted).
+    """
+    global duplicateCount
+
+    if messageCache.add("{0}:{1}".format(botname, messageid), "processing"):
+        return True
+
+    with duplicateLock:
+        duplicateCount += 1
+    return False
+
+
+def releaseMessage(botname, messageid, done):
+    """
+    Record the outcome of processing a message claimed by 'claimMessage'
+    :param botname: Name of the bot which received the message
+    :param messageid: ID of the message
+    :param done: True if the message was processed.  Otherwise the claim is removed so a re-delivery is processed.
+    :return: None
+    """
+    key = "{0}:{1}".format(botname, messageid)
+    if done:
+        messageCache.set(key, "done")
+    else:
+        messageCache.delete(key)
+
+
 """ 
 END Function definitions
 /**********************************************************************************************************************
@@ -217,31 +353,44 @@ send a message to a room or group in Webex Teams, create a ServiceNOW request, o
 """
 
 
-@app.route('/api/teams/dna', methods=['POST'])
-def index():
+def processDnaMessage(botname, postdata):
     """
-    Handler for the Webex Teams / Cisco DNA Center integration.
-    Processes incoming messages, obtain keywords, and call the proper methods from the
-    CiscoDNA.dnaCenter class.  Results will be sent back to the requester.
-
-    :return: string value "success" if all tasks succeed, "failure" otherwise.
+    Background job for the Webex Teams / Cisco DNA Center integration.  Validates the requestor, obtains
+    the message text, and calls the proper methods from the CiscoDNA.dnaCenter class.  Results will be sent
+    back to the requester.
+
+    :param botname: Name of the bot which received the message.  Used to load the correct config values
+    :param postdata: JSON POST data received by the webhook.  The signature must already be validated and the
+                     message claimed with 'claimMessage'.
+    :return: True if all tasks succeed, False otherwise.
     """
-    retval = "failure"
+    try:
+        retval = processDnaRequest(botname, postdata)
+    except Exception:
+        # Let a re-delivery of the webhook try again
+        releaseMessage(botname, postdata['data']['id'], False)
+        raise
 
-    # Initial steps:
-    # - Set the botname for this app.  This will enable the webexTeams class to load the correct config values
-    # - Get the raw request from the webhook - this will be used to validate the incoming message
-    # - Set a variable to hold the JSON POST data
-    botname = "dnabot"
-    raw = request.data.decode("utf-8")
-    postdata = json.loads(raw)
+    releaseMessage(botname, postdata['data']['id'], True)
+    return retval
+
+
+def processDnaRequest(botname, postdata):
+    """
+    Process a message for 'processDnaMessage'
+    :param botname: Name of the bot which received the message
+    :param postdata: JSON POST data received by the webhook
+    :return: True if all tasks succeed, False otherwise.
+    """
+    retval = False
 
     # Instantiate a new 'webexTeams' object named 'teams' and begin processing the message:
-    # - Validate the incoming message
-    # - If the message is valid, extract the room ID (for message replies) and the message text which will be
+    # - Validate the requestor
+    # - If the requestor is valid, extract the room ID (for message replies) and the message text which will be
     #   passed to the dnaCenter class for processing
-    with CiscoWebex.webexTeams.webexTeams(botname, logname=apiConfig.logname, tmp=apiConfig.tmpdir) as teams:
-        if teams.validateMessage(raw, request.headers):
+    with CiscoWebex.webexTeams.webexTeams(botname, logname=apiConfig.logname, tmp=apiConfig.tmpdir,
+                                          personcache=personCache) as teams:
+        if teams.validateRequestor(postdata):
             # The message is valid, proceed...
             logger.debug("Message is valid, proceeding...")
 
@@ -264,22 +413,89 @@ def index():
                 messagetext = messagetext.replace(botname.lower(), '').lstrip()
                 logger.debug("Message text received: %s", messagetext)
 
-                teams.sendMessage(roomid, "Let me work on that... \U0001F557")
+                # No need to wait for the acknowledgement to be sent: messages to the room are sent in order
+                teams.sendMessage(roomid, "Let me work on that... \U0001F557", wait=False)
                 # The generic "please wait" message has been sent.  Create a new dnaCenter object and pass
                 # some of our info to it.  Right now, that means the name of the logger so we can receive logging
                 # and the temporary directory to store any generated attachments
-                with CiscoDNA.dnaCenter.dnaCenter(logname=apiConfig.logname, tmp=apiConfig.tmpdir) as dna:
+                with CiscoDNA.dnaCenter.dnaCenter(logname=apiConfig.logname, tmp=apiConfig.tmpdir,
+                                                  chartcache=chartCache, healthcache=healthCache,
+                                                  snapshots=snapshots) as dna:
                     # Send the received message to the dna object and send the response to 'parseResponse'
                     dnaresponse = dna.parseTeamsMessage(messagetext)
-                    r = parseResponse(teams, roomid, dnaresponse)
-                    if r:
-                        retval = "success"
+                    retval = parseResponse(teams, roomid, dnaresponse)
+        else:
+            logger.warning("Requestor is not valid, ignoring")
+
+    return retval
+
+
+@app.route('/api/teams/dna', methods=['POST'])
+def index():
+    """
+    Handler for the Webex Teams / Cisco DNA Center integration.
+    Validates the signature of incoming messages and queues them for 'processDnaMessage' so the webhook can be
+    acknowledged without waiting for Cisco DNA Center.
+
+    :return: string value "success" if the message was queued, "failure" otherwise.
+    """
+    retval = "failure"
+
+    # Initial steps:
+    # - Set the botname for this app.  This will enable the webexTeams class to load the correct config values
+    # - Get the raw request bytes from the webhook - the signature is computed over them exactly as received
+    botname = "dnabot"
+    raw = request.get_data()
+
+    # Validate the signature of the incoming message, then decode it (unsigned messages are never parsed).  Only
+    # signed messages are queued for processing; if the executor queue is full, tell the webhook to try again later.
+    with CiscoWebex.webexTeams.webexTeams(botname, logname=apiConfig.logname, tmp=apiConfig.tmpdir) as teams:
+        postdata = teams.decodeWebhook(raw, request.headers)
+        if postdata is not None:
+            logger.debug("Message signature is valid, queueing...")
+            messageid = postdata['data']['id']
+            if not claimMessage(botname, messageid):
+                # Already being processed (or processed) - acknowledge it so it is not delivered again
+                logger.info("Message %s was already received, dropping duplicate", messageid)
+                retval = "success"
+            elif executor.submit(processDnaMessage, botname, postdata):
+                retval = "success"
+            else:
+                logger.warning("Job executor is full, refusing message")
+                releaseMessage(botname, messageid, False)
+                return retval, 503
         else:
             logger.warning("Invalid message received, ignoring")
 
     return retval
 
 
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """
+    Report internal counters for this uWSGI worker, e.g. the job executor queue depth and job latency or the
+    Cisco DNA Center connection pool usage.  Used to size the executor and connection pools.
+
+    :return: JSON string containing the counters
+    """
+    counters = {
+        'pid': os.getpid(),
+        'executor': executor.getStats(),
+        'dnaPools': CiscoDNA.dnaCenter.dnaCenter.getPoolStats(),
+        'dnaRequests': CiscoDNA.dnaCenter.dnaCenter.getFlightStats(),
+        'renderPool': CiscoDNA.dnaCenter.dnaCenter.getRenderStats(),
+        'personCache': personCache.getStats(),
+        'chartCache': chartCache.getStats(),
+        'healthCache': healthCache.getStats(),
+        'messageCache': messageCache.getStats(),
+        'duplicates': duplicateCount,
+        'scheduler': scheduler.getStats(),
+        'webexSenders': CiscoWebex.webexTeams.webexTeams.getSenderStats()
+    }
+
+    return json.dumps(counters)
+
+
 """
 END Webhook processing
 /**********************************************************************************************************************
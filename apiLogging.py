@@ -0,0 +1,363 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+This file contains the logging setup used by the apiHandler.  Log records are put on a queue by the thread which
+logs them and formatted and written to the console and the log file by a separate listener thread, so request and
+job threads never format records or tracebacks, nor wait on the console or the disk.  Long messages (e.g. full API
+responses logged at DEBUG) are merged with their arguments and truncated before they are queued.
+
+The log file is rotated by size and / or time.  Every uWSGI worker writes to the same file; rotation is serialized
+with a lock file and a worker whose file was rotated by another one simply reopens it.
+
+"""
+import os
+import copy
+import time
+import datetime
+import queue
+import fcntl
+import atexit
+import logging
+import logging.handlers
+import processLocal
+
+
+class truncateFilter(logging.Filter):
+
+    def __init__(self, maxbytes):
+        """
+        Class initialization.
+
+        :param maxbytes:
+            Maximum length (characters) of a log message, arguments included.  Longer messages are cut and the
+            number of characters removed is appended.  0 disables truncation.
+        """
+        super().__init__()
+        self.maxbytes = maxbytes
+
+    def truncate(self, value):
+        """
+        Cut a string to the maximum length
+
+        :param value:
+            String to cut
+        :return:
+            The string, truncated if needed
+        """
+        if len(value) > self.maxbytes:
+            value = "{0}... [{1} characters truncated]".format(value[:self.maxbytes], len(value) - self.maxbytes)
+        return value
+
+    def filter(self, record):
+        """
+        Truncate the message of a record.  Long arguments (e.g. a whole API response) are cut first, so a huge
+        body is never copied into the message; the message is then merged with its arguments and cut, so a cut
+        can't separate a placeholder from its argument.  Records are never dropped.
+
+        :param record:
+            logging.LogRecord to check
+        :return:
+            True
+        """
+        if self.maxbytes <= 0:
+            return True
+
+        if isinstance(record.args, tuple):
+            args = list()
+            for arg in record.args:
+                if isinstance(arg, (bytes, bytearray)):
+                    arg = self.truncate(repr(arg[:self.maxbytes + 1]))
+                elif isinstance(arg, (str, dict, list)):
+                    arg = self.truncate(str(arg))
+                args.append(arg)
+            record.args = tuple(args)
+
+        try:
+            message = record.getMessage()
+        except (TypeError, ValueError, KeyError):
+            # Arguments not matching the message are reported by the handler, as for any other record
+            return True
+
+        record.msg = self.truncate(message)
+        record.args = ()
+        return True
+
+
+class sharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+
+    # Rotation periods in seconds, by 'when'.  "MIDNIGHT" rotates at local midnight.
+    periods = {'S': 1, 'M': 60, 'H': 3600, 'D': 86400}
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, when="", interval=1):
+        """
+        Class initialization.  A log file rotated by size and / or time, which may be written by several processes.
+
+        :param filename:
+            Full path of the log file
+        :param maxBytes:
+            Size at which the log file is rotated.  0 disables rotation by size.
+        :param backupCount:
+            Number of rotated files kept
+        :param when:
+            "S", "M", "H" or "D" to rotate every 'interval' seconds, minutes, hours or days (counted from the
+            epoch, so every process rotates at the same time), or "MIDNIGHT" to rotate at local midnight.  Empty
+            disables rotation by time.
+        :param interval:
+            Number of 'when' units between rotations
+        """
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+        self.lockfile = "{}.lock".format(self.baseFilename)
+        self.when = when.upper()
+        self.interval = interval
+        if self.when != "" and self.when != "MIDNIGHT" and self.when not in self.periods:
+            raise ValueError("Unknown log rotation period: {}".format(when))
+        self.rolloverAt = self.nextRollover(time.time()) if self.when != "" else None
+
+    def nextRollover(self, now):
+        """
+        Compute the time of the next rotation by time
+
+        :param now:
+            Epoch time in seconds
+        :return:
+            Epoch time in seconds of the first rotation after 'now'
+        """
+        if self.when == "MIDNIGHT":
+            tomorrow = datetime.date.fromtimestamp(now) + datetime.timedelta(days=1)
+            return time.mktime(tomorrow.timetuple())
+
+        period = self.periods[self.when] * self.interval
+        return now - now % period + period
+
+    def isRotated(self):
+        """
+        Check whether the open log file was rotated (renamed) by another process
+
+        :return:
+            True if the log file must be reopened, False otherwise
+        """
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            return True
+
+    def reopen(self):
+        """
+        Close the open log file so the next record opens the current one
+
+        :return:
+            None
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self.isRotated():
+            self.reopen()
+        if self.rolloverAt is not None and record.created >= self.rolloverAt:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        # The lock file holds the time of the last rotation by time, so only the first process to reach it rotates
+        with open(self.lockfile, 'a+') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if self.rolloverAt is not None and time.time() >= self.rolloverAt:
+                due = self.rolloverAt
+                self.rolloverAt = self.nextRollover(time.time())
+                lock.seek(0)
+                try:
+                    lastrollover = float(lock.read() or 0)
+                except ValueError:
+                    lastrollover = 0
+
+                if lastrollover >= due:
+                    self.reopen()
+                else:
+                    super().doRollover()
+                    lock.seek(0)
+                    lock.truncate()
+                    lock.write(str(due))
+            # Another process may have rotated the file while this one waited for the lock
+            elif self.stream is not None and self.isRotated():
+                self.reopen()
+            else:
+                super().doRollover()
+
+
+class logQueue(logging.handlers.QueueHandler):
+
+    # Argument types which can't change between the log call and the listener formatting the record
+    immutableTypes = (str, int, float, bool, type(None))
+
+    def __init__(self, handlers, maxbytes=0):
+        """
+        Class initialization.  No thread is started here - the listener is started on the first record so that
+        a handler created in the uWSGI master process still works in each forked worker.
+
+        :param handlers:
+            List of handlers the records are passed to by the listener thread.  Each handler's level applies.
+        :param maxbytes:
+            Maximum length of a log message (see truncateFilter)
+        """
+        super().__init__(queue.Queue())
+        self.handlers = handlers
+        self.processListener = processLocal.processLocal(self.startListener)
+        self.addFilter(truncateFilter(maxbytes))
+        atexit.register(self.stop)
+
+    def start(self):
+        """
+        Start the listener thread if it is not running in this process (see processLocal)
+
+        :return:
+            None
+        """
+        self.processListener.get()
+
+    def startListener(self):
+        """
+        Start a listener thread on a new queue.  Records queued in the parent process before a fork are left
+        behind.  Called once per process by 'start'.
+
+        :return:
+            logging.handlers.QueueListener
+        """
+        self.queue = queue.Queue()
+        listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        listener.start()
+        return listener
+
+    def stop(self):
+        """
+        Write the queued records and stop the listener thread of this process, if it was started
+
+        :return:
+            None
+        """
+        listener = self.processListener.peek()
+        if listener is not None and self.processListener.discard(listener):
+            listener.stop()
+
+    def freeze(self, value):
+        """
+        Convert a log argument which may still change (e.g. a dictionary updated after the log call) to a string
+
+        :param value:
+            Log argument
+        :return:
+            The value if it is immutable, otherwise its string representation
+        """
+        return value if isinstance(value, self.immutableTypes) else str(value)
+
+    def prepare(self, record):
+        """
+        Queue a copy of the record without formatting it; the listener's handlers format it (message, exception
+        traceback) with their own formatter.  Only the arguments are converted, so the message is the one logged
+        even if an argument changes afterwards.
+
+        :param record:
+            logging.LogRecord, already truncated by truncateFilter
+        :return:
+            The record to queue.  The original record is left intact for other handlers.
+        """
+        record = copy.copy(record)
+        if isinstance(record.args, tuple):
+            record.args = tuple(self.freeze(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: self.freeze(value) for key, value in record.args.items()}
+        record.msg = self.freeze(record.msg)
+        return record
+
+    def enqueue(self, record):
+        self.start()
+        super().enqueue(record)
+
+
+def getLevel(name):
+    """
+    Convert a level name (e.g. "DEBUG") to its number
+
+    :param name:
+        Level name or number
+    :return:
+        Level number.  Unknown names raise ValueError.
+    """
+    level = logging.getLevelName(name.upper()) if isinstance(name, str) else name
+    if not isinstance(level, int):
+        raise ValueError("Unknown logging level: {}".format(name))
+    return level
+
+
+def setupLogging(logname, level=None, consolelevel="INFO", filelevel="INFO", logfile="", maxsize=0, backups=0,
+                 rotatewhen="", rotateinterval=1, maxbytes=0, levels=None):
+    """
+    Configure the logger of the app: console and file handlers behind a queue, message truncation and levels.
+
+    :param logname:
+        Name of the app logger.  The loggers of the packages are its children.
+    :param level:
+        Level name of the app logger.  If not given, the lowest of the console and file levels.
+    :param consolelevel:
+        Level name of the console log
+    :param filelevel:
+        Level name of the file log
+    :param logfile:
+        Full path of the log file.  If empty, only the console is used.
+    :param maxsize:
+        Size in bytes at which the log file is rotated.  0 disables rotation.
+    :param backups:
+        Number of rotated log files kept
+    :param rotatewhen:
+        Period of the rotation by time (see sharedRotatingFileHandler), e.g. "MIDNIGHT".  Empty disables it.
+    :param rotateinterval:
+        Number of 'rotatewhen' units between rotations
+    :param maxbytes:
+        Maximum length of a log message.  0 disables truncation.
+    :param levels:
+        Optional dictionary of logger name (relative to 'logname', e.g. "CiscoDNA.dnaCenter") to level name.
+        The console and file levels still apply to these loggers.
+    :return:
+        The app logger
+    """
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = list()
+
+    console = logging.StreamHandler()
+    console.setLevel(getLevel(consolelevel))
+    console.setFormatter(formatter)
+    handlers.append(console)
+
+    if logfile != "":
+        file = sharedRotatingFileHandler(logfile, maxBytes=maxsize, backupCount=backups, when=rotatewhen,
+                                         interval=rotateinterval)
+        file.setLevel(getLevel(filelevel))
+        file.setFormatter(formatter)
+        handlers.append(file)
+
+    # By default, records below every handler's level are not even created
+    logger = logging.getLogger(logname)
+    logger.setLevel(getLevel(level) if level is not None else min(handler.level for handler in handlers))
+    logger.addHandler(logQueue(handlers, maxbytes=maxbytes))
+
+    for name, level in (levels or dict()).items():
+        logging.getLogger("{0}.{1}".format(logname, name)).setLevel(getLevel(level))
+
+    return logger
@@ -0,0 +1,228 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+This file contains the background refresh scheduler.  It pre-fetches datasets (network health, PnP status, software
+images...) on a per-dataset interval and saves them to a snapshotStore, so chat commands can be answered from the
+latest snapshot instead of waiting for Cisco DNA Center.
+
+Every uWSGI worker starts a scheduler thread, but only the one holding the lock file fetches anything; the others
+wait and take over if that worker exits.  The datasets are therefore fetched once per deployment, not once per
+worker.
+
+"""
+import os
+import time
+import fcntl
+import random
+import logging
+import threading
+import processLocal
+
+
+class apiScheduler:
+
+    def __init__(self, datasets, fetch, store, lockfile, jitter=0.1, slowtime=10, maxbackoff=8, retry=30, maxage=None,
+                 logname=__name__):
+        """
+        Class initialization.  No thread is started here - see 'start'.
+
+        :param datasets:
+            Dictionary of dataset name to refresh interval (seconds)
+        :param fetch:
+            Function called with a dataset name which returns the dataset contents, or False on failure
+        :param store:
+            apiCache.snapshotStore where the fetched datasets are saved
+        :param lockfile:
+            Full path of the lock file used to elect the one scheduler which fetches the datasets
+        :param jitter:
+            Fraction of the interval randomly added to or removed from each refresh, so the datasets (and
+            deployments) don't all hit the controller at the same moment
+        :param slowtime:
+            Number of seconds after which a fetch is considered slow.  Slow or failed fetches double the interval
+            of that dataset, up to 'maxbackoff' times the configured interval.
+        :param maxbackoff:
+            Maximum interval multiplier
+        :param retry:
+            Number of seconds between attempts to acquire the lock file
+        :param maxage:
+            Optional number of (backed-off) intervals a snapshot stays valid.  While a dataset is backing off, its
+            current snapshot is kept valid for as long, so the commands keep using it instead of calling the slow
+            or failing controller.  If not given, the store's default maximum ages apply.
+        :param logname:
+            Name of the calling logger.  If not given, use the package name
+        """
+        # If the logger name was passed, append this module's name to it.  Otherwise, create a new logger with
+        # only the module name
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        self.datasets = datasets
+        self.fetch = fetch
+        self.store = store
+        self.lockfile = lockfile
+        self.jitter = jitter
+        self.slowtime = slowtime
+        self.maxbackoff = maxbackoff
+        self.retry = retry
+        self.maxage = maxage
+        self.thread = processLocal.processLocal(self.startThread)
+        self.active = False
+        self.lock = threading.Lock()
+        self.backoff = {name: 1 for name in datasets}
+        self.counters = {name: {'fetched': 0, 'failed': 0, 'slow': 0, 'lastfetch': 0.0, 'lastduration': 0.0}
+                         for name in datasets}
+
+    def start(self):
+        """
+        Start the scheduler thread if it is not running in this process (see processLocal).  Nothing is started
+        if there are no datasets to refresh.
+
+        :return:
+            None
+        """
+        if self.datasets:
+            self.thread.get()
+
+    def startThread(self):
+        """
+        Start the scheduler thread.  It is not the leader until it holds the lock file.  Called once per process
+        by 'start'.
+
+        :return:
+            The scheduler thread
+        """
+        self.active = False
+        t = threading.Thread(target=self.run, name="apiScheduler", daemon=True)
+        t.start()
+        return t
+
+    def run(self):
+        """
+        Scheduler thread.  Waits until this process holds the lock file, then refreshes the datasets for as long
+        as the process lives.
+
+        :return:
+            None
+        """
+        lock = open(self.lockfile, 'w')
+
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(self.retry)
+
+        self.logger.info("apiScheduler: Process %s is refreshing datasets %s", os.getpid(),
+                         ", ".join(self.datasets))
+        with self.lock:
+            self.active = True
+
+        # Refresh everything right away, then each dataset on its own schedule
+        due = {name: time.monotonic() for name in self.datasets}
+
+        while True:
+            name = min(due, key=due.get)
+            wait = due[name] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            self.refresh(name)
+            due[name] = time.monotonic() + self.getInterval(name)
+
+    def refresh(self, name):
+        """
+        Fetch a dataset and save its snapshot.  Failed or slow fetches increase the backoff of the dataset;
+        a successful, fast fetch resets it.  The maximum age of the snapshot follows the backed-off interval.
+
+        :param name:
+            Name of the dataset
+        :return:
+            True if the snapshot was saved, False otherwise
+        """
+        started = time.monotonic()
+
+        try:
+            data = self.fetch(name)
+        except Exception as e:
+            self.logger.error("apiScheduler: Problem refreshing %s: %s", name, e, exc_info=True)
+            data = False
+
+        fetched = data is not False
+        duration = time.monotonic() - started
+        slow = duration > self.slowtime
+
+        with self.lock:
+            if fetched and not slow:
+                self.backoff[name] = 1
+            else:
+                self.backoff[name] = min(self.backoff[name] * 2, self.maxbackoff)
+                self.logger.warning("apiScheduler: %s refresh %s after %.1f seconds, backing off to %s times the "
+                                    "interval", name, "succeeded" if fetched else "failed", duration,
+                                    self.backoff[name])
+            backoff = self.backoff[name]
+
+        maxage = self.datasets[name] * backoff * self.maxage if self.maxage is not None else None
+        if fetched:
+            retval = self.store.set(name, data, maxage=maxage)
+        else:
+            retval = False
+            if maxage is not None:
+                # Keep the last snapshot (and its "data as of" time) in use until the next attempt
+                self.store.extend(name, maxage)
+
+        with self.lock:
+            counters = self.counters[name]
+            counters['fetched' if retval else 'failed'] += 1
+            counters['lastduration'] = duration
+            if retval:
+                counters['lastfetch'] = time.time()
+            if slow:
+                counters['slow'] += 1
+
+        return retval
+
+    def getInterval(self, name):
+        """
+        Get the number of seconds until the next refresh of a dataset, including backoff and jitter
+
+        :param name:
+            Name of the dataset
+        :return:
+            Number of seconds
+        """
+        with self.lock:
+            interval = self.datasets[name] * self.backoff[name]
+
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def getStats(self):
+        """
+        Report the scheduler counters for this process
+
+        :return:
+            Dictionary containing whether this process is the active scheduler, and per dataset the fetch counts,
+            time of the last successful fetch, duration of the last fetch and current backoff
+        """
+        with self.lock:
+            stats = {'active': self.active, 'datasets': dict()}
+            for name, counters in self.counters.items():
+                stats['datasets'][name] = dict(counters, backoff=self.backoff[name])
+
+        return stats
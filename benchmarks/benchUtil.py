@@ -0,0 +1,199 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Helpers shared by the benchmark scripts in this directory.  Importing this module makes the app modules
+(CiscoDNA, CiscoWebex, apiCache...) importable, so each benchmark can be run from anywhere with e.g.:
+
+    python benchmarks/chartMemory.py
+
+"""
+import os
+import ssl
+import sys
+import json
+import time
+import tempfile
+import resource
+import threading
+import subprocess
+import http.server
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repodir not in sys.path:
+    sys.path.insert(0, repodir)
+
+
+def getRss():
+    """
+    Get the current resident set size of this process
+
+    :return:
+        RSS in MiB (the peak RSS if the current value is not available on this platform)
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timeCalls(func, count):
+    """
+    Call a function repeatedly and measure the average duration
+
+    :param func:
+        Function called without arguments
+    :param count:
+        Number of calls
+    :return:
+        Average seconds per call
+    """
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count
+
+
+def printTable(header, rows):
+    """
+    Print results as an aligned text table
+
+    :param header:
+        List of column titles
+    :param rows:
+        List of rows (lists of values, formatted with str)
+    :return:
+        None
+    """
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max(len(str(title)), *(len(row[col]) for row in rows)) for col, title in enumerate(header)]
+    print("  ".join(str(title).rjust(width) for title, width in zip(header, widths)))
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+class stubServer(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, handler, tls=True, rtt=0.0):
+        """
+        Class initialization.  A local HTTP(S) server standing in for an API, serving from a background thread.
+        The certificate is self-signed for 127.0.0.1 and created with the openssl command.
+
+        Network latency is simulated with 'rtt': each new connection waits two round trips before the TLS
+        handshake (TCP and TLS handshakes) and each request waits one round trip before it is handled.  Handlers
+        must call 'self.server.delay()' at the start of each request.
+
+        :param handler:
+            http.server.BaseHTTPRequestHandler subclass answering the requests
+        :param tls:
+            Serve HTTPS instead of HTTP
+        :param rtt:
+            Simulated round trip time in seconds
+        """
+        super().__init__(("127.0.0.1", 0), handler)
+        self.rtt = rtt
+        self.tls = tls
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.certfile = os.path.join(self.tmp.name, "cert.pem")
+
+        if tls:
+            keyfile = os.path.join(self.tmp.name, "key.pem")
+            subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                            "-keyout", keyfile, "-out", self.certfile, "-subj", "/CN=127.0.0.1",
+                            "-addext", "subjectAltName=IP:127.0.0.1"],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.context.load_cert_chain(self.certfile, keyfile)
+
+        self.baseurl = "{0}://127.0.0.1:{1}".format("https" if tls else "http", self.server_address[1])
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def finish_request(self, request, client_address):
+        # Runs in the connection's thread: simulate the handshake round trips, then do the TLS handshake here so
+        # slow handshakes don't block the accept loop
+        with self.lock:
+            self.connections += 1
+        time.sleep(2 * self.rtt)
+        if self.tls:
+            try:
+                request = self.context.wrap_socket(request, server_side=True)
+            except (ssl.SSLError, OSError):
+                return
+        super().finish_request(request, client_address)
+
+    def delay(self):
+        """
+        Simulate the round trip of one request
+
+        :return:
+            None
+        """
+        time.sleep(self.rtt)
+
+    def stop(self):
+        """
+        Stop the server and remove its certificate
+
+        :return:
+            None
+        """
+        self.shutdown()
+        self.server_close()
+        self.tmp.cleanup()
+
+
+class stubHandler(http.server.BaseHTTPRequestHandler):
+
+    # HTTP/1.1 so clients can keep connections alive.  Without TCP_NODELAY, headers and body sent as separate
+    # segments wait for the client's delayed ACK (40 ms) on every response.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def sendJson(self, document, status=200):
+        """
+        Send a JSON response
+
+        :param document:
+            Object to send as JSON
+        :param status:
+            HTTP status code
+        :return:
+            None
+        """
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def readBody(self):
+        """
+        Read the body of the request
+
+        :return:
+            Body bytes
+        """
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def log_message(self, format, *args):
+        pass
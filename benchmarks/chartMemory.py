@@ -0,0 +1,108 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Memory benchmark for health chart rendering.  Renders many charts (10,000 by default) with healthChart.renderPng
+and reports the RSS of the process as it goes; with the reusable figure it levels off after the first charts.
+
+'--mode pyplot' renders the way drawHealthChart used to (a new pyplot figure per chart, never closed) for
+comparison - expect RSS to grow with every chart, so use a lower '--charts'.
+
+    python benchmarks/chartMemory.py [--charts 10000] [--mode template|pyplot]
+
+"""
+import io
+import time
+import random
+import argparse
+
+import benchUtil
+from CiscoDNA import healthChart
+
+
+def makeHealthData(count):
+    """
+    Build health data with a varying number of categories and scores
+
+    :param count:
+        Chart number, used to vary the data
+    :return:
+        Health data dictionary (see dnaCenter.drawHealthChart)
+    """
+    categories = ["Access", "Distribution", "Core", "Router", "WLC", "AP"][:count % 6 + 1]
+    health = dict()
+    for category in categories:
+        total = random.randint(1, 500)
+        healthy = random.randint(0, total)
+        health[category] = {'total': total, 'healthy': healthy, 'score': healthy * 100 // total}
+
+    return {'overallScore': random.randint(0, 100), 'health': health}
+
+
+def renderPyplot(data, title):
+    """
+    Render a chart the way drawHealthChart did before the reusable figure: pyplot state reset and a new figure
+    per chart, never closed
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.rcdefaults()
+    fig, ax = plt.subplots(figsize=(10, 6))
+    labels = list(data['health'].keys())
+    ind = list(range(len(labels)))
+    ax.set_xticks(ind)
+    ax.set_xticklabels(labels)
+    ax.set_title(title)
+    ax.bar(ind, 100, .5, bottom=1, color=[healthChart.assignHealthColor(data['health'][label]['score'])
+                                          for label in labels], edgecolor='black')
+    chart = io.BytesIO()
+    fig.savefig(chart, format='png')
+    return chart.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render health charts and report the RSS of the process")
+    parser.add_argument("--charts", type=int, default=10000, help="Number of charts to render")
+    parser.add_argument("--mode", choices=["template", "pyplot"], default="template",
+                        help="template: healthChart.renderPng (current), pyplot: a new figure per chart (old)")
+    parser.add_argument("--every", type=int, default=1000, help="Report the RSS every N charts")
+    args = parser.parse_args()
+
+    render = healthChart.renderPng if args.mode == "template" else renderPyplot
+    random.seed(1)
+
+    # The first chart imports matplotlib and loads the fonts - measure from there
+    render(makeHealthData(0), "Warm-up")
+    baseline = benchUtil.getRss()
+    started = time.perf_counter()
+    rows = list()
+
+    for count in range(1, args.charts + 1):
+        render(makeHealthData(count), "Network Device Health as of chart {}".format(count))
+        if count % args.every == 0 or count == args.charts:
+            rss = benchUtil.getRss()
+            rows.append([count, "{:.1f}".format(rss), "{:+.1f}".format(rss - baseline),
+                         "{:.1f}".format(count / (time.perf_counter() - started))])
+
+    print("Mode: {0}, RSS after warm-up: {1:.1f} MiB".format(args.mode, baseline))
+    benchUtil.printTable(["charts", "RSS MiB", "growth MiB", "charts/s"], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Microbenchmark of chat command dispatch with 10 and 200 registered commands (by default).  For each size, a
+dnaCenter subclass registers generated commands with @command, and messages matching the first and last
+registered commands, and unknown messages, are dispatched:
+- trie: dnaCenter.parseTeamsMessage (registry compiled into a word trie)
+- linear: the same commands matched by trying every phrase in turn, like the if/elif chain it replaced
+
+The command handlers do nothing, so only the dispatch is timed.
+
+    python benchmarks/commandDispatch.py [--commands 10 200] [--calls 20000]
+
+"""
+import logging
+import argparse
+
+import benchUtil
+from CiscoDNA.dnaCenter import dnaCenter, command
+
+
+def makeRegistry(count):
+    """
+    Build a dnaCenter subclass with 'count' generated commands (and none of the real ones)
+
+    :return:
+        Tuple of (subclass, list of the command phrases in registration order)
+    """
+    attrs = dict()
+    phrases = list()
+
+    def makeHandler(name):
+        def handler(self, modifier, refresh):
+            return modifier
+        handler.__name__ = name
+        return handler
+
+    for number in range(count):
+        phrase = "show generated item{0} status".format(number)
+        name = "commandGenerated{}".format(number)
+        phrases.append(phrase)
+        attrs[name] = command((phrase,), "GENERATED", usage=[(phrase, "")], modifiers=("for",),
+                              args=True)(makeHandler(name))
+
+    # Hide the real commands of dnaCenter so exactly 'count' commands are registered
+    for name, attr in vars(dnaCenter).items():
+        if getattr(attr, 'command', None) is not None:
+            attrs[name] = makeHandler(name)
+
+    attrs.update({'commands': None, 'commandTrie': None})
+    registry = type("dnaCenter{}".format(count), (dnaCenter,), attrs)
+    return registry, phrases
+
+
+def dispatchLinear(phrases, message):
+    """
+    Match a message by trying each command phrase in turn
+    """
+    for phrase in phrases:
+        if message == phrase or message.startswith(phrase + " "):
+            return message[len(phrase) + 1:]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time chat command dispatch for different registry sizes")
+    parser.add_argument("--commands", type=int, nargs="+", default=[10, 200], help="Numbers of registered commands")
+    parser.add_argument("--calls", type=int, default=20000, help="Dispatches timed per message")
+    args = parser.parse_args()
+
+    rows = list()
+    for count in args.commands:
+        registry, phrases = makeRegistry(count)
+        dna = registry.__new__(registry)
+        dna.logger = logging.getLogger("commandDispatch")
+        dna.getHelpMessage = lambda: None
+        dna.getCommands()
+
+        messages = (("first", phrases[0] + " for sw1"), ("last", phrases[-1] + " for sw1"),
+                    ("unknown", "show something else entirely"))
+        for label, message in messages:
+            trie = benchUtil.timeCalls(lambda: dna.parseTeamsMessage(message), args.calls)
+            linear = benchUtil.timeCalls(lambda: dispatchLinear(phrases, message), args.calls)
+            rows.append([len(registry.commands), label, "{:.2f}".format(trie * 1e6), "{:.2f}".format(linear * 1e6)])
+
+    benchUtil.printTable(["commands", "message", "trie us", "linear us"], rows)
+
+
+if __name__ == '__main__':
+    main()
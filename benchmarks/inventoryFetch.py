@@ -0,0 +1,143 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Network inventory fetch benchmark against a stub Cisco DNA Center serving synthetic inventories (1k, 10k and 50k
+devices by default).  dnaCenter.getInventoryPages is timed one page at a time (workers=1) and with concurrent
+pages, and the pages are checked to arrive complete and in order.
+
+The stub simulates the network round trip ('--rtt') and the controller's time to build each page
+('--pagetime', per 100 devices).
+
+    python benchmarks/inventoryFetch.py [--devices 1000 10000 50000] [--pagesize 500] [--workers 4]
+
+"""
+import re
+import time
+import logging
+import argparse
+
+import benchUtil
+from CiscoDNA import dnaConfig
+from CiscoDNA.dnaCenter import dnaCenter
+
+pagePattern = re.compile(r'^/dna/intent/api/v1/network-device/(\d+)/(\d+)$')
+
+
+def makeDevice(index):
+    """
+    Build a synthetic network device as returned by the network-device API
+    """
+    return {
+        'id': "device-{:06d}".format(index),
+        'hostname': "switch-{:06d}.example.com".format(index),
+        'family': "Switches and Hubs",
+        'platformId': "C9300-48U",
+        'serialNumber': "FOC{:08d}".format(index),
+        'softwareVersion': "16.9.3",
+        'macAddress': "00:11:22:{:02x}:{:02x}:{:02x}".format(index >> 16 & 255, index >> 8 & 255, index & 255),
+        'managementIpAddress': "10.{0}.{1}.{2}".format(index >> 16 & 255, index >> 8 & 255, index & 255),
+        'role': "ACCESS",
+        'reachabilityStatus': "Reachable",
+        'upTime': "120 days, 2:03:04.00",
+        'lastUpdateTime': 1560000000000 + index,
+        'series': "Cisco Catalyst 9300 Series Switches"
+    }
+
+
+class dnaStub(benchUtil.stubHandler):
+
+    def do_POST(self):
+        self.server.delay()
+        self.readBody()
+        self.sendJson({'Token': "benchmark"})
+
+    def do_GET(self):
+        self.server.delay()
+        match = pagePattern.match(self.path)
+        if self.path == "/dna/intent/api/v1/network-device/count":
+            self.sendJson({'response': self.server.devices, 'version': "1.0"})
+        elif match:
+            start, size = int(match.group(1)), int(match.group(2))
+            devices = [makeDevice(index) for index in range(start, min(start + size, self.server.devices + 1))]
+            time.sleep(self.server.pagetime * len(devices) / 100)
+            self.sendJson({'response': devices, 'version': "1.0"})
+        else:
+            self.sendJson({'response': "Not found"}, status=404)
+
+
+def fetch(dna, pagesize, workers, devices):
+    """
+    Read the whole inventory and check it arrived complete and in order
+
+    :return:
+        Tuple of (seconds, number of pages)
+    """
+    started = time.perf_counter()
+    expected = 1
+    pages = 0
+
+    for page in dna.getInventoryPages(pagesize=pagesize, workers=workers):
+        pages += 1
+        for device in page:
+            if device['id'] != "device-{:06d}".format(expected):
+                raise RuntimeError("Device {0} received out of order (expected {1})".format(device['id'], expected))
+            expected += 1
+
+    if expected != devices + 1:
+        raise RuntimeError("Received {0} of {1} devices".format(expected - 1, devices))
+
+    return time.perf_counter() - started, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and concurrent inventory pagination")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="Inventory sizes to test")
+    parser.add_argument("--pagesize", type=int, default=dnaConfig.dna_inventory_page_size, help="Devices per page")
+    parser.add_argument("--workers", type=int, default=dnaConfig.dna_inventory_workers,
+                        help="Pages fetched concurrently")
+    parser.add_argument("--rtt", type=float, default=0.01, help="Simulated network round trip time in seconds")
+    parser.add_argument("--pagetime", type=float, default=0.01,
+                        help="Simulated controller time in seconds per 100 devices")
+    args = parser.parse_args()
+
+    server = benchUtil.stubServer(dnaStub, rtt=args.rtt)
+    server.pagetime = args.pagetime
+    dnaCenter.baseurl = server.baseurl
+    dnaConfig.sslverify = server.certfile
+    logging.basicConfig(level=logging.WARNING)
+
+    rows = list()
+    try:
+        dna = dnaCenter(tmp=server.tmp.name)
+        for devices in args.devices:
+            server.devices = devices
+            serial, pages = fetch(dna, args.pagesize, 1, devices)
+            concurrent, pages = fetch(dna, args.pagesize, args.workers, devices)
+            rows.append([devices, pages, "{:.2f}".format(serial), "{:.2f}".format(concurrent),
+                         "{:.1f}x".format(serial / concurrent)])
+    finally:
+        server.stop()
+
+    print("Page size {0}, {1} concurrent pages, simulated RTT {2:.0f} ms, {3:.0f} ms per 100 devices".format(
+        args.pagesize, args.workers, args.rtt * 1000, args.pagetime * 1000))
+    benchUtil.printTable(["devices", "pages", "serial s", "concurrent s", "speedup"], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+CPU time per request spent decoding payloads, the way the code used to do it vs now:
+- Cisco DNA Center response (a network-device list of '--devices' devices): previously the body was decoded to text
+  for the debug log even at INFO, then parsed by r.json() and parsed again by json.loads(r.text).  Now it is parsed
+  once from the raw bytes by dnaCenter.loadJson.
+- Webex webhook: previously the body was decoded, parsed, its signature checked on the re-encoded text with '==',
+  then parsed again for the requestor check.  Now webexTeams.decodeWebhook checks the raw bytes and parses once.
+
+Each new path is measured with orjson (if installed) and with the json module.  No network is used; the DNA
+response is a requests.Response built in memory.
+
+    python benchmarks/payloadParsing.py [--devices 1000] [--rounds 20]
+
+"""
+import hmac
+import json
+import hashlib
+import logging
+import argparse
+
+import benchUtil
+import requests
+from CiscoDNA import dnaCenter
+from CiscoWebex import webexTeams
+from inventoryFetch import makeDevice
+
+secret = "benchmark-secret"
+logger = logging.getLogger("payloadParsing")
+logger.setLevel(logging.INFO)
+
+
+def makeResponse(devices):
+    """
+    Build a Cisco DNA Center response to a network-device request
+    """
+    r = requests.models.Response()
+    r.status_code = 200
+    r.headers['Content-Type'] = "application/json;charset=UTF-8"
+    r.encoding = "UTF-8"
+    r._content = json.dumps({'response': [makeDevice(index) for index in range(devices)],
+                             'version': "1.0"}).encode("utf-8")
+    return r
+
+
+def makeWebhook():
+    """
+    Build a signed Webex webhook request (body and headers) as received by apiHandler
+    """
+    body = json.dumps({
+        'id': "Y2lzY29zcGFyazovL3VzL1dFQkhPT0svZjRlNjA1NjAtNjYwMi00ZmIwLWEyNWEtOTQ5ODgxNjA5NDk3",
+        'name': "dnabot webhook",
+        'targetUrl': "https://bot.example.com/",
+        'resource': "messages",
+        'event': "created",
+        'orgId': "Y2lzY29zcGFyazovL3VzL09SR0FOSVpBVElPTi8xZWI2NWZkZi05NjQzLTQxN2YtOTk3NC1hZDcyY2FlMGUxMGY",
+        'createdBy': "Y2lzY29zcGFyazovL3VzL1BFT1BMRS9mNWIzNjE4Ny1jOGRkLTQ3MjctOGIyZi1mOWM0NDdmMjkwNDY",
+        'appId': "Y2lzY29zcGFyazovL3VzL0FQUExJQ0FUSU9OL0MyNzljYjMwYzAyOTE4MGJiNGJkYWViYjA2MWI3OTY1Y2RhMzli"
+                 "NjAyOTdjODUwM2YyNjZhYmY2NmM5OTllYzFm",
+        'ownedBy': "creator",
+        'status': "active",
+        'created': "2019-06-01T10:00:00.000Z",
+        'actorId': "Y2lzY29zcGFyazovL3VzL1BFT1BMRS8xZjdkZTVjYi04NTYxLTQ2NzEtYmMwMy1iYzk3NDMxNDQ0MmQ",
+        'data': {
+            'id': "Y2lzY29zcGFyazovL3VzL01FU1NBR0UvOTJkYjNiZTAtNDNiZC0xMWU2LThhZTktZGQ1YjNkZmM1NjVk",
+            'roomId': "Y2lzY29zcGFyazovL3VzL1JPT00vYmJjZWIxYWQtNDNmMS0zYjU4LTkxNDctZjE0YmIwYzRkMTU0",
+            'roomType': "group",
+            'personId': "Y2lzY29zcGFyazovL3VzL1BFT1BMRS8xZjdkZTVjYi04NTYxLTQ2NzEtYmMwMy1iYzk3NDMxNDQ0MmQ",
+            'personEmail': "user@example.com",
+            'mentionedPeople': ["Y2lzY29zcGFyazovL3VzL1BFT1BMRS8yNDlmNzRkOS1kYjhhLTQzY2EtODk2Yi04NzllZDI0MGFjNTM"],
+            'created': "2019-06-01T10:00:00.000Z"
+        }
+    }).encode("utf-8")
+    signature = hmac.new(secret.encode("utf-8"), body, hashlib.sha1).hexdigest()
+    return body, {'X-Spark-Signature': signature}
+
+
+def dnaBefore(r):
+    """
+    fetchUrl before: eager r.text for the debug log, r.json(), then json.loads(r.text)
+    """
+    logger.debug("fetchUrl: HTTP GET sent:\n\tURL: %s\n\tResponse: %s", "url", r.text)
+    retval = r.json()
+    retval = json.loads(r.text)
+    return retval
+
+
+def dnaAfter(r):
+    """
+    fetchUrl now: r.text only when debug logging is enabled, one parse of the raw bytes
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("fetchUrl: HTTP GET sent:\n\tURL: %s\n\tResponse: %s", "url", r.text)
+    return dnaCenter.loadJson(r.content)
+
+
+def webhookBefore(body, headers):
+    """
+    apiHandler and validateMessage before: decode, parse, '==' HMAC on the re-encoded text, parse again
+    """
+    raw = body.decode("utf-8")
+    postdata = json.loads(raw)
+    hashedsig = hmac.new(bytes(secret.encode("utf-8")), bytes(raw.encode("utf-8")), hashlib.sha1)
+    if hashedsig.hexdigest() == headers.get('X-Spark-Signature'):
+        postdata = json.loads(raw)
+    return postdata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare payload decoding before and after the single parse")
+    parser.add_argument("--devices", type=int, default=1000, help="Devices in the Cisco DNA Center response")
+    parser.add_argument("--rounds", type=int, default=20, help="Calls per measurement for the DNA response")
+    args = parser.parse_args()
+
+    r = makeResponse(args.devices)
+    body, headers = makeWebhook()
+
+    # A bot instance with only what decodeWebhook needs, so no API call is made
+    teams = webexTeams.webexTeams.__new__(webexTeams.webexTeams)
+    teams.botConfig = {'bot_secret': secret}
+    teams.logger = logger
+
+    assert dnaBefore(r) == dnaAfter(r)
+    assert webhookBefore(body, headers) == teams.decodeWebhook(body, headers)
+
+    webhookRounds = args.rounds * 500
+    rows = list()
+    backends = [("orjson", dnaCenter.orjson)] if dnaCenter.orjson is not None else []
+    backends.append(("json", None))
+    baseline = {
+        'dna': benchUtil.timeCalls(lambda: dnaBefore(r), args.rounds),
+        'webhook': benchUtil.timeCalls(lambda: webhookBefore(body, headers), webhookRounds)
+    }
+    rows.append(["before", "json", "{:.2f}".format(1000 * baseline['dna']),
+                 "{:.1f}".format(1e6 * baseline['webhook']), "1.0x", "1.0x"])
+
+    saved = (dnaCenter.orjson, webexTeams.orjson)
+    for name, backend in backends:
+        dnaCenter.orjson = webexTeams.orjson = backend
+        dna = benchUtil.timeCalls(lambda: dnaAfter(r), args.rounds)
+        webhook = benchUtil.timeCalls(lambda: teams.decodeWebhook(body, headers), webhookRounds)
+        rows.append(["now", name, "{:.2f}".format(1000 * dna), "{:.1f}".format(1e6 * webhook),
+                     "{:.1f}x".format(baseline['dna'] / dna), "{:.1f}x".format(baseline['webhook'] / webhook)])
+    dnaCenter.orjson, webexTeams.orjson = saved
+
+    print("DNA response: {0} devices, {1:.0f} KiB; webhook: {2} bytes".format(args.devices, len(r.content) / 1024,
+                                                                               len(body)))
+    benchUtil.printTable(["code", "parser", "DNA ms", "webhook us", "DNA speedup", "webhook speedup"], rows)
+
+
+if __name__ == '__main__':
+    main()
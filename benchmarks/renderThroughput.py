@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Chart rendering throughput (charts per second) with a burst of concurrent health requests:
+- in-process: each request thread renders with healthChart.renderPng, serialized by the GIL
+- pooled: each request thread sends the chart to a healthChart.renderPool of '--processes' processes
+
+Also reports how long a trivial task on another thread is delayed while the burst is rendering, i.e. how much the
+rendering stalls the rest of the worker (webhook handling).
+
+    python benchmarks/renderThroughput.py [--charts 200] [--threads 8] [--processes 2 4]
+
+"""
+import os
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import benchUtil
+from chartMemory import makeHealthData
+from CiscoDNA import healthChart
+
+
+def probeLatency(stop, delays):
+    """
+    Measure how late a thread wakes up from a 10 ms sleep until 'stop' is set
+    """
+    while not stop.is_set():
+        started = time.perf_counter()
+        time.sleep(0.01)
+        delays.append(time.perf_counter() - started - 0.01)
+
+
+def burst(render, charts, threads):
+    """
+    Render 'charts' charts from 'threads' request threads
+
+    :return:
+        Tuple of (charts per second, mean and max delay in ms of the probe thread)
+    """
+    random.seed(1)
+    data = [makeHealthData(count) for count in range(charts)]
+    stop = threading.Event()
+    delays = list()
+    probe = threading.Thread(target=probeLatency, args=(stop, delays))
+    probe.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda health: render(health, "Network Device Health"), data))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    probe.join()
+    return charts / elapsed, 1000 * sum(delays) / len(delays), 1000 * max(delays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process and pooled chart rendering throughput")
+    parser.add_argument("--charts", type=int, default=200, help="Charts rendered per burst")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent request threads")
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4], help="Render pool sizes to test")
+    args = parser.parse_args()
+
+    rows = list()
+
+    # Warm up the in-process renderer (imports and fonts) before timing
+    healthChart.preload()
+    rate, delay, maxdelay = burst(healthChart.renderPng, args.charts, args.threads)
+    rows.append(["in-process", "{:.1f}".format(rate), "{:.1f}".format(delay), "{:.1f}".format(maxdelay)])
+
+    for processes in args.processes:
+        pool = healthChart.renderPool(processes=processes, queuesize=args.threads, timeout=60)
+        # Start the processes (spawned, with matplotlib preloaded) before timing
+        with ThreadPoolExecutor(max_workers=processes) as warmup:
+            list(warmup.map(lambda number: pool.render(makeHealthData(number), "Warm-up"), range(processes * 2)))
+        rate, delay, maxdelay = burst(pool.render, args.charts, args.threads)
+        rows.append(["pooled ({} processes)".format(processes), "{:.1f}".format(rate), "{:.1f}".format(delay),
+                     "{:.1f}".format(maxdelay)])
+        pool.getExecutor().shutdown()
+
+    print("{0} charts from {1} threads, {2} CPUs".format(args.charts, args.threads, os.cpu_count()))
+    benchUtil.printTable(["renderer", "charts/s", "probe delay ms", "max delay ms"], rows)
+
+
+if __name__ == '__main__':
+    main()
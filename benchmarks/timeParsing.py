@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Compare timeParser.parseTime with plain dateparser.parse on time modifiers as users type them in
+'show network health at <time>'.  Reports the time per phrase for:
+- dateparser.parse with no language restriction (what the command used before)
+- timeParser.parseTime on the first call of each phrase (fast paths, then dateparser restricted to the configured
+  languages)
+- timeParser.parseTime once memoized (the same phrase within the same minute)
+
+It also lists the phrases whose result differs between the two, so a change of meaning is visible.
+
+    python benchmarks/timeParsing.py [--rounds 20]
+
+"""
+import argparse
+
+import benchUtil
+from CiscoDNA import timeParser
+
+# Phrasings collected from the bot's chat rooms
+corpus = [
+    "06:21", "6:21", "18:00", "18:00:30", "9am", "9 am", "9:30pm", "12pm", "12am",
+    "today", "yesterday", "today at 9am", "yesterday at 18:00", "yesterday 6pm", "9am yesterday", "noon today",
+    "5 minutes ago", "10 mins ago", "1 hour ago", "2 hours ago", "3 hrs ago", "1 day ago", "2 weeks ago",
+    "2019-06-01", "2019-06-01 18:00", "2019-06-01T18:00:00",
+    "jan 1 at 18:00", "1 january 2019 18:00", "june 3rd 2pm", "last monday", "monday at 10am",
+    "3 days ago at noon", "yesterday afternoon", "06/01/2019 18:00", "1/6/2019", "this morning",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare timeParser.parseTime with dateparser.parse")
+    parser.add_argument("--rounds", type=int, default=20, help="Number of times each phrase is parsed")
+    args = parser.parse_args()
+
+    import dateparser
+    # Load dateparser's language data before timing anything
+    dateparser.parse("1 january 2019 18:00")
+
+    rows = list()
+    totals = [0.0, 0.0, 0.0]
+    differences = list()
+
+    for phrase in corpus:
+        plain = benchUtil.timeCalls(lambda: dateparser.parse(phrase), args.rounds)
+
+        def firstCall():
+            timeParser.parseCached.cache_clear()
+            timeParser.parseTime(phrase)
+        first = benchUtil.timeCalls(firstCall, args.rounds)
+
+        timeParser.parseTime(phrase)
+        memoized = benchUtil.timeCalls(lambda: timeParser.parseTime(phrase), args.rounds)
+
+        for index, value in enumerate((plain, first, memoized)):
+            totals[index] += value
+        rows.append([phrase, "{:.1f}".format(plain * 1e6), "{:.1f}".format(first * 1e6),
+                     "{:.2f}".format(memoized * 1e6), "{:.0f}x".format(plain / first)])
+
+        # Compare to the minute: relative phrases are computed from slightly different 'now' values
+        expected = dateparser.parse(phrase)
+        result = timeParser.parseTime(phrase)
+        if (expected is None) != (result is None) or \
+                (expected is not None and abs((expected - result).total_seconds()) >= 60):
+            differences.append([phrase, expected, result])
+
+    rows.append(["TOTAL", "{:.1f}".format(totals[0] * 1e6), "{:.1f}".format(totals[1] * 1e6),
+                 "{:.2f}".format(totals[2] * 1e6), "{:.0f}x".format(totals[0] / totals[1])])
+    benchUtil.printTable(["phrase", "dateparser us", "parseTime us", "memoized us", "speedup"], rows)
+
+    if differences:
+        print("\nPhrases parsed differently:")
+        benchUtil.printTable(["phrase", "dateparser", "parseTime"], differences)
+
+
+if __name__ == '__main__':
+    main()
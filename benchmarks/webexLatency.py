@@ -0,0 +1,127 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Latency of the Webex Teams API calls made per webhook, against a local stub HTTPS server.  A webhook makes four
+calls: get the person, get the message, post the "working on it" message and post the reply.  Compared:
+- fresh: module-level requests.get / requests.post, a new TCP connection and TLS handshake per call (before the
+  connection pool)
+- pooled: webexTeams.urlget / urlpost, which reuse the keep-alive connections of the worker's session
+
+'--rtt' simulates the network round trip time to the API (the stub adds two round trips per new connection and
+one per request).
+
+    python benchmarks/webexLatency.py [--webhooks 50] [--rtt 0.02]
+
+"""
+import time
+import logging
+import argparse
+import statistics
+
+import benchUtil
+import requests
+from CiscoWebex import webexConfig
+from CiscoWebex.webexTeams import webexTeams
+
+
+class webexStub(benchUtil.stubHandler):
+
+    def do_GET(self):
+        self.server.delay()
+        if self.path.startswith("/v1/people"):
+            self.sendJson({'id': "person", 'orgId': "org", 'emails': ["user@example.com"]})
+        else:
+            self.sendJson({'id': "message", 'text': "dnabot show network health"})
+
+    def do_POST(self):
+        self.server.delay()
+        self.readBody()
+        self.sendJson({'id': "reply"})
+
+
+def webhookFresh(baseurl, verify):
+    """
+    The four API calls of a webhook, each on a new connection
+    """
+    headers = {"Content-Type": "application/json", "Authorization": "Bearer benchmark"}
+    requests.get(baseurl + "/v1/people/person", headers=headers, verify=verify).json()
+    requests.get(baseurl + "/v1/messages/message", headers=headers, verify=verify).json()
+    for text in ("Let me work on that...", "Here is the reply"):
+        requests.post(baseurl + "/v1/messages", json={'roomId': "room", 'text': text}, headers=headers,
+                      verify=verify)
+
+
+def webhookPooled(teams, baseurl):
+    """
+    The four API calls of a webhook, through the webexTeams connection pool
+    """
+    teams.urlget(baseurl + "/v1/people/person")
+    teams.urlget(baseurl + "/v1/messages/message")
+    for text in ("Let me work on that...", "Here is the reply"):
+        teams.urlpost(baseurl + "/v1/messages", {'roomId': "room", 'text': text})
+
+
+def measure(server, webhook, count):
+    """
+    Run webhooks one after the other
+
+    :return:
+        Tuple of (list of seconds per webhook, number of connections opened)
+    """
+    connections = server.connections
+    durations = list()
+    for _ in range(count):
+        started = time.perf_counter()
+        webhook()
+        durations.append(time.perf_counter() - started)
+
+    return durations, server.connections - connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Webex Teams API latency with and without connection reuse")
+    parser.add_argument("--webhooks", type=int, default=50, help="Number of webhooks simulated per mode")
+    parser.add_argument("--rtt", type=float, default=0.0, help="Simulated network round trip time in seconds")
+    args = parser.parse_args()
+
+    server = benchUtil.stubServer(webexStub, rtt=args.rtt)
+    webexConfig.sslverify = server.certfile
+
+    teams = webexTeams.__new__(webexTeams)
+    teams.logger = logging.getLogger("webexLatency")
+
+    rows = list()
+    results = dict()
+    try:
+        for mode, webhook in (("fresh", lambda: webhookFresh(server.baseurl, server.certfile)),
+                              ("pooled", lambda: webhookPooled(teams, server.baseurl))):
+            durations, connections = measure(server, webhook, args.webhooks)
+            results[mode] = statistics.mean(durations)
+            rows.append([mode, "{:.2f}".format(results[mode] * 1000),
+                         "{:.2f}".format(statistics.median(durations) * 1000),
+                         "{:.2f}".format(max(durations) * 1000), connections])
+    finally:
+        server.stop()
+
+    print("{0} webhooks of 4 API calls each, simulated RTT {1:.0f} ms".format(args.webhooks, args.rtt * 1000))
+    benchUtil.printTable(["mode", "mean ms", "median ms", "max ms", "connections"], rows)
+    print("Saved per webhook: {:.2f} ms".format((results['fresh'] - results['pooled']) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Worker start-up benchmark for the two module loading modes (apiConfig.preload_modules):
+- lazy: the master imports the app modules only; each worker imports matplotlib, dateparser and python-magic on
+  first use
+- preload: the master also imports and warms up the heavy dependencies before forking, like uWSGI without
+  'lazy-apps'
+
+For each mode a fresh interpreter plays the uWSGI master: it imports CiscoDNA.dnaCenter and CiscoWebex.webexTeams
+(plus the preload), then forks the workers.  Each worker serves a "first request" which draws a health chart,
+parses a time modifier and identifies a MIME type.  Reported per worker:
+- time to serve the first request
+- RSS, and PSS (RSS with shared pages divided among the processes sharing them) where /proc is available - the
+  memory actually added per worker
+
+    python benchmarks/workerStartup.py [--workers 4]
+
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+import benchUtil
+
+
+def getPss():
+    """
+    Get the proportional set size of this process
+
+    :return:
+        PSS in MiB, or None if it is not available on this platform
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def firstRequest():
+    """
+    Use each heavy dependency once, as the first webhooks handled by a worker would
+    """
+    from CiscoDNA import healthChart, timeParser
+    from CiscoWebex.webexTeams import webexTeams
+
+    healthChart.renderPng({'overallScore': 90, 'health': {'Access': {'total': 10, 'healthy': 9, 'score': 90}}},
+                          "First request")
+    timeParser.parseTime("jan 1 at 18:00")
+    teams = webexTeams.__new__(webexTeams)
+    teams.logger = logging.getLogger("workerStartup")
+    teams.getMimeType(__file__, content=b"%PDF-1.4 first request", filename="attachment")
+
+
+def master(mode, workers):
+    """
+    Run as the uWSGI master for one mode and print the results as JSON
+    """
+    started = time.perf_counter()
+    import CiscoDNA.dnaCenter
+    import CiscoWebex.webexTeams
+    if mode == "preload":
+        CiscoDNA.dnaCenter.dnaCenter.preload()
+        CiscoWebex.webexTeams.webexTeams.preload()
+    result = {'mode': mode, 'import': time.perf_counter() - started, 'masterrss': benchUtil.getRss(), 'workers': []}
+
+    pipes = list()
+    for _ in range(workers):
+        read, write = os.pipe()
+        if os.fork() == 0:
+            os.close(read)
+            started = time.perf_counter()
+            firstRequest()
+            worker = {'first': time.perf_counter() - started, 'rss': benchUtil.getRss(), 'pss': getPss()}
+            # Stay alive until every worker has measured, so shared pages are counted for all of them
+            os.write(write, json.dumps(worker).encode())
+            os.close(write)
+            time.sleep(2)
+            os._exit(0)
+        os.close(write)
+        pipes.append(read)
+
+    for read in pipes:
+        with os.fdopen(read) as pipe:
+            result['workers'].append(json.loads(pipe.read()))
+    for _ in pipes:
+        os.wait()
+
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare worker start-up in lazy and preload mode")
+    parser.add_argument("--workers", type=int, default=4, help="Number of workers forked by the master")
+    parser.add_argument("--master", choices=["lazy", "preload"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.master:
+        master(args.master, args.workers)
+        return
+
+    rows = list()
+    for mode in ("lazy", "preload"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--master", mode,
+                                 "--workers", str(args.workers)], check=True, stdout=subprocess.PIPE).stdout
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        for number, worker in enumerate(result['workers']):
+            rows.append([mode, "{:.2f}".format(result['import']), "{:.1f}".format(result['masterrss']), number,
+                         "{:.3f}".format(worker['first']), "{:.1f}".format(worker['rss']),
+                         "{:.1f}".format(worker['pss']) if worker['pss'] is not None else "n/a"])
+
+    benchUtil.printTable(["mode", "master import s", "master RSS MiB", "worker", "first request s",
+                          "RSS MiB", "PSS MiB"], rows)
+
+
+if __name__ == '__main__':
+    main()
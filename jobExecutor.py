@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+This file contains a small background job executor.  The apiHandler uses it to acknowledge webhooks immediately and
+perform the slow part of the work (API calls, chart rendering, file uploads) off the request thread.
+
+"""
+import time
+import queue
+import logging
+import threading
+import processLocal
+
+
+class jobExecutor:
+
+    def __init__(self, workers=4, queuesize=100, logname=__name__):
+        """
+        Class initialization.  No threads are started here - they are started on the first submitted job so that
+        an executor created in the uWSGI master process still works in each forked worker.
+
+        :param workers:
+            Number of worker threads processing jobs
+        :param queuesize:
+            Maximum number of jobs waiting to be processed.  Once reached, new jobs are refused.
+        :param logname:
+            Name of the calling logger.  If not given, use the package name
+        """
+        # If the logger name was passed, append this module's name to it.  Otherwise, create a new logger with
+        # only the module name
+        if logname != __name__:
+            logname = "{0}.{1}".format(logname, __name__)
+        self.logger = logging.getLogger(logname)
+
+        self.workers = workers
+        self.queuesize = queuesize
+        self.jobs = queue.Queue(maxsize=queuesize)
+        self.threads = processLocal.processLocal(self.startThreads)
+        self.lock = threading.Lock()
+
+        # Counters used to size the executor.  Latencies are in seconds; 'wait' is the time a job spent in the
+        # queue and 'run' is the time spent executing it.
+        self.counters = {
+            'submitted': 0,
+            'rejected': 0,
+            'completed': 0,
+            'failed': 0,
+            'waittotal': 0.0,
+            'waitmax': 0.0,
+            'runtotal': 0.0,
+            'runmax': 0.0
+        }
+
+    def start(self):
+        """
+        Start the worker threads if they are not running in this process (see processLocal)
+
+        :return:
+            None
+        """
+        self.threads.get()
+
+    def startThreads(self):
+        """
+        Start the worker threads with an empty queue.  Called once per process by 'start'.
+
+        :return:
+            List of the worker threads
+        """
+        self.jobs = queue.Queue(maxsize=self.queuesize)
+        threads = list()
+        for num in range(self.workers):
+            t = threading.Thread(target=self.worker, name="jobExecutor-{}".format(num), daemon=True)
+            t.start()
+            threads.append(t)
+        self.logger.debug("jobExecutor: Started %s worker threads", self.workers)
+        return threads
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a job for background execution.  Never blocks - if the queue is full, the job is refused.
+
+        :param func:
+            Function to execute
+        :param args:
+            Positional arguments passed to func
+        :param kwargs:
+            Keyword arguments passed to func
+        :return:
+            True if the job was queued, False otherwise
+        """
+        retval = False
+        self.start()
+
+        try:
+            self.jobs.put_nowait((time.monotonic(), func, args, kwargs))
+            retval = True
+        except queue.Full:
+            self.logger.warning("jobExecutor: Queue is full (%s jobs), refusing job %s", self.queuesize,
+                                getattr(func, '__name__', func))
+
+        with self.lock:
+            if retval:
+                self.counters['submitted'] += 1
+            else:
+                self.counters['rejected'] += 1
+
+        return retval
+
+    def worker(self):
+        """
+        Worker thread loop.  Takes jobs off the queue, runs them, and records latency counters.  Exceptions
+        raised by a job are logged and never stop the worker.
+
+        :return:
+            None
+        """
+        while True:
+            queued, func, args, kwargs = self.jobs.get()
+            started = time.monotonic()
+            failed = False
+
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                failed = True
+                self.logger.error("jobExecutor: Job %s raised an exception: %s", getattr(func, '__name__', func), e,
+                                  exc_info=True)
+
+            finished = time.monotonic()
+            waited = started - queued
+            ran = finished - started
+
+            with self.lock:
+                self.counters['failed' if failed else 'completed'] += 1
+                self.counters['waittotal'] += waited
+                self.counters['waitmax'] = max(self.counters['waitmax'], waited)
+                self.counters['runtotal'] += ran
+                self.counters['runmax'] = max(self.counters['runmax'], ran)
+
+            self.jobs.task_done()
+
+    def getStats(self):
+        """
+        Report the executor counters for this process
+
+        :return:
+            Dictionary containing queue depth, job counts and job latency (seconds)
+        """
+        with self.lock:
+            stats = dict(self.counters)
+
+        finished = stats['completed'] + stats['failed']
+        stats['workers'] = self.workers
+        stats['queuesize'] = self.queuesize
+        stats['queuedepth'] = self.jobs.qsize()
+        stats['waitavg'] = stats['waittotal'] / finished if finished else 0.0
+        stats['runavg'] = stats['runtotal'] / finished if finished else 0.0
+
+        return stats
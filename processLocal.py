@@ -0,0 +1,88 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+This file contains the holder used for everything which must be created once per process: background threads,
+connection pools, process pools and library handles.  uWSGI imports the app in the master process and forks the
+workers from it; threads do not survive a fork and sockets or handles would be shared by every worker.  So these
+objects are not created when the app is loaded, but on first use in each process, and again if the PID changed.
+
+"""
+import os
+import threading
+
+
+class processLocal:
+
+    def __init__(self, factory):
+        """
+        Class initialization.  Nothing is created here.
+
+        :param factory:
+            Function creating the object.  It is called by 'get' (with the arguments passed to 'get') once per
+            process, while holding the lock of this holder.
+        """
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.value = None
+        self.pid = None
+
+    def get(self, *args, **kwargs):
+        """
+        Get the object of this process, creating it if it was not created yet in this process
+
+        :param args:
+            Positional arguments passed to the factory if the object is created
+        :param kwargs:
+            Keyword arguments passed to the factory if the object is created
+        :return:
+            The object returned by the factory
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                self.value = self.factory(*args, **kwargs)
+                self.pid = os.getpid()
+
+            return self.value
+
+    def peek(self):
+        """
+        Get the object of this process without creating it
+
+        :return:
+            The object, or None if it was not created yet in this process
+        """
+        with self.lock:
+            return self.value if self.pid == os.getpid() else None
+
+    def discard(self, value):
+        """
+        Forget the object of this process (e.g. a failed pool or a stopped thread), so the next 'get' creates a new
+        one.  The object itself is not stopped or closed.
+
+        :param value:
+            The object to forget.  If another thread already replaced it, nothing is done.
+        :return:
+            True if the object was forgotten, False otherwise
+        """
+        with self.lock:
+            if self.pid != os.getpid() or self.value is not value:
+                return False
+
+            self.value = None
+            self.pid = None
+            return True
@@ -0,0 +1,90 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Chat command dispatch (dnaCenter.parseTeamsMessage).  The command handlers are replaced so no controller is needed.
+
+"""
+import logging
+import datetime
+import unittest
+
+from CiscoDNA.dnaCenter import dnaCenter
+
+
+class dispatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dna = dnaCenter.__new__(dnaCenter)
+        self.dna.logger = logging.getLogger(__name__)
+        self.dna.getDevice = lambda field, value, refresh=False: ('getDevice', field, value, refresh)
+        self.dna.getNetworkHealthImage = lambda timestamp=None, refresh=False: ('getNetworkHealthImage', timestamp,
+                                                                                refresh)
+        self.dna.getHelpMessage = lambda: 'help'
+
+    def test_command_with_argument(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show device hostname sw1"),
+                         ('getDevice', 'hostname', 'sw1', False))
+
+    def test_ip_lookup_with_and_without_address_keyword(self):
+        for message in ("show device ip 10.0.0.1", "show device ip address 10.0.0.1", "show device address 10.0.0.1"):
+            self.assertEqual(self.dna.parseTeamsMessage(message),
+                             ('getDevice', 'managementIpAddress', '10.0.0.1', False))
+
+    def test_mac_lookup_with_address_keyword(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show device mac address aabb.ccdd.eeff"),
+                         ('getDevice', 'macAddress', 'aa:bb:cc:dd:ee:ff', False))
+
+    def test_trailing_refresh_is_the_keyword(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show device hostname sw1 refresh"),
+                         ('getDevice', 'hostname', 'sw1', True))
+
+    def test_refresh_inside_an_argument_is_kept(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show device hostname refresh-sw1"),
+                         ('getDevice', 'hostname', 'refresh-sw1', False))
+
+    def test_refresh_not_at_the_end_is_an_argument(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show device hostname refresh sw1"),
+                         ('getDevice', 'hostname', 'refresh sw1', False))
+
+    def test_current_network_health(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show network health"), ('getNetworkHealthImage', None, False))
+        self.assertEqual(self.dna.parseTeamsMessage("show network health refresh"),
+                         ('getNetworkHealthImage', None, True))
+
+    def test_network_health_at_time_passes_the_timestamp(self):
+        name, timestamp, refresh = self.dna.parseTeamsMessage("show network health at 06:21")
+        self.assertEqual(name, 'getNetworkHealthImage')
+        self.assertFalse(refresh)
+        # Epoch milliseconds of 06:21 local time
+        self.assertEqual(timestamp % 1000, 0)
+        healthtime = datetime.datetime.fromtimestamp(timestamp / 1000)
+        self.assertEqual((healthtime.hour, healthtime.minute, healthtime.second), (6, 21, 0))
+
+    def test_network_health_at_time_with_refresh(self):
+        name, timestamp, refresh = self.dna.parseTeamsMessage("show network health at 06:21 refresh")
+        self.assertEqual(name, 'getNetworkHealthImage')
+        self.assertEqual(datetime.datetime.fromtimestamp(timestamp / 1000).strftime("%H:%M"), "06:21")
+        self.assertTrue(refresh)
+
+    def test_unknown_command_gets_help(self):
+        self.assertEqual(self.dna.parseTeamsMessage("show me something"), 'help')
+        self.assertEqual(self.dna.parseTeamsMessage("refresh"), 'help')
+
+
+if __name__ == '__main__':
+    unittest.main()
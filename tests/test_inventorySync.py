@@ -0,0 +1,67 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Background synchronization of the inventory store (dnaCenter.startInventorySync).  The synchronization is replaced
+by a stub which blocks until released, so no controller is needed.
+
+"""
+import logging
+import threading
+import unittest
+from unittest import mock
+
+from CiscoDNA.dnaCenter import dnaCenter
+
+
+class inventorySyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = list()
+        self.release = threading.Event()
+
+        def syncInventoryStore(dna):
+            self.calls.append(threading.current_thread().name)
+            self.release.wait(10)
+
+        patch = mock.patch.object(dnaCenter, 'syncInventoryStore', syncInventoryStore)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(self.release.set)
+
+        self.dna = dnaCenter.__new__(dnaCenter)
+        self.dna.logger = logging.getLogger(__name__)
+
+    def test_one_background_sync_per_process(self):
+        started = [self.dna.startInventorySync() for _ in range(50)]
+        self.assertEqual(started.count(True), 1)
+
+        self.release.set()
+        dnaCenter.syncThread.join(5)
+        self.assertEqual(self.calls, ["inventorySync"])
+
+    def test_new_sync_once_the_previous_one_finished(self):
+        self.release.set()
+        self.assertTrue(self.dna.startInventorySync())
+        dnaCenter.syncThread.join(5)
+        self.assertTrue(self.dna.startInventorySync())
+        dnaCenter.syncThread.join(5)
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
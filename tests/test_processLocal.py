@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Per-process lazy creation (processLocal): one object per process, created on first use, again after a fork.
+
+"""
+import os
+import threading
+import unittest
+
+import processLocal
+
+
+class processLocalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.created = list()
+
+        def factory(name="object"):
+            self.created.append(os.getpid())
+            return [name, os.getpid()]
+
+        self.holder = processLocal.processLocal(factory)
+
+    def test_created_once_on_first_use(self):
+        self.assertIsNone(self.holder.peek())
+        self.assertEqual(self.created, [])
+
+        threads = [threading.Thread(target=self.holder.get) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self.created, [os.getpid()])
+        self.assertIs(self.holder.get(), self.holder.peek())
+
+    def test_arguments_are_passed_to_the_factory(self):
+        self.assertEqual(self.holder.get("session")[0], "session")
+        # Once created, later arguments are ignored
+        self.assertEqual(self.holder.get("other")[0], "session")
+
+    def test_discard_only_forgets_the_current_object(self):
+        first = self.holder.get()
+        self.assertFalse(self.holder.discard(["object", os.getpid()]))
+        self.assertIs(self.holder.get(), first)
+
+        self.assertTrue(self.holder.discard(first))
+        self.assertIsNone(self.holder.peek())
+        self.assertIsNot(self.holder.get(), first)
+        self.assertEqual(len(self.created), 2)
+
+    def test_created_again_after_fork(self):
+        parent = self.holder.get()
+        read, write = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            # Child: the parent's object must not be returned
+            status = 1
+            try:
+                value = self.holder.get()
+                status = 0 if value is not parent and value[1] == os.getpid() and self.holder.peek() is value else 1
+            finally:
+                os.write(write, bytes([status]))
+                os._exit(0)
+
+        os.close(write)
+        status = os.read(read, 1)
+        os.close(read)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(status, bytes([0]))
+        self.assertIs(self.holder.get(), parent)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Coalescing of identical concurrent GET requests to Cisco DNA Center (dnaCenter.urlget).  'fetchUrl' is replaced by
+a stub which blocks until every caller is waiting, so no network access is needed.
+
+"""
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from CiscoDNA.dnaCenter import dnaCenter
+
+
+class singleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = list()
+        self.release = threading.Event()
+
+        def fetchUrl(dna, url, addHeaders={}, reauth=True, timeout=None):
+            self.calls.append(url)
+            if not self.release.wait(10):
+                raise RuntimeError("Test stub was never released")
+            return {'response': url}
+
+        patches = [mock.patch.object(dnaCenter, 'getAuthToken', return_value=True),
+                   mock.patch.object(dnaCenter, 'fetchUrl', fetchUrl)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def getConcurrently(self, urls):
+        """
+        Call urlget for each URL from its own thread, release the stub once all followers are waiting and
+        collect the results in order
+        """
+        self.release.clear()
+        dna = dnaCenter(tmp=self.tmp.name)
+        results = [None] * len(urls)
+        coalesced = dnaCenter.getFlightStats()['coalesced']
+        expected = len(urls) - len(set(urls))
+
+        def get(index):
+            results[index] = dna.urlget(urls[index])
+
+        threads = [threading.Thread(target=get, args=(index,)) for index in range(len(urls))]
+        for thread in threads:
+            thread.start()
+
+        deadline = time.monotonic() + 10
+        while dnaCenter.getFlightStats()['coalesced'] - coalesced < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.release.set()
+
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_identical_requests_make_one_upstream_call(self):
+        results = self.getConcurrently(["/dna/intent/api/v1/network-health"] * 50)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results, [{'response': "/dna/intent/api/v1/network-health"}] * 50)
+        self.assertEqual(dnaCenter.getFlightStats()['inflight'], 0)
+
+    def test_different_requests_are_not_coalesced(self):
+        urls = ["/dna/intent/api/v1/network-health", "/dna/intent/api/v1/image/importation"] * 10
+        results = self.getConcurrently(urls)
+
+        self.assertEqual(sorted(self.calls), sorted(set(urls)))
+        self.assertEqual(results, [{'response': url} for url in urls])
+
+    def test_results_are_not_cached(self):
+        self.getConcurrently(["/dna/intent/api/v1/network-health"] * 5)
+        self.getConcurrently(["/dna/intent/api/v1/network-health"] * 5)
+
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Copyright (c) 2019 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+"""
+Fast paths of the command time parser (timeParser.parseTime).
+
+"""
+import datetime
+import unittest
+
+from CiscoDNA import timeParser
+
+
+class parseTimeTest(unittest.TestCase):
+
+    def setUp(self):
+        timeParser.parseCached.cache_clear()
+        self.today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def test_time_of_day(self):
+        self.assertEqual(timeParser.parseTime("06:21"), self.today.replace(hour=6, minute=21))
+        self.assertEqual(timeParser.parseTime("18:00:30"), self.today.replace(hour=18, second=30))
+        self.assertEqual(timeParser.parseTime("9:30 PM"), self.today.replace(hour=21, minute=30))
+
+    def test_twelve_am_and_pm(self):
+        self.assertEqual(timeParser.parseTime("12am"), self.today)
+        self.assertEqual(timeParser.parseTime("12pm"), self.today.replace(hour=12))
+
+    def test_yesterday(self):
+        self.assertEqual(timeParser.parseTime("yesterday at 9am"),
+                         self.today.replace(hour=9) - datetime.timedelta(days=1))
+
+    def test_iso(self):
+        self.assertEqual(timeParser.parseTime("2019-06-01T18:00:00"), datetime.datetime(2019, 6, 1, 18))
+
+    def test_ago(self):
+        result = timeParser.parseTime("2 hours ago")
+        expected = datetime.datetime.now() - datetime.timedelta(hours=2)
+        self.assertLess(abs((expected - result).total_seconds()), 5)
+
+    def test_invalid_hours_are_rejected(self):
+        for phrase in ("13pm", "0am", "yesterday at 13pm", "25:00", "13:00 pm"):
+            self.assertIsNone(timeParser.parseTime(phrase), phrase)
+
+
+if __name__ == '__main__':
+    unittest.main()